@@ -1,24 +1,40 @@
 import streamlit as st
 import json
-import boto3
-from utils.auth import Auth
-from utils.llm import Llm
 from config_file import Config
 
-from dotenv import load_dotenv
-import logging
-import logging.config
-import re
-from services import bedrock_agent_runtime
+from services import bedrock_agent_runtime, telemetry
+from services.agent_router import get_agent_router
+from services.agent_session import for_conversation, restore_session
+from services.citations import apply_citations
+from services.concurrency import AgentBusyError, agent_limiter
+from services.conversation import Conversation
+from services.history_store import get_history_store
+from services.resilience import CircuitOpenError
+from services.response_cache import get_response_cache
+from services.secrets_cache import secret_cache
+from services.structured_logging import configure_logging
+from services.trace_archive import turn_archiver
+from services.trace_policy import TracePolicy, TRACE_OFF
+from services.usage import usage_ledger
+from ui.chat_export import render_export_controls
+from ui.theme import apply_theme
+from ui.transcript import build_message_html, render_transcript, reset_transcript
+from ui.usage import render_usage_summary
 import uuid
-import yaml
+import logging
 import os
+import time
 
 from datetime import datetime
-from streamlit_cognito_auth import CognitoAuthenticator
+
+logger = logging.getLogger(__name__)
 
 ui_title = os.getenv('BEDROCK_AGENT_TEST_UI_TITLE', 'Welcome to CenITex Modern Cloud Cost Calculator Powered by AI')
 ui_icon = os.getenv('BEDROCK_AGENT_TEST_UI_ICON', '🤖')
+stream_final_response = os.getenv('BEDROCK_AGENT_STREAM_FINAL_RESPONSE', 'true').lower() == 'true'
+show_latency_breakdown = os.getenv('METRICS_SIDEBAR', 'false').lower() == 'true'
+# Traces are never displayed here, so they are only requested when BEDROCK_AGENT_TRACE_MODE asks for them
+trace_policy = TracePolicy.from_env(default_mode=TRACE_OFF)
 agent_id = Config.BEDROCK_AGENT_ID
 agent_alias_id = Config.BEDROCK_AGENT_ALIAS_ID
 
@@ -32,10 +48,12 @@ class Auth:
     @staticmethod
     def get_authenticator(secret_id, region):
         """Get Cognito parameters from Secrets Manager and return CognitoAuthenticator"""
+        # Imported here so the login component is not loaded before the first paint
+        from streamlit_cognito_auth import CognitoAuthenticator
+
         try:
-            secretsmanager_client = boto3.client("secretsmanager", region_name=region)
-            response = secretsmanager_client.get_secret_value(SecretId=secret_id)
-            secret_string = json.loads(response['SecretString'])
+            # Cached process-wide; the authenticator itself renders a cookie component so it is built per run
+            secret_string = secret_cache.get_secret(secret_id, region)
             
             pool_id = secret_string['pool_id']
             app_client_id = secret_string['app_client_id']
@@ -52,164 +70,13 @@ class Auth:
             st.error(f"Failed to initialize authenticator: {str(e)}")
             return None
 
-def load_css():
-    st.markdown("""
-    <style>
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    
-    .stApp {
-        background: linear-gradient(135deg, #e8e3f0 0%, #d4c5e8 100%);
-    }
-    
-    .main-header {
-        background: #452c63;
-        padding: 0.8rem 1.2rem;
-        border-radius: 10px;
-        margin: 0 0 0.5rem 0;
-        text-align: left;
-        color: white;
-        max-width: 600px;
-        box-shadow: 0 4px 15px rgba(69, 44, 99, 0.3);
-    }
-    
-    .main-header h1 {
-        margin: 0;
-        font-size: 1.4rem;
-        font-weight: 600;
-    }
-    
-    .main-header p {
-        margin: 0.3rem 0 0 0;
-        font-size: 0.9rem;
-        opacity: 0.9;
-    }
-    
-    .user-message {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        padding: 0.8rem;
-        border-radius: 10px;
-        margin: 0.2rem 0;
-        box-shadow: 0 2px 8px rgba(102, 126, 234, 0.3);
-        max-width: 80%;
-    }
-    
-    .assistant-message {
-        background: white;
-        color: #2c3e50;
-        padding: 0.8rem;
-        border-radius: 10px;
-        margin: 0.2rem 0;
-        border-left: 4px solid #667eea;
-        box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-        max-width: 80%;
-    }
-    
-    /* Main chat input - keep bold black styling */
-    .stTextInput > div > div > input {
-        background: linear-gradient(135deg, #0a0a0a 0%, #1a1a1a 100%) !important;
-        color: #FFFFFF !important;
-        border: 10px solid #000000 !important;
-        border-radius: 35px !important;
-        padding: 30px 50px !important;
-        font-size: 24px !important;
-        font-weight: 900 !important;
-        box-shadow: 0 20px 50px rgba(0, 0, 0, 0.7) !important;
-        transition: all 0.3s ease !important;
-        min-height: 90px !important;
-    }
-    
-    .main .block-container {
-        padding-left: 1rem !important;
-        margin-left: 0 !important;
-        padding-bottom: 150px !important;
-    }
-    
-    .stTextInput > div > div > input:focus {
-        border-color: #000000 !important;
-        box-shadow: 0 0 40px rgba(0, 0, 0, 0.7) !important;
-        transform: translateY(-4px) !important;
-    }
-    
-    .stTextInput > div > div > input::placeholder {
-        color: #ffffff !important;
-        font-weight: 800 !important;
-    }
-    
-    /* Login form styling - lighter colors */
-    .stForm .stTextInput > div > div > input {
-        background: #f8f9fa !important;
-        color: #2c3e50 !important;
-        border: 2px solid #dee2e6 !important;
-        border-radius: 8px !important;
-        padding: 12px 16px !important;
-        font-size: 16px !important;
-        font-weight: 400 !important;
-        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1) !important;
-        min-height: auto !important;
-        transform: none !important;
-    }
-    
-    .stForm .stTextInput > div > div > input:focus {
-        border-color: #452c63 !important;
-        box-shadow: 0 0 0 3px rgba(69, 44, 99, 0.1) !important;
-        transform: none !important;
-    }
-    
-    .stForm .stTextInput > div > div > input::placeholder {
-        color: #6c757d !important;
-        font-weight: 400 !important;
-    }
-    
-    /* Cognito login form specific styling */
-    div[data-testid="stForm"] .stTextInput > div > div > input {
-        background: #f8f9fa !important;
-        color: #2c3e50 !important;
-        border: 2px solid #dee2e6 !important;
-        border-radius: 8px !important;
-        padding: 12px 16px !important;
-        font-size: 16px !important;
-        font-weight: 400 !important;
-        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1) !important;
-        min-height: auto !important;
-        transform: none !important;
-    }
-    
-    div[data-testid="stForm"] .stTextInput > div > div > input:focus {
-        border-color: #452c63 !important;
-        box-shadow: 0 0 0 3px rgba(69, 44, 99, 0.1) !important;
-        transform: none !important;
-    }
-    
-    div[data-testid="stForm"] .stTextInput > div > div > input::placeholder {
-        color: #6c757d !important;
-        font-weight: 400 !important;
-    }
-    
-    /* Spinner text styling */
-    .stSpinner > div > div {
-        border-color: #452c63 !important;
-    }
-    
-    .stSpinner + div {
-        color: #452c63 !important;
-        font-weight: 700 !important;
-        font-size: 16px !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-
 def init_session_state():
     if 'session_id' not in st.session_state:
         st.session_state.session_id = str(uuid.uuid4())
     if 'messages' not in st.session_state:
-        st.session_state.messages = []
+        st.session_state.messages = Conversation()
     if 'citations' not in st.session_state:
         st.session_state.citations = []
-    if 'trace' not in st.session_state:
-        st.session_state.trace = {}
     if 'message_count' not in st.session_state:
         st.session_state.message_count = 0
     if 'session_start_time' not in st.session_state:
@@ -219,21 +86,53 @@ def init_session_state():
     if 'logout_clicked' not in st.session_state:
         st.session_state.logout_clicked = False
 
-def display_chat_message(message, is_user=False):
-    message_class = "user-message" if is_user else "assistant-message"
-    icon = "👤" if is_user else "🤖"
-    
-    st.markdown(f"""
-    <div class="{message_class}">
-        <strong>{icon} {'You' if is_user else 'AI Cost Calculator'}</strong>
-        <div style="margin-top: 0.5rem;">
-            {message}
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+def display_chat_message(message, is_user=False, container=None):
+    if container is None:
+        container = st
+    container.markdown(build_message_html(message, is_user), unsafe_allow_html=True)
+
+def restore_history(username):
+    """Reload the user's latest conversation from the history store once per login"""
+    previous_user = st.session_state.get("history_user")
+    if previous_user == username:
+        return
+    st.session_state.history_user = username
+    if previous_user is not None:
+        # Another user signed in on this browser session; never carry their chat over
+        st.session_state.messages = Conversation()
+        st.session_state.message_count = 0
+        reset_transcript()
+        st.session_state.citations = []
+        st.session_state.session_id = str(uuid.uuid4())
+    history = get_history_store()
+    if history is None or st.session_state.messages:
+        return
+    restored = history.rehydrate(username)
+    if restored is None:
+        return
+    # Reusing the Bedrock session ID lets the agent continue from its own session memory
+    st.session_state.session_id, messages, agent_session_state = restored
+    for message in messages:
+        st.session_state.messages.add(message["role"], message["content"])
+    st.session_state.message_count = sum(1 for message in messages if message["role"] == "user")
+    # A chat that had moved to a newer agent session carries on in it
+    restore_session(st.session_state, agent_session_state)
+
+def add_message(role, content):
+    st.session_state.messages.add(role, content)
+    history = get_history_store()
+    if history is not None:
+        history.record(st.session_state.get("history_user"), st.session_state.session_id, role, content)
+
+def save_agent_session(agent_session):
+    history = get_history_store()
+    if history is not None:
+        history.record_agent_session(st.session_state.get("history_user"), st.session_state.session_id,
+                                     agent_session.to_dict())
 
 def display_authenticated_app(authenticator):
     """Display the main app for authenticated users"""
+    restore_history(authenticator.get_username())
     
     def logout():
         st.session_state.logout_clicked = True
@@ -257,15 +156,41 @@ def display_authenticated_app(authenticator):
         status = "🟢 Online" if agent_id else "🔴 Offline"
         st.success(f"Status: {status}")
         st.info(f"Messages: {st.session_state.message_count}")
+        load = agent_limiter.stats()
+        if load["queued"]:
+            st.warning(f"⏳ High demand: {load['queued']} requests waiting")
+        st.caption(f"Agent requests in flight: {load['in_flight']}/{load['max_in_flight']}")
+        response_cache = get_response_cache()
+        if response_cache is not None:
+            cache_stats = response_cache.stats()
+            st.caption(
+                f"Response cache: {cache_stats['hit_ratio']:.0%} hit ratio, "
+                f"{cache_stats['saved_seconds']:.1f}s saved"
+            )
+        conversation = st.session_state.messages
+        memory_note = f", {conversation.spilled} older messages on disk" if conversation.spilled else ""
+        st.caption(f"Session memory: {conversation.nbytes / 1024:.1f} KB{memory_note}")
+        if trace_policy.mode != TRACE_OFF:
+            render_usage_summary(st.session_state.session_id, st.session_state.get("history_user"))
+        if show_latency_breakdown:
+            with st.expander("⏱️ Latency breakdown"):
+                breakdown = telemetry.latency_breakdown()
+                if breakdown:
+                    st.caption("  \n".join(
+                        f"{span}: {mean_ms:.0f} ms avg, {p95_ms:.0f} ms p95 ({count})"
+                        for span, (mean_ms, p95_ms, count) in breakdown.items()
+                    ))
+                else:
+                    st.caption("No turns yet")
         
         st.divider()
         
         st.subheader("📱 Session Controls")
         if st.button("🔄 New Chat", use_container_width=True):
-            st.session_state.messages = []
+            st.session_state.messages = Conversation()
             st.session_state.message_count = 0
+            reset_transcript()
             st.session_state.citations = []
-            st.session_state.trace = {}
             st.session_state.session_id = str(uuid.uuid4())
             st.session_state.session_start_time = datetime.now()
             st.rerun()
@@ -274,20 +199,15 @@ def display_authenticated_app(authenticator):
         
         st.subheader("Save chat history?")
         if st.session_state.messages:
-            chat_data = {
-                "session_id": st.session_state.session_id,
-                "timestamp": datetime.now().isoformat(),
-                "messages": st.session_state.messages,
-                "message_count": st.session_state.message_count,
-                "user": authenticator.get_username()
-            }
-            
-            st.download_button(
-                label="📄 Download Chat History",
-                data=json.dumps(chat_data, indent=2),
-                file_name=f"chat_history_{authenticator.get_username()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                mime="application/json",
-                use_container_width=True
+            render_export_controls(
+                st.session_state.messages,
+                {
+                    "session_id": st.session_state.session_id,
+                    "timestamp": datetime.now().isoformat(),
+                    "message_count": st.session_state.message_count,
+                    "user": authenticator.get_username()
+                },
+                f"chat_history_{authenticator.get_username()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
             )
         else:
             st.info("No chat history available")
@@ -300,16 +220,12 @@ def display_authenticated_app(authenticator):
     </div>
     """, unsafe_allow_html=True)
     
-    for message in st.session_state.messages:
-        if message["role"] == "user":
-            display_chat_message(message["content"], is_user=True)
-        else:
-            display_chat_message(message["content"], is_user=False)
+    render_transcript(st.session_state.messages)
     
     st.markdown("<div style='height: 300px;'></div>", unsafe_allow_html=True)
     
     if prompt := st.chat_input("Please start by typing preferred cloud platform, support type and estimated consumption costs"):
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        add_message("user", prompt)
         st.session_state.message_count += 1
         
         display_chat_message(prompt, is_user=True)
@@ -319,35 +235,84 @@ def display_authenticated_app(authenticator):
             st.error("❌ Bedrock Agent not configured. Please set BEDROCK_AGENT_ID and BEDROCK_AGENT_ALIAS_ID environment variables.")
             return
         
+        placeholder = st.empty()
+        turn_start = time.perf_counter()
+        archiver = None
+        turn_error = None
+        render_time = telemetry.Stopwatch()
         try:
-            with st.spinner("🤔 **Processing your request...**"):
-                response = bedrock_agent_runtime.invoke_agent(
-                    agent_id,
-                    agent_alias_id,
-                    st.session_state.session_id,
-                    prompt
-                )
+            # Show a placeholder bubble that is replaced by the answer as it streams in
+            with render_time:
+                display_chat_message("🤔 Processing your request...", is_user=False, container=placeholder)
+            # Trace steps go straight to the archive, when on; this app never shows them
+            archiver = turn_archiver(st.session_state.session_id, st.session_state.message_count)
+            response = bedrock_agent_runtime.AgentResponse(trace_policy, trace_sink=archiver, keep_trace=False)
+            # Long chats move to a fresh agent session carrying a summary, so prompts stay short
+            agent_session = for_conversation(st.session_state)
+            if agent_session.prepare_turn(st.session_state.messages):
+                save_agent_session(agent_session)
+            # Routes to the agent targets in BEDROCK_AGENT_ROUTES, or just this agent when unset
+            router = get_agent_router(agent_id, agent_alias_id)
+            events = router.stream(
+                agent_session.session_id,
+                prompt,
+                stream_final_response=stream_final_response,
+                trace_policy=trace_policy,
+                cache=get_response_cache(),
+                session_state=agent_session.session_state(),
+                previous_answer=st.session_state.messages.last_answer()
+            )
+            for event in events:
+                response.add(event)
+                if isinstance(event, bedrock_agent_runtime.ChunkEvent):
+                    with render_time:
+                        display_chat_message(response.output_text + "▌", is_user=False, container=placeholder)
             
-            output_text = response["output_text"]
+            output_text = response.output_text
             
             if not output_text or output_text.strip() == "":
                 output_text = "I apologize, but I couldn't generate a response. Please try rephrasing your question."
             
-            try:
-                output_json = json.loads(output_text, strict=False)
-                if "instruction" in output_json and "result" in output_json:
-                    output_text = output_json["result"]
-            except json.JSONDecodeError:
-                pass
+            with telemetry.span("answer_unwrap"):
+                try:
+                    output_json = json.loads(output_text, strict=False)
+                    if "instruction" in output_json and "result" in output_json:
+                        output_text = output_json["result"]
+                except json.JSONDecodeError:
+                    pass
+            
+            with telemetry.span("citations"):
+                output_text = apply_citations(output_text, response.citations)
+                st.session_state.citations = response.citations
+            add_message("assistant", output_text)
+            
+            with render_time:
+                display_chat_message(output_text, is_user=False, container=placeholder)
+            render_time.observe("render")
+            turn_seconds = time.perf_counter() - turn_start
+            telemetry.observe("turn", turn_seconds)
+            if archiver is not None:
+                archiver.finish(response.trace_summary.to_dict(), turn_seconds * 1000)
+            usage_ledger.record(response.usage, turn_seconds, st.session_state.session_id,
+                                st.session_state.get("history_user"), response.agent_alias_id or agent_alias_id)
+            agent_session.record_turn(response)
             
-            st.session_state.messages.append({"role": "assistant", "content": output_text})
-            st.session_state.citations = response["citations"]
-            st.session_state.trace = response["trace"]
+        except AgentBusyError as e:
+            turn_error = e
+            busy_response = "⏳ I'm handling a lot of requests right now. Please try again in a moment."
+            add_message("assistant", busy_response)
+            display_chat_message(busy_response, is_user=False, container=placeholder)
             
-            display_chat_message(output_text, is_user=False)
+        except CircuitOpenError as e:
+            turn_error = e
+            unavailable_response = "⚠️ The AI service is currently degraded, so requests are paused briefly. Please try again in a minute."
+            add_message("assistant", unavailable_response)
+            display_chat_message(unavailable_response, is_user=False, container=placeholder)
             
         except Exception as e:
+            turn_error = e
             error_msg = str(e)
+            logger.exception(f"Agent turn failed: {error_msg}")
             st.error(f"❌ Error invoking Bedrock Agent: {error_msg}")
             
             if "AccessDenied" in error_msg:
@@ -360,8 +325,13 @@ def display_authenticated_app(authenticator):
                 st.info("📝 Please check your AWS configuration and network connection.")
             
             fallback_response = "I'm currently unable to process your request due to a technical issue. Please try again later or contact support."
-            st.session_state.messages.append({"role": "assistant", "content": fallback_response})
-            display_chat_message(fallback_response, is_user=False)
+            add_message("assistant", fallback_response)
+            display_chat_message(fallback_response, is_user=False, container=placeholder)
+        finally:
+            # Failed turns are archived too, with the time they ran before failing
+            if archiver is not None and turn_error is not None:
+                archiver.finish(response.trace_summary.to_dict(), (time.perf_counter() - turn_start) * 1000,
+                                turn_error)
 
 def main():
     st.set_page_config(
@@ -372,7 +342,11 @@ def main():
     )
     
     init_session_state()
-    load_css()
+    apply_theme()
+    configure_logging()
+    # Build the agent client in the background so the first prompt does not wait for it
+    bedrock_agent_runtime.prewarm_client()
+    telemetry.start_exporters()
     
     # Initialize authenticator
     authenticator = Auth.get_authenticator(SECRETS_MANAGER_ID, AWS_REGION)
@@ -1,12 +1,13 @@
 from dotenv import load_dotenv
 import json
 import logging
-import logging.config
-import re
 from services import bedrock_agent_runtime
+from services.citations import CitationIndex, apply_citations
+from services.structured_logging import configure_logging
+from services.trace_archive import archive_turn
 import streamlit as st
+from ui.trace_viewer import render_trace_viewer
 import uuid
-import yaml
 import os
 
 # Get config from environment variables
@@ -15,6 +16,9 @@ agent_alias_id = os.getenv('BEDROCK_AGENT_ALIAS_ID')
 ui_title = os.getenv('BEDROCK_AGENT_TEST_UI_TITLE', 'Welcome to CenITex Modern Cloud Cost Calculator Powered by AI')
 ui_icon = os.getenv('BEDROCK_AGENT_TEST_UI_ICON', '🤖')
 
+# Applies logging.yaml when present, otherwise JSON logs configured by the LOG_* settings
+configure_logging()
+
 
 def init_session_state():
     st.session_state.session_id = str(uuid.uuid4())
@@ -67,95 +71,34 @@ if prompt := st.chat_input():
                 pass
 
             # Add citations
-            if len(response["citations"]) > 0:
-                citation_num = 1
-                output_text = re.sub(r"%\[(\d+)\]%", r"<sup>[\1]</sup>", output_text)
-                num_citation_chars = 0
-                citation_locs = ""
-                for citation in response["citations"]:
-                    for retrieved_ref in citation["retrievedReferences"]:
-                        citation_marker = f"[{citation_num}]"
-                        citation_locs += f"\n<br>{citation_marker} {retrieved_ref['location']['s3Location']['uri']}"
-                        citation_num += 1
-                output_text += f"\n{citation_locs}"
+            output_text = apply_citations(output_text, response["citations"])
 
             st.session_state.messages.append({"role": "assistant", "content": output_text})
             st.session_state.citations = response["citations"]
             st.session_state.trace = response["trace"]
+            archive_turn(st.session_state.session_id, len(st.session_state.messages) // 2, response["trace"],
+                         response["trace_summary"])
             st.markdown(output_text, unsafe_allow_html=True)
 
-trace_types_map = {
-    "Pre-Processing": ["preGuardrailTrace", "preProcessingTrace"],
-    "Orchestration": ["orchestrationTrace"],
-    "Post-Processing": ["postProcessingTrace", "postGuardrailTrace"]
-}
-
-trace_info_types_map = {
-    "preProcessingTrace": ["modelInvocationInput", "modelInvocationOutput"],
-    "orchestrationTrace": ["invocationInput", "modelInvocationInput", "modelInvocationOutput", "observation", "rationale"],
-    "postProcessingTrace": ["modelInvocationInput", "modelInvocationOutput", "observation"]
-}
-
 # Sidebar section for trace
 with st.sidebar:
     st.title("Trace")
-
-    # Show each trace type in separate sections
-    step_num = 1
-    for trace_type_header in trace_types_map:
-        st.subheader(trace_type_header)
-
-        # Organize traces by step similar to how it is shown in the Bedrock console
-        has_trace = False
-        for trace_type in trace_types_map[trace_type_header]:
-            if trace_type in st.session_state.trace:
-                has_trace = True
-                trace_steps = {}
-
-                for trace in st.session_state.trace[trace_type]:
-                    # Each trace type and step may have different information for the end-to-end flow
-                    if trace_type in trace_info_types_map:
-                        trace_info_types = trace_info_types_map[trace_type]
-                        for trace_info_type in trace_info_types:
-                            if trace_info_type in trace:
-                                trace_id = trace[trace_info_type]["traceId"]
-                                if trace_id not in trace_steps:
-                                    trace_steps[trace_id] = [trace]
-                                else:
-                                    trace_steps[trace_id].append(trace)
-                                break
-                    else:
-                        trace_id = trace["traceId"]
-                        trace_steps[trace_id] = [
-                            {
-                                trace_type: trace
-                            }
-                        ]
-
-                # Show trace steps in JSON similar to the Bedrock console
-                for trace_id in trace_steps.keys():
-                    with st.expander(f"Trace Step {str(step_num)}", expanded=False):
-                        for trace in trace_steps[trace_id]:
-                            trace_str = json.dumps(trace, indent=2)
-                            st.code(trace_str, language="json", line_numbers=True, wrap_lines=True)
-                    step_num += 1
-        if not has_trace:
-            st.text("None")
+    render_trace_viewer(st.session_state.trace)
 
     st.subheader("Citations")
-    if len(st.session_state.citations) > 0:
-        citation_num = 1
-        for citation in st.session_state.citations:
-            for retrieved_ref_num, retrieved_ref in enumerate(citation["retrievedReferences"]):
-                with st.expander(f"Citation [{str(citation_num)}]", expanded=False):
-                    citation_str = json.dumps(
-                        {
-                            "generatedResponsePart": citation["generatedResponsePart"],
-                            "retrievedReference": citation["retrievedReferences"][retrieved_ref_num]
-                        },
-                        indent=2
-                    )
-                    st.code(citation_str, language="json", line_numbers=True, wrap_lines=True)
-                citation_num = citation_num + 1
+    # Numbered like the footnotes in the answer, one entry per cited document
+    citation_index = CitationIndex(st.session_state.citations)
+    if len(citation_index) > 0:
+        for citation_num, uri, references in citation_index.footnotes():
+            with st.expander(f"Citation [{citation_num}]", expanded=False):
+                st.caption(uri)
+                citation_str = json.dumps(
+                    [
+                        {"generatedResponsePart": generated_part, "retrievedReference": reference}
+                        for generated_part, reference in references
+                    ],
+                    indent=2
+                )
+                st.code(citation_str, language="json", line_numbers=True, wrap_lines=True)
     else:
         st.text("None")
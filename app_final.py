@@ -1,13 +1,30 @@
 from dotenv import load_dotenv
 import json
+import logging
 import os
-from services import bedrock_agent_runtime
+from services import bedrock_agent_runtime, client_pool
+from services.agent_session import for_conversation, restore_session
+from services.citations import apply_citations
+from services.concurrency import AgentBusyError
+from services.conversation import Conversation
+from services.history_store import get_history_store
+from services.resilience import CircuitOpenError
+from services.structured_logging import configure_logging
+from services.trace_archive import turn_archiver
+from services.trace_policy import TracePolicy, TRACE_OFF
+from services.usage import usage_ledger
+from ui.chat_export import render_export_controls
+from ui.theme import apply_theme
+from ui.transcript import build_message_html, render_transcript, reset_transcript
+from ui.usage import render_usage_summary
 import streamlit as st
+import time
 import uuid
 from datetime import datetime
-import boto3
 from botocore.exceptions import ClientError
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv()
 
@@ -21,129 +38,17 @@ agent_id = os.getenv('BEDROCK_AGENT_ID')
 agent_alias_id = os.getenv('BEDROCK_AGENT_ALIAS_ID')
 ui_title = os.getenv('BEDROCK_AGENT_TEST_UI_TITLE', 'Welcome to CenITex Modern Cloud Cost Calculator Powered by AI')
 ui_icon = os.getenv('BEDROCK_AGENT_TEST_UI_ICON', '🤖')
-
-# Initialize Cognito client
-cognito_client = boto3.client('cognito-idp', region_name=AWS_REGION)
-
-def load_css():
-    st.markdown("""
-    <style>
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    
-    .stApp {
-        background: linear-gradient(135deg, #e8e3f0 0%, #d4c5e8 100%);
-    }
-    
-    .main-header {
-        background: #452c63;
-        padding: 0.8rem 1.2rem;
-        border-radius: 10px;
-        margin: 0 0 0.5rem 0;
-        text-align: left;
-        color: white;
-        max-width: 600px;
-        box-shadow: 0 4px 15px rgba(69, 44, 99, 0.3);
-    }
-    
-    .main-header h1 {
-        margin: 0;
-        font-size: 1.4rem;
-        font-weight: 600;
-    }
-    
-    .main-header p {
-        margin: 0.3rem 0 0 0;
-        font-size: 0.9rem;
-        opacity: 0.9;
-    }
-    
-    .user-message {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        padding: 0.8rem;
-        border-radius: 10px;
-        margin: 0.2rem 0;
-        box-shadow: 0 2px 8px rgba(102, 126, 234, 0.3);
-        max-width: 80%;
-    }
-    
-    .assistant-message {
-        background: white;
-        color: #2c3e50;
-        padding: 0.8rem;
-        border-radius: 10px;
-        margin: 0.2rem 0;
-        border-left: 4px solid #667eea;
-        box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-        max-width: 80%;
-    }
-    
-    .stTextInput > div > div > input {
-        background: linear-gradient(135deg, #0a0a0a 0%, #1a1a1a 100%) !important;
-        color: #FFFFFF !important;
-        border: 10px solid #000000 !important;
-        border-radius: 35px !important;
-        padding: 30px 50px !important;
-        font-size: 24px !important;
-        font-weight: 900 !important;
-        box-shadow: 0 20px 50px rgba(0, 0, 0, 0.7) !important;
-        transition: all 0.3s ease !important;
-        min-height: 90px !important;
-    }
-    
-    .main .block-container {
-        padding-left: 1rem !important;
-        margin-left: 0 !important;
-        padding-bottom: 150px !important;
-    }
-    
-    .stTextInput > div > div > input:focus {
-        border-color: #000000 !important;
-        box-shadow: 0 0 40px rgba(0, 0, 0, 0.7) !important;
-        transform: translateY(-4px) !important;
-    }
-    
-    .stTextInput > div > div > input::placeholder {
-        color: #ffffff !important;
-        font-weight: 800 !important;
-    }
-    
-    div[data-testid="stForm"] .stTextInput > div > div > input {
-        background: #f8f9fa !important;
-        color: #2c3e50 !important;
-        border: 2px solid #dee2e6 !important;
-        border-radius: 8px !important;
-        padding: 12px 16px !important;
-        font-size: 16px !important;
-        font-weight: 400 !important;
-        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1) !important;
-        min-height: auto !important;
-    }
-    
-    div[data-testid="stForm"] .stTextInput > div > div > input:focus {
-        border-color: #452c63 !important;
-        box-shadow: 0 0 0 3px rgba(69, 44, 99, 0.1) !important;
-        transform: none !important;
-    }
-    
-    div[data-testid="stForm"] .stTextInput > div > div > input::placeholder {
-        color: #6c757d !important;
-        font-weight: 400 !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+stream_final_response = os.getenv('BEDROCK_AGENT_STREAM_FINAL_RESPONSE', 'true').lower() == 'true'
+# Traces are never displayed here, so they are only requested when BEDROCK_AGENT_TRACE_MODE asks for them
+trace_policy = TracePolicy.from_env(default_mode=TRACE_OFF)
 
 def init_session_state():
     if 'session_id' not in st.session_state:
         st.session_state.session_id = str(uuid.uuid4())
     if 'messages' not in st.session_state:
-        st.session_state.messages = []
+        st.session_state.messages = Conversation()
     if 'citations' not in st.session_state:
         st.session_state.citations = []
-    if 'trace' not in st.session_state:
-        st.session_state.trace = {}
     if 'message_count' not in st.session_state:
         st.session_state.message_count = 0
     if 'session_start_time' not in st.session_state:
@@ -158,6 +63,7 @@ def init_session_state():
 def authenticate_user(username, password):
     """Authenticate user with Amazon Cognito"""
     try:
+        cognito_client = client_pool.get_client('cognito-idp', region_name=AWS_REGION)
         response = cognito_client.initiate_auth(
             ClientId=COGNITO_CLIENT_ID,
             AuthFlow='USER_PASSWORD_AUTH',
@@ -183,18 +89,49 @@ def authenticate_user(username, password):
     except Exception as e:
         return False, f"Connection error: {str(e)}"
 
-def display_chat_message(message, is_user=False):
-    message_class = "user-message" if is_user else "assistant-message"
-    icon = "👤" if is_user else "🤖"
-    
-    st.markdown(f"""
-    <div class="{message_class}">
-        <strong>{icon} {'You' if is_user else 'AI Cost Calculator'}</strong>
-        <div style="margin-top: 0.5rem;">
-            {message}
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+def display_chat_message(message, is_user=False, container=None):
+    if container is None:
+        container = st
+    container.markdown(build_message_html(message, is_user), unsafe_allow_html=True)
+
+def restore_history(username):
+    """Reload the user's latest conversation from the history store once per login"""
+    previous_user = st.session_state.get("history_user")
+    if previous_user == username:
+        return
+    st.session_state.history_user = username
+    if previous_user is not None:
+        # Another user signed in on this browser session; never carry their chat over
+        st.session_state.messages = Conversation()
+        st.session_state.message_count = 0
+        reset_transcript()
+        st.session_state.citations = []
+        st.session_state.session_id = str(uuid.uuid4())
+    history = get_history_store()
+    if history is None or st.session_state.messages:
+        return
+    restored = history.rehydrate(username)
+    if restored is None:
+        return
+    # Reusing the Bedrock session ID lets the agent continue from its own session memory
+    st.session_state.session_id, messages, agent_session_state = restored
+    for message in messages:
+        st.session_state.messages.add(message["role"], message["content"])
+    st.session_state.message_count = sum(1 for message in messages if message["role"] == "user")
+    # A chat that had moved to a newer agent session carries on in it
+    restore_session(st.session_state, agent_session_state)
+
+def add_message(role, content):
+    st.session_state.messages.add(role, content)
+    history = get_history_store()
+    if history is not None:
+        history.record(st.session_state.get("history_user"), st.session_state.session_id, role, content)
+
+def save_agent_session(agent_session):
+    history = get_history_store()
+    if history is not None:
+        history.record_agent_session(st.session_state.get("history_user"), st.session_state.session_id,
+                                     agent_session.to_dict())
 
 def cognito_login():
     """Cognito login form"""
@@ -240,6 +177,7 @@ def cognito_login():
 
 def display_authenticated_app():
     """Display the main app"""
+    restore_history(st.session_state.username)
     
     with st.sidebar:
         if os.path.exists("logo.png"):
@@ -261,15 +199,17 @@ def display_authenticated_app():
         status = "🟢 Online" if agent_id else "🔴 Offline"
         st.success(f"Status: {status}")
         st.info(f"Messages: {st.session_state.message_count}")
+        if trace_policy.mode != TRACE_OFF:
+            render_usage_summary(st.session_state.session_id, st.session_state.get("history_user"))
         
         st.divider()
         
         st.subheader("📱 Session Controls")
         if st.button("🔄 New Chat", use_container_width=True):
-            st.session_state.messages = []
+            st.session_state.messages = Conversation()
             st.session_state.message_count = 0
+            reset_transcript()
             st.session_state.citations = []
-            st.session_state.trace = {}
             st.session_state.session_id = str(uuid.uuid4())
             st.session_state.session_start_time = datetime.now()
             st.rerun()
@@ -284,20 +224,15 @@ def display_authenticated_app():
         
         st.subheader("Save chat history?")
         if st.session_state.messages:
-            chat_data = {
-                "session_id": st.session_state.session_id,
-                "timestamp": datetime.now().isoformat(),
-                "messages": st.session_state.messages,
-                "message_count": st.session_state.message_count,
-                "user": st.session_state.username
-            }
-            
-            st.download_button(
-                label="📄 Download Chat History",
-                data=json.dumps(chat_data, indent=2),
-                file_name=f"chat_history_{st.session_state.username}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                mime="application/json",
-                use_container_width=True
+            render_export_controls(
+                st.session_state.messages,
+                {
+                    "session_id": st.session_state.session_id,
+                    "timestamp": datetime.now().isoformat(),
+                    "message_count": st.session_state.message_count,
+                    "user": st.session_state.username
+                },
+                f"chat_history_{st.session_state.username}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
             )
         else:
             st.info("No chat history available")
@@ -310,16 +245,12 @@ def display_authenticated_app():
     </div>
     """, unsafe_allow_html=True)
     
-    for message in st.session_state.messages:
-        if message["role"] == "user":
-            display_chat_message(message["content"], is_user=True)
-        else:
-            display_chat_message(message["content"], is_user=False)
+    render_transcript(st.session_state.messages)
     
     st.markdown("<div style='height: 300px;'></div>", unsafe_allow_html=True)
     
     if prompt := st.chat_input("Please start by typing preferred cloud platform, support type and estimated consumption costs"):
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        add_message("user", prompt)
         st.session_state.message_count += 1
         
         display_chat_message(prompt, is_user=True)
@@ -329,16 +260,35 @@ def display_authenticated_app():
             st.error("❌ Bedrock Agent not configured. Please set BEDROCK_AGENT_ID and BEDROCK_AGENT_ALIAS_ID environment variables.")
             return
         
+        placeholder = st.empty()
+        turn_start = time.perf_counter()
+        archiver = None
+        turn_error = None
         try:
-            with st.spinner("🤔 Processing your request..."):
-                response = bedrock_agent_runtime.invoke_agent(
-                    agent_id,
-                    agent_alias_id,
-                    st.session_state.session_id,
-                    prompt
-                )
+            # Show a placeholder bubble that is replaced by the answer as it streams in
+            display_chat_message("🤔 Processing your request...", is_user=False, container=placeholder)
+            # Trace steps go straight to the archive, when on; this app never shows them
+            archiver = turn_archiver(st.session_state.session_id, st.session_state.message_count)
+            response = bedrock_agent_runtime.AgentResponse(trace_policy, trace_sink=archiver, keep_trace=False)
+            # Long chats move to a fresh agent session carrying a summary, so prompts stay short
+            agent_session = for_conversation(st.session_state)
+            if agent_session.prepare_turn(st.session_state.messages):
+                save_agent_session(agent_session)
+            events = bedrock_agent_runtime.stream_agent(
+                agent_id,
+                agent_alias_id,
+                agent_session.session_id,
+                prompt,
+                stream_final_response=stream_final_response,
+                trace_policy=trace_policy,
+                session_state=agent_session.session_state()
+            )
+            for event in events:
+                response.add(event)
+                if isinstance(event, bedrock_agent_runtime.ChunkEvent):
+                    display_chat_message(response.output_text + "▌", is_user=False, container=placeholder)
             
-            output_text = response["output_text"]
+            output_text = response.output_text
             
             # Handle empty response
             if not output_text or output_text.strip() == "":
@@ -351,14 +301,34 @@ def display_authenticated_app():
             except json.JSONDecodeError:
                 pass
             
-            st.session_state.messages.append({"role": "assistant", "content": output_text})
-            st.session_state.citations = response["citations"]
-            st.session_state.trace = response["trace"]
+            output_text = apply_citations(output_text, response.citations)
+            add_message("assistant", output_text)
+            st.session_state.citations = response.citations
+            turn_seconds = time.perf_counter() - turn_start
+            if archiver is not None:
+                archiver.finish(response.trace_summary.to_dict(), turn_seconds * 1000)
+            usage_ledger.record(response.usage, turn_seconds, st.session_state.session_id,
+                                st.session_state.get("history_user"), agent_alias_id)
+            agent_session.record_turn(response)
+            
+            display_chat_message(output_text, is_user=False, container=placeholder)
+            
+        except AgentBusyError as e:
+            turn_error = e
+            busy_response = "⏳ I'm handling a lot of requests right now. Please try again in a moment."
+            add_message("assistant", busy_response)
+            display_chat_message(busy_response, is_user=False, container=placeholder)
             
-            display_chat_message(output_text, is_user=False)
+        except CircuitOpenError as e:
+            turn_error = e
+            unavailable_response = "⚠️ The AI service is currently degraded, so requests are paused briefly. Please try again in a minute."
+            add_message("assistant", unavailable_response)
+            display_chat_message(unavailable_response, is_user=False, container=placeholder)
             
         except Exception as e:
+            turn_error = e
             error_msg = str(e)
+            logger.exception(f"Agent turn failed: {error_msg}")
             st.error(f"❌ Error invoking Bedrock Agent: {error_msg}")
             
             # Provide more specific error guidance
@@ -373,8 +343,13 @@ def display_authenticated_app():
             
             # Add fallback response
             fallback_response = "I'm currently unable to process your request due to a technical issue. Please try again later or contact support."
-            st.session_state.messages.append({"role": "assistant", "content": fallback_response})
-            display_chat_message(fallback_response, is_user=False)
+            add_message("assistant", fallback_response)
+            display_chat_message(fallback_response, is_user=False, container=placeholder)
+        finally:
+            # Failed turns are archived too, with the time they ran before failing
+            if archiver is not None and turn_error is not None:
+                archiver.finish(response.trace_summary.to_dict(), (time.perf_counter() - turn_start) * 1000,
+                                turn_error)
 
 def main():
     st.set_page_config(
@@ -385,7 +360,10 @@ def main():
     )
     
     init_session_state()
-    load_css()
+    apply_theme()
+    configure_logging()
+    # Build the agent client in the background so the first prompt does not wait for it
+    bedrock_agent_runtime.prewarm_client()
     
     if st.session_state.authenticated:
         display_authenticated_app()
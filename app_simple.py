@@ -1,11 +1,26 @@
 from dotenv import load_dotenv
 import json
+import logging
 import os
 from services import bedrock_agent_runtime
+from services.agent_session import for_conversation
+from services.citations import apply_citations
+from services.concurrency import AgentBusyError
+from services.conversation import Conversation
+from services.resilience import CircuitOpenError
+from services.structured_logging import configure_logging
+from services.trace_archive import turn_archiver
+from services.trace_policy import TracePolicy, TRACE_OFF
+from ui.chat_export import render_export_controls
+from ui.theme import apply_theme
+from ui.transcript import build_message_html, render_transcript, reset_transcript
 import streamlit as st
+import time
 import uuid
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv()
 
@@ -14,127 +29,26 @@ agent_id = os.getenv('BEDROCK_AGENT_ID')
 agent_alias_id = os.getenv('BEDROCK_AGENT_ALIAS_ID')
 ui_title = os.getenv('BEDROCK_AGENT_TEST_UI_TITLE', 'Welcome to CenITex Modern Cloud Cost Calculator Powered by AI')
 ui_icon = os.getenv('BEDROCK_AGENT_TEST_UI_ICON', '🤖')
-
-# Custom CSS styling
-def load_css():
-    st.markdown("""
-    <style>
-    /* Hide Streamlit branding */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    
-    /* Global background - purple theme */
-    .stApp {
-        background: linear-gradient(135deg, #e8e3f0 0%, #d4c5e8 100%);
-    }
-    
-    /* Header styling */
-    .main-header {
-        background: #452c63;
-        padding: 0.8rem 1.2rem;
-        border-radius: 10px;
-        margin: 0 0 0.5rem 0;
-        text-align: left;
-        color: white;
-        max-width: 600px;
-        box-shadow: 0 4px 15px rgba(69, 44, 99, 0.3);
-    }
-    
-    .main-header h1 {
-        margin: 0;
-        font-size: 1.4rem;
-        font-weight: 600;
-    }
-    
-    .main-header p {
-        margin: 0.3rem 0 0 0;
-        font-size: 0.9rem;
-        opacity: 0.9;
-    }
-    
-    /* Message styling */
-    .user-message {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        padding: 0.8rem;
-        border-radius: 10px;
-        margin: 0.2rem 0;
-        box-shadow: 0 2px 8px rgba(102, 126, 234, 0.3);
-        max-width: 80%;
-    }
-    
-    .assistant-message {
-        background: white;
-        color: #2c3e50;
-        padding: 0.8rem;
-        border-radius: 10px;
-        margin: 0.2rem 0;
-        border-left: 4px solid #667eea;
-        box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-        max-width: 80%;
-    }
-    
-    /* Enhanced input box styling - bigger and higher */
-    .stTextInput > div > div > input {
-        background: linear-gradient(135deg, #0a0a0a 0%, #1a1a1a 100%) !important;
-        color: #FFFFFF !important;
-        border: 10px solid #000000 !important;
-        border-radius: 35px !important;
-        padding: 30px 50px !important;
-        font-size: 24px !important;
-        font-weight: 900 !important;
-        box-shadow: 0 20px 50px rgba(0, 0, 0, 0.7) !important;
-        transition: all 0.3s ease !important;
-        min-height: 90px !important;
-    }
-    
-    /* Ensure main content doesn't overlap with sidebar */
-    .main .block-container {
-        padding-left: 1rem !important;
-        margin-left: 0 !important;
-        padding-bottom: 150px !important;
-    }
-    
-    .stTextInput > div > div > input:focus {
-        border-color: #000000 !important;
-        box-shadow: 0 0 40px rgba(0, 0, 0, 0.7) !important;
-        transform: translateY(-4px) !important;
-    }
-    
-    .stTextInput > div > div > input::placeholder {
-        color: #ffffff !important;
-        font-weight: 800 !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+stream_final_response = os.getenv('BEDROCK_AGENT_STREAM_FINAL_RESPONSE', 'true').lower() == 'true'
+# Traces are never displayed here, so they are only requested when BEDROCK_AGENT_TRACE_MODE asks for them
+trace_policy = TracePolicy.from_env(default_mode=TRACE_OFF)
 
 def init_session_state():
     if 'session_id' not in st.session_state:
         st.session_state.session_id = str(uuid.uuid4())
     if 'messages' not in st.session_state:
-        st.session_state.messages = []
+        st.session_state.messages = Conversation()
     if 'citations' not in st.session_state:
         st.session_state.citations = []
-    if 'trace' not in st.session_state:
-        st.session_state.trace = {}
     if 'message_count' not in st.session_state:
         st.session_state.message_count = 0
     if 'session_start_time' not in st.session_state:
         st.session_state.session_start_time = datetime.now()
 
-def display_chat_message(message, is_user=False):
-    message_class = "user-message" if is_user else "assistant-message"
-    icon = "👤" if is_user else "🤖"
-    
-    st.markdown(f"""
-    <div class="{message_class}">
-        <strong>{icon} {'You' if is_user else 'AI Cost Calculator'}</strong>
-        <div style="margin-top: 0.5rem;">
-            {message}
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+def display_chat_message(message, is_user=False, container=None):
+    if container is None:
+        container = st
+    container.markdown(build_message_html(message, is_user), unsafe_allow_html=True)
 
 def main():
     # Page configuration
@@ -149,7 +63,11 @@ def main():
     init_session_state()
     
     # Load CSS
-    load_css()
+    apply_theme()
+    configure_logging()
+    
+    # Build the agent client in the background so the first prompt does not wait for it
+    bedrock_agent_runtime.prewarm_client()
     
     # SIDEBAR - Using with statement for better compatibility
     with st.sidebar:
@@ -171,10 +89,10 @@ def main():
         # Session Controls
         st.subheader("📱 Session Controls")
         if st.button("🔄 New Chat", use_container_width=True):
-            st.session_state.messages = []
+            st.session_state.messages = Conversation()
             st.session_state.message_count = 0
+            reset_transcript()
             st.session_state.citations = []
-            st.session_state.trace = {}
             st.session_state.session_id = str(uuid.uuid4())
             st.session_state.session_start_time = datetime.now()
             st.rerun()
@@ -184,19 +102,14 @@ def main():
         # Download Options
         st.subheader("Save a copy of chat history?")
         if st.session_state.messages:
-            chat_data = {
-                "session_id": st.session_state.session_id,
-                "timestamp": datetime.now().isoformat(),
-                "messages": st.session_state.messages,
-                "message_count": st.session_state.message_count
-            }
-            
-            st.download_button(
-                label="📄 Download Chat History",
-                data=json.dumps(chat_data, indent=2),
-                file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                mime="application/json",
-                use_container_width=True
+            render_export_controls(
+                st.session_state.messages,
+                {
+                    "session_id": st.session_state.session_id,
+                    "timestamp": datetime.now().isoformat(),
+                    "message_count": st.session_state.message_count
+                },
+                f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
             )
         else:
             st.info("No chat history available")
@@ -211,11 +124,7 @@ def main():
     """, unsafe_allow_html=True)
     
     # Chat messages
-    for message in st.session_state.messages:
-        if message["role"] == "user":
-            display_chat_message(message["content"], is_user=True)
-        else:
-            display_chat_message(message["content"], is_user=False)
+    render_transcript(st.session_state.messages)
     
     # Add spacer to prevent input box overlap
     st.markdown("<div style='height: 300px;'></div>", unsafe_allow_html=True)
@@ -229,18 +138,35 @@ def main():
         # Display user message
         display_chat_message(prompt, is_user=True)
         
+        placeholder = st.empty()
+        turn_start = time.perf_counter()
+        archiver = None
+        turn_error = None
         try:
-            # Get AI response
-            with st.spinner("🤔 Processing your request..."):
-                response = bedrock_agent_runtime.invoke_agent(
-                    agent_id,
-                    agent_alias_id,
-                    st.session_state.session_id,
-                    prompt
-                )
+            # Show a placeholder bubble that is replaced by the answer as it streams in
+            display_chat_message("🤔 Processing your request...", is_user=False, container=placeholder)
+            # Trace steps go straight to the archive, when on; this app never shows them
+            archiver = turn_archiver(st.session_state.session_id, st.session_state.message_count)
+            response = bedrock_agent_runtime.AgentResponse(trace_policy, trace_sink=archiver, keep_trace=False)
+            # Long chats move to a fresh agent session carrying a summary, so prompts stay short
+            agent_session = for_conversation(st.session_state)
+            agent_session.prepare_turn(st.session_state.messages)
+            events = bedrock_agent_runtime.stream_agent(
+                agent_id,
+                agent_alias_id,
+                agent_session.session_id,
+                prompt,
+                stream_final_response=stream_final_response,
+                trace_policy=trace_policy,
+                session_state=agent_session.session_state()
+            )
+            for event in events:
+                response.add(event)
+                if isinstance(event, bedrock_agent_runtime.ChunkEvent):
+                    display_chat_message(response.output_text + "▌", is_user=False, container=placeholder)
             
             # Process response
-            output_text = response["output_text"]
+            output_text = response.output_text
             
             # Handle JSON responses
             try:
@@ -250,17 +176,41 @@ def main():
             except json.JSONDecodeError:
                 pass
             
+            output_text = apply_citations(output_text, response.citations)
+            
             # Store response data
             st.session_state.messages.append({"role": "assistant", "content": output_text})
-            st.session_state.citations = response["citations"]
-            st.session_state.trace = response["trace"]
+            st.session_state.citations = response.citations
+            if archiver is not None:
+                archiver.finish(response.trace_summary.to_dict(), (time.perf_counter() - turn_start) * 1000)
+            agent_session.record_turn(response)
             
             # Display AI response
-            display_chat_message(output_text, is_user=False)
+            display_chat_message(output_text, is_user=False, container=placeholder)
+            
+        except AgentBusyError as e:
+            turn_error = e
+            busy_response = "⏳ I'm handling a lot of requests right now. Please try again in a moment."
+            st.session_state.messages.append({"role": "assistant", "content": busy_response})
+            display_chat_message(busy_response, is_user=False, container=placeholder)
+            
+        except CircuitOpenError as e:
+            turn_error = e
+            unavailable_response = "⚠️ The AI service is currently degraded, so requests are paused briefly. Please try again in a minute."
+            st.session_state.messages.append({"role": "assistant", "content": unavailable_response})
+            display_chat_message(unavailable_response, is_user=False, container=placeholder)
             
         except Exception as e:
+            turn_error = e
+            logger.exception("Agent turn failed")
+            placeholder.empty()
             st.error(f"❌ Error: {str(e)}")
             st.info("Please check your connection and try again.")
+        finally:
+            # Failed turns are archived too, with the time they ran before failing
+            if archiver is not None and turn_error is not None:
+                archiver.finish(response.trace_summary.to_dict(), (time.perf_counter() - turn_start) * 1000,
+                                turn_error)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
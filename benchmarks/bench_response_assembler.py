@@ -0,0 +1,93 @@
+"""Micro-benchmark for assembling streamed agent output.
+
+Compares the old ``output_text += chunk.decode()`` loop with ResponseAssembler
+on multi-megabyte outputs split into thousands of chunks. The text contains
+multi-byte characters and chunks are cut at arbitrary byte offsets, so the
+naive loop has to be fed whole characters while the assembler is not. The
+assembler is there for correct decoding of split characters, not speed: it
+is typically slower than the naive loop, and this shows by how much.
+
+Run from the repository root:
+
+    python benchmarks/bench_response_assembler.py
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.response_assembler import ResponseAssembler  # noqa: E402
+
+SAMPLE = "AWS gold support for $10k consumption costs ≈ A$1,250/month — 💰 estimate. "
+
+
+def make_chunks(total_bytes, chunk_count, whole_characters):
+    data = (SAMPLE * (total_bytes // len(SAMPLE.encode()) + 1)).encode()
+    # Cut on a character boundary so the whole output is valid UTF-8
+    end = total_bytes
+    while end < len(data) and (data[end] & 0xC0) == 0x80:
+        end += 1
+    data = data[:end]
+    size = max(1, len(data) // chunk_count)
+    chunks = []
+    start = 0
+    while start < len(data):
+        end = min(start + size, len(data))
+        if whole_characters:
+            # Move the cut forward past UTF-8 continuation bytes
+            while end < len(data) and (data[end] & 0xC0) == 0x80:
+                end += 1
+        chunks.append(data[start:end])
+        start = end
+    return chunks
+
+
+def naive(chunks):
+    output_text = ""
+    for chunk in chunks:
+        output_text = output_text + chunk.decode()
+    return output_text
+
+
+def assembled(chunks):
+    assembler = ResponseAssembler()
+    parts = [assembler.feed(chunk) for chunk in chunks]
+    parts.append(assembler.finish())
+    return "".join(parts)
+
+
+def best_of(func, chunks, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(chunks)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1,2,4,8", help="Comma separated output sizes in MB")
+    parser.add_argument("--chunk-bytes", type=int, default=512, help="Approximate bytes per chunk")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'chunks':>8} {'naive s':>10} {'assembler s':>12} {'assembler ns/byte':>18}")
+    for size_mb in [float(size) for size in args.sizes.split(",")]:
+        total_bytes = int(size_mb * 1024 * 1024)
+        chunk_count = max(1, total_bytes // args.chunk_bytes)
+        whole = make_chunks(total_bytes, chunk_count, whole_characters=True)
+        split = make_chunks(total_bytes, chunk_count, whole_characters=False)
+
+        assert assembled(split) == naive(whole)
+
+        naive_time = best_of(naive, whole, args.repeat)
+        assembler_time = best_of(assembled, split, args.repeat)
+        print(f"{size_mb:>5}M {len(split):>8} {naive_time:>10.4f} {assembler_time:>12.4f} "
+              f"{assembler_time / total_bytes * 1e9:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
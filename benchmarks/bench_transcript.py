@@ -0,0 +1,62 @@
+"""Per-turn transcript render cost as a conversation grows.
+
+Simulates a session turn by turn and times what each rerun builds and sends
+for the transcript: the old loop that rebuilt one HTML blob per message, and
+ui.transcript's window with its per-conversation HTML cache. Streamlit itself is not started; the HTML
+byte count stands in for the websocket payload.
+
+Run from the repository root:
+
+    python benchmarks/bench_transcript.py --messages 1000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ui.transcript import TRANSCRIPT_WINDOW, build_message_html, transcript_html  # noqa: E402
+
+ANSWER = ("For AWS with gold support and $10,000 monthly consumption the estimated hosting cost is "
+          "<b>$11,250</b> per month, including a 12.5% support uplift. ") * 4
+
+
+def full_render(messages):
+    return [build_message_html(message["content"], message["role"] == "user") for message in messages]
+
+
+def windowed_render(messages, window, cache):
+    return [transcript_html(messages, max(0, len(messages) - window), cache=cache)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000, help="Messages in the final conversation")
+    parser.add_argument("--window", type=int, default=TRANSCRIPT_WINDOW)
+    parser.add_argument("--report-every", type=int, default=100)
+    args = parser.parse_args()
+
+    messages = []
+    cache = {}
+    print(f"{'messages':>8} {'full ms':>9} {'full KB':>9} {'window ms':>10} {'window KB':>10}")
+    for turn in range(args.messages // 2):
+        messages.append({"role": "user", "content": f"Turn {turn}: AWS, gold support, $10k consumption"})
+        messages.append({"role": "assistant", "content": f"{ANSWER} (turn {turn})"})
+
+        start = time.perf_counter()
+        full = full_render(messages)
+        full_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        windowed = windowed_render(messages, args.window, cache)
+        window_ms = (time.perf_counter() - start) * 1000
+
+        if len(messages) % args.report_every == 0:
+            full_kb = sum(len(part) for part in full) / 1024
+            window_kb = sum(len(part) for part in windowed) / 1024
+            print(f"{len(messages):>8} {full_ms:>9.3f} {full_kb:>9.1f} {window_ms:>10.3f} {window_kb:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Local stand-in for the bedrock-agent-runtime client.
+
+invoke_agent() returns a completion stream with the same event shapes as the
+real EventStream: trace events for pre-processing, orchestration and
+post-processing, answer chunks as UTF-8 bytes, and chunk attributions
+carrying knowledge base citations. Latency and size are configurable, and
+sleeping happens while the stream is consumed, as it does with a real
+agent.
+"""
+import random
+import time
+
+ANSWER_TEXT = ("For AWS with gold support and $10,000 monthly consumption the estimated hosting cost is "
+               "$11,250 per month, including a 12.5% support uplift. ")
+
+
+class FakeAgentRuntimeClient:
+    def __init__(self, first_chunk_ms=800.0, chunk_interval_ms=40.0, chunks=20, chunk_bytes=120,
+                 trace_steps=4, citations=2, jitter=0.2, seed=None):
+        self.first_chunk_ms = first_chunk_ms
+        self.chunk_interval_ms = chunk_interval_ms
+        self.chunks = chunks
+        self.chunk_bytes = chunk_bytes
+        self.trace_steps = trace_steps
+        self.citations = citations
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    def _sleep(self, milliseconds):
+        if milliseconds > 0:
+            time.sleep(milliseconds * self._random.uniform(1 - self.jitter, 1 + self.jitter) / 1000)
+
+    def _chunk_text(self, index):
+        text = (ANSWER_TEXT * (self.chunk_bytes // len(ANSWER_TEXT) + 1))[:self.chunk_bytes]
+        return f"[{index}] {text}".encode()
+
+    def _citation(self, index):
+        return {
+            "generatedResponsePart": {"textResponsePart": {"text": ANSWER_TEXT, "span": {"start": 0, "end": 40}}},
+            "retrievedReferences": [{
+                "content": {"text": "Gold support adds 12.5% to the monthly consumption."},
+                "location": {
+                    "type": "S3",
+                    "s3Location": {"uri": f"s3://cost-calculator-kb/pricing/support-tiers-{index}.pdf"}
+                },
+                "metadata": {"x-amz-bedrock-kb-chunk-id": f"chunk-{index}"}
+            }]
+        }
+
+    def _trace(self, session_id, step):
+        if step == 0:
+            trace = {"preProcessingTrace": {"modelInvocationOutput": {
+                "parsedResponse": {"isValid": True, "rationale": "The question is about hosting costs."},
+                "metadata": {"usage": {"inputTokens": 900, "outputTokens": 60}}
+            }}}
+        elif step == self.trace_steps - 1:
+            trace = {"postProcessingTrace": {"modelInvocationOutput": {
+                "parsedResponse": {"text": "Final answer formatted."},
+                "metadata": {"usage": {"inputTokens": 400, "outputTokens": 120}}
+            }}}
+        elif step % 2:
+            trace = {"orchestrationTrace": {"rationale": {"text": "Look up the support uplift in the knowledge base."}}}
+        else:
+            trace = {"orchestrationTrace": {"modelInvocationOutput": {
+                "rawResponse": {"content": "Thought: I have the pricing."},
+                "metadata": {"usage": {"inputTokens": 2500, "outputTokens": 180}}
+            }}}
+        return {"trace": {"agentId": "FAKEAGENT", "sessionId": session_id, "trace": trace}}
+
+    def _completion(self, session_id, enable_trace):
+        self._sleep(self.first_chunk_ms)
+        if enable_trace:
+            for step in range(self.trace_steps):
+                yield self._trace(session_id, step)
+        for index in range(self.chunks):
+            if index:
+                self._sleep(self.chunk_interval_ms)
+            chunk = {"bytes": self._chunk_text(index)}
+            if index < self.citations:
+                chunk["attribution"] = {"citations": [self._citation(index)]}
+            yield {"chunk": chunk}
+
+    def invoke_agent(self, agentId, agentAliasId, sessionId, inputText, enableTrace=False, **kwargs):
+        self.calls += 1
+        return {
+            "completion": self._completion(sessionId, enableTrace),
+            "contentType": "text/plain",
+            "sessionId": sessionId
+        }
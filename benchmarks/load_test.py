@@ -0,0 +1,226 @@
+"""Load test of chat turns against a local fake Bedrock agent runtime.
+
+Each simulated user runs its turns on its own thread. The "direct" mode
+drives services.bedrock_agent_runtime.stream_agent the way the apps do, and
+so includes the invocation limiter, retries, trace handling and the session
+conversation store. The "apptest" mode runs a whole app script through
+Streamlit's AppTest instead. It is much heavier, so use lower user counts.
+app.py and app-ecs.py need a Cognito login, so AppTest defaults to
+app_simple.py.
+
+Reports turns/sec, p50/p95/p99 turn latency, time to first chunk (direct
+mode only) and RSS growth per simulated session for each user count. Turns
+rejected by the invocation limiter are counted as busy. Raise
+BEDROCK_AGENT_MAX_IN_FLIGHT and BEDROCK_AGENT_MAX_QUEUED to test beyond the
+default limits.
+
+Run from the repository root:
+
+    make load-test
+    python benchmarks/load_test.py --users 1,10,100,500 --turns 5 --first-chunk-ms 800
+    python benchmarks/load_test.py --mode apptest --users 1,10 --turns 3
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import gc
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_agent_runtime import FakeAgentRuntimeClient  # noqa: E402
+from services import bedrock_agent_runtime  # noqa: E402
+from services.concurrency import AgentBusyError  # noqa: E402
+from services.conversation import Conversation  # noqa: E402
+from services.trace_policy import TracePolicy, TRACE_OFF  # noqa: E402
+
+AGENT_ID = "FAKEAGENT"
+AGENT_ALIAS_ID = "FAKEALIAS"
+PROMPT = "Turn {turn}: AWS, gold support, $10k monthly consumption"
+
+
+def current_rss_bytes():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Peak rather than current RSS, but the best available off Linux
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Results:
+    def __init__(self):
+        self.latencies_ms = []
+        self.first_chunk_ms = []
+        self.busy = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def turn(self, latency_ms, first_chunk_ms=None):
+        with self._lock:
+            self.latencies_ms.append(latency_ms)
+            if first_chunk_ms is not None:
+                self.first_chunk_ms.append(first_chunk_ms)
+
+    def failure(self, busy):
+        with self._lock:
+            if busy:
+                self.busy += 1
+            else:
+                self.errors += 1
+
+
+def direct_user(turns, think_ms, trace_policy, results):
+    """One simulated session; returns its conversation so it stays alive until RSS is measured"""
+    session_id = str(uuid.uuid4())
+    conversation = Conversation()
+    for turn in range(turns):
+        prompt = PROMPT.format(turn=turn)
+        conversation.add("user", prompt)
+        start = time.perf_counter()
+        first_chunk_ms = None
+        response = bedrock_agent_runtime.AgentResponse(trace_policy)
+        try:
+            for event in bedrock_agent_runtime.stream_agent(AGENT_ID, AGENT_ALIAS_ID, session_id, prompt,
+                                                            stream_final_response=True,
+                                                            trace_policy=trace_policy):
+                response.add(event)
+                if first_chunk_ms is None and isinstance(event, bedrock_agent_runtime.ChunkEvent):
+                    first_chunk_ms = (time.perf_counter() - start) * 1000
+        except AgentBusyError:
+            results.failure(busy=True)
+            continue
+        except Exception:
+            results.failure(busy=False)
+            continue
+        conversation.add("assistant", response.output_text)
+        results.turn((time.perf_counter() - start) * 1000, first_chunk_ms)
+        if think_ms:
+            time.sleep(think_ms / 1000)
+    return conversation
+
+
+def apptest_user(app, turns, think_ms, results):
+    from streamlit.testing.v1 import AppTest
+
+    app_test = AppTest.from_file(os.path.join(ROOT, app), default_timeout=120)
+    app_test.run()
+    for turn in range(turns):
+        start = time.perf_counter()
+        app_test.chat_input[0].set_value(PROMPT.format(turn=turn)).run()
+        if app_test.exception:
+            results.failure(busy=False)
+            continue
+        results.turn((time.perf_counter() - start) * 1000)
+        if think_ms:
+            time.sleep(think_ms / 1000)
+    return app_test
+
+
+def run_level(users, args, trace_policy):
+    results = Results()
+    gc.collect()
+    rss_before = current_rss_bytes()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        if args.mode == "apptest":
+            futures = [pool.submit(apptest_user, args.app, args.turns, args.think_ms, results)
+                       for _ in range(users)]
+        else:
+            futures = [pool.submit(direct_user, args.turns, args.think_ms, trace_policy, results)
+                       for _ in range(users)]
+        # Sessions are kept referenced until RSS has been read
+        sessions = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    rss_per_session = (current_rss_bytes() - rss_before) / users
+    del sessions
+
+    return {
+        "users": users,
+        "turns": len(results.latencies_ms),
+        "busy": results.busy,
+        "errors": results.errors,
+        "turns_per_second": len(results.latencies_ms) / elapsed,
+        "p50_ms": percentile(results.latencies_ms, 0.50),
+        "p95_ms": percentile(results.latencies_ms, 0.95),
+        "p99_ms": percentile(results.latencies_ms, 0.99),
+        "first_chunk_p50_ms": percentile(results.first_chunk_ms, 0.50),
+        "first_chunk_p95_ms": percentile(results.first_chunk_ms, 0.95),
+        "rss_per_session_kb": rss_per_session / 1024
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["direct", "apptest"], default="direct")
+    parser.add_argument("--app", default="app_simple.py", help="App script for --mode apptest")
+    parser.add_argument("--users", default="1,10,100,500", help="Comma-separated simulated user counts")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per simulated user")
+    parser.add_argument("--think-ms", type=float, default=0, help="Pause between a user's turns")
+    parser.add_argument("--first-chunk-ms", type=float, default=800, help="Fake agent delay before the first event")
+    parser.add_argument("--chunk-ms", type=float, default=40, help="Fake agent delay between answer chunks")
+    parser.add_argument("--chunks", type=int, default=20, help="Answer chunks per turn")
+    parser.add_argument("--chunk-bytes", type=int, default=120, help="Bytes per answer chunk")
+    parser.add_argument("--trace", action="store_true", help="Request and keep full traces")
+    parser.add_argument("--history", help="Append results to this JSON lines file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("BEDROCK_AGENT_ID", AGENT_ID)
+    os.environ.setdefault("BEDROCK_AGENT_ALIAS_ID", AGENT_ALIAS_ID)
+    bedrock_agent_runtime.use_client(FakeAgentRuntimeClient(
+        first_chunk_ms=args.first_chunk_ms,
+        chunk_interval_ms=args.chunk_ms,
+        chunks=args.chunks,
+        chunk_bytes=args.chunk_bytes
+    ))
+    trace_policy = TracePolicy.from_env() if args.trace else TracePolicy(TRACE_OFF)
+    if args.mode == "apptest":
+        import streamlit.testing.v1  # noqa: F401
+        # Worker threads have no Streamlit script context, which AppTest handles; silence the warning
+        logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(
+            lambda record: "missing ScriptRunContext" not in record.getMessage()
+        )
+        # The first AppTest run imports Streamlit and the app's modules, which would skew the first level
+        run_level(1, argparse.Namespace(**{**vars(args), "turns": 1}), trace_policy)
+
+    results = []
+    print(f"{'users':>6} {'turns':>6} {'busy':>5} {'errors':>6} {'turns/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'ttfc p50':>9} {'ttfc p95':>9} {'KB/session':>11}")
+    for users in [int(value) for value in args.users.split(",")]:
+        result = run_level(users, args, trace_policy)
+        results.append(result)
+        print(f"{result['users']:>6} {result['turns']:>6} {result['busy']:>5} {result['errors']:>6} "
+              f"{result['turns_per_second']:>8.1f} {result['p50_ms']:>8.0f} {result['p95_ms']:>8.0f} "
+              f"{result['p99_ms']:>8.0f} {result['first_chunk_p50_ms']:>9.0f} {result['first_chunk_p95_ms']:>9.0f} "
+              f"{result['rss_per_session_kb']:>11.1f}")
+
+    if args.history:
+        recorded_at = datetime.now(timezone.utc).isoformat()
+        settings = {key: value for key, value in vars(args).items() if key != "history"}
+        with open(args.history, "a") as history:
+            for result in results:
+                history.write(json.dumps({"recorded_at": recorded_at, "settings": settings, **result}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Cold-start profile for the Streamlit entry points.
+
+Loads each app module in a fresh interpreter under ``python -X importtime``
+(without calling main(), so no Streamlit server or AWS call is involved) and
+reports wall-clock load time plus the most expensive imports. Use
+``--history`` to append results to a JSON lines file and track cold start
+across builds.
+
+Run from the repository root:
+
+    make startup-bench
+    python benchmarks/startup_bench.py app.py app-ecs.py --top 15
+"""
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_APPS = ["app.py", "app-ecs.py", "app_final.py", "app_simple.py", "app-original.py"]
+
+# Loads the file as a module named "app" so the `if __name__ == "__main__"` guard skips main()
+LOADER = """
+import importlib.util, sys, time
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("app", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print(f"LOAD_SECONDS {time.perf_counter() - start:.6f}")
+"""
+
+
+def run_once(app_path, importtime):
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", LOADER, app_path]
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()
+        raise RuntimeError(error[-1] if error else f"exit code {result.returncode}")
+    seconds = None
+    for line in result.stdout.splitlines():
+        if line.startswith("LOAD_SECONDS "):
+            seconds = float(line.split()[1])
+    return seconds, result.stderr
+
+
+def parse_importtime(stderr):
+    """Return {top-level package: cumulative microseconds} from -X importtime output"""
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nested imports are indented further; counting only top-level entries avoids double counting
+        if name.startswith("  "):
+            continue
+        top_level = name.strip().split(".")[0]
+        packages[top_level] = packages.get(top_level, 0) + int(cumulative_us)
+    return packages
+
+
+def profile(app, repeat, top):
+    app_path = os.path.join(ROOT, app)
+    timings = [run_once(app_path, importtime=False)[0] for _ in range(repeat)]
+    _, stderr = run_once(app_path, importtime=True)
+    packages = parse_importtime(stderr)
+    return {
+        "app": app,
+        "median_seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+        "top_imports": sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("apps", nargs="*", default=DEFAULT_APPS)
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per app for the timing")
+    parser.add_argument("--top", type=int, default=10, help="Number of most expensive imports to list")
+    parser.add_argument("--history", help="Append results to this JSON lines file")
+    args = parser.parse_args()
+
+    results = []
+    for app in args.apps:
+        try:
+            result = profile(app, args.repeat, args.top)
+        except RuntimeError as e:
+            print(f"{app}: failed to load ({e})")
+            continue
+        results.append(result)
+        print(f"{app}: median {result['median_seconds'] * 1000:.1f} ms, min {result['min_seconds'] * 1000:.1f} ms")
+        for package, cumulative_us in result["top_imports"]:
+            print(f"    {cumulative_us / 1000:8.1f} ms  {package}")
+
+    if args.history and results:
+        recorded_at = datetime.now(timezone.utc).isoformat()
+        with open(args.history, "a") as history:
+            for result in results:
+                history.write(json.dumps({"recorded_at": recorded_at, **result}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,70 +1,266 @@
-import boto3
 import os
 import logging
-from botocore.exceptions import ClientError
-from typing import Dict, Optional
+import threading
+import time
+from botocore.exceptions import BotoCoreError, ClientError
+from typing import Dict, Iterable, Optional
+from services import client_pool
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_TTL_SECONDS = float(os.getenv('PARAMETER_STORE_TTL_SECONDS', '300'))
+REFRESH_INTERVAL_SECONDS = float(os.getenv('PARAMETER_STORE_REFRESH_SECONDS', '60'))
+# A failed path fetch is remembered this long, so callers fall back without asking SSM on every read
+ERROR_TTL_SECONDS = float(os.getenv('PARAMETER_STORE_ERROR_TTL_SECONDS', '30'))
+# GetParameters accepts at most 10 names per call
+GET_PARAMETERS_BATCH_SIZE = 10
+
+
+class _CacheEntry:
+    __slots__ = ("value", "fetched_at", "ttl", "decrypt")
+
+    def __init__(self, value, ttl: float, decrypt: bool = True):
+        self.value = value
+        self.fetched_at = time.monotonic()
+        self.ttl = ttl
+        # Refreshes use the same WithDecryption flag as the first fetch
+        self.decrypt = decrypt
+
+    @property
+    def stale(self) -> bool:
+        return time.monotonic() - self.fetched_at >= self.ttl
+
+
+def _requested_names(param):
+    """Names a GetParameters result may have been requested by.
+
+    The result's Name is always the bare name, so a request by ARN or with a
+    version or label selector (/app/x:3, /app/x:prod) is matched through the
+    result's ARN and Selector.
+    """
+    selector = param.get('Selector', '')
+    names = [param['Name'] + selector]
+    if param.get('ARN'):
+        names.append(param['ARN'] + selector)
+    return names
+
+
 class ParameterStoreConfig:
-    def __init__(self, region: str = None):
+    """Parameter Store reader with per-key TTLs and stale-while-revalidate reads.
+
+    Stale values are returned immediately while a background refresh fetches
+    the new value, so reads only block on SSM the first time a key is seen.
+    Use get_config_store() for the process-wide instance.
+    """
+
+    def __init__(self, region: str = None, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 refresh_interval: float = REFRESH_INTERVAL_SECONDS, error_ttl_seconds: float = ERROR_TTL_SECONDS):
         self.region = region or os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
-        self.ssm_client = boto3.client('ssm', region_name=self.region)
+        self.ssm_client = client_pool.get_client('ssm', region_name=self.region)
+        self.ttl_seconds = ttl_seconds
+        self.error_ttl_seconds = error_ttl_seconds
+        self.refresh_interval = refresh_interval
         self._cache = {}
-    
-    def get_parameter(self, parameter_name: str, decrypt: bool = True) -> Optional[str]:
-        """Get a single parameter from Parameter Store"""
-        try:
+        self._paths = {}
+        self._ttls = {}
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresher = None
+        self._stop = threading.Event()
+
+    def set_ttl(self, parameter_name: str, ttl_seconds: float):
+        """Override the TTL for one parameter, e.g. to refresh feature flags more often"""
+        with self._lock:
+            self._ttls[parameter_name] = ttl_seconds
             if parameter_name in self._cache:
-                return self._cache[parameter_name]
-            
-            response = self.ssm_client.get_parameter(
-                Name=parameter_name,
-                WithDecryption=decrypt
-            )
-            value = response['Parameter']['Value']
-            self._cache[parameter_name] = value
-            return value
-            
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'ParameterNotFound':
-                logger.warning(f"Parameter {parameter_name} not found in Parameter Store")
-                return None
-            else:
-                logger.error(f"Error retrieving parameter {parameter_name}: {e}")
+                self._cache[parameter_name].ttl = ttl_seconds
+
+    def _store(self, name: str, value, decrypt: bool):
+        self._cache[name] = _CacheEntry(value, self._ttls.get(name, self.ttl_seconds), decrypt)
+
+    def _fetch_parameters(self, names, decrypt: bool) -> Dict[str, Optional[str]]:
+        values = {}
+        for start in range(0, len(names), GET_PARAMETERS_BATCH_SIZE):
+            batch = names[start:start + GET_PARAMETERS_BATCH_SIZE]
+            response = self.ssm_client.get_parameters(Names=batch, WithDecryption=decrypt)
+            requested = set(batch)
+            for param in response['Parameters']:
+                for name in _requested_names(param):
+                    if name in requested:
+                        values[name] = param['Value']
+            for name in response.get('InvalidParameters', []):
+                logger.warning(f"Parameter {name} not found in Parameter Store")
+                values[name] = None
+        with self._lock:
+            for name, value in values.items():
+                self._store(name, value, decrypt)
+        return values
+
+    def _revalidate_in_background(self, names, decrypt: bool):
+        with self._lock:
+            names = [name for name in names if name not in self._refreshing]
+            self._refreshing.update(names)
+        if not names:
+            return
+
+        def revalidate():
+            try:
+                self._fetch_parameters(names, decrypt)
+            except Exception as e:
+                logger.warning(f"Background refresh of {', '.join(names)} failed, keeping stale values: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update(names)
+
+        threading.Thread(target=revalidate, name="parameter-store-revalidate", daemon=True).start()
+
+    def get_parameters(self, parameter_names: Iterable[str], decrypt: bool = True) -> Dict[str, Optional[str]]:
+        """Get several parameters, fetching missing ones with batched GetParameters calls"""
+        parameter_names = list(parameter_names)
+        values = {}
+        missing = []
+        stale = []
+        with self._lock:
+            for name in parameter_names:
+                entry = self._cache.get(name)
+                if entry is None:
+                    missing.append(name)
+                    continue
+                values[name] = entry.value
+                if entry.stale:
+                    stale.append(name)
+        if stale:
+            self._revalidate_in_background(stale, decrypt)
+        if missing:
+            try:
+                values.update(self._fetch_parameters(missing, decrypt))
+            except ClientError as e:
+                logger.error(f"Error retrieving parameters {', '.join(missing)}: {e}")
                 raise
-    
+        self._start_refresher()
+        return values
+
+    def get_parameter(self, parameter_name: str, decrypt: bool = True) -> Optional[str]:
+        """Get a single parameter from Parameter Store"""
+        return self.get_parameters([parameter_name], decrypt)[parameter_name]
+
+    def _fetch_by_path(self, path: str, decrypt: bool) -> Dict[str, str]:
+        parameters = {}
+        paginator = self.ssm_client.get_paginator('get_parameters_by_path')
+
+        for page in paginator.paginate(
+            Path=path,
+            Recursive=True,
+            WithDecryption=decrypt
+        ):
+            for param in page['Parameters']:
+                # Remove path prefix from parameter name
+                key = param['Name'].replace(path, '').lstrip('/')
+                parameters[key] = param['Value']
+
+        with self._lock:
+            for key, value in parameters.items():
+                self._store(f"{path.rstrip('/')}/{key}", value, decrypt)
+            self._paths[path] = _CacheEntry((parameters, decrypt), self.ttl_seconds)
+        return parameters
+
     def get_parameters_by_path(self, path: str, decrypt: bool = True) -> Dict[str, str]:
-        """Get multiple parameters by path prefix"""
+        """Get multiple parameters by path prefix, or an empty dict while the path cannot be read"""
+        with self._lock:
+            entry = self._paths.get(path)
+        if entry is not None:
+            parameters = entry.value[0]
+            if parameters is None:
+                # A recent fetch failed; fetch again only once the error TTL has run out
+                if not entry.stale:
+                    return {}
+            else:
+                if entry.stale:
+                    self._revalidate_path_in_background(path, decrypt)
+                return dict(parameters)
         try:
-            parameters = {}
-            paginator = self.ssm_client.get_paginator('get_parameters_by_path')
-            
-            for page in paginator.paginate(
-                Path=path,
-                Recursive=True,
-                WithDecryption=decrypt
-            ):
-                for param in page['Parameters']:
-                    # Remove path prefix from parameter name
-                    key = param['Name'].replace(path, '').lstrip('/')
-                    parameters[key] = param['Value']
-                    self._cache[param['Name']] = param['Value']
-            
-            return parameters
-            
-        except ClientError as e:
+            parameters = self._fetch_by_path(path, decrypt)
+        except (BotoCoreError, ClientError) as e:
             logger.error(f"Error retrieving parameters by path {path}: {e}")
-            raise
+            with self._lock:
+                self._paths[path] = _CacheEntry((None, decrypt), self.error_ttl_seconds)
+            parameters = {}
+        self._start_refresher()
+        return dict(parameters)
+
+    def _revalidate_path_in_background(self, path: str, decrypt: bool):
+        key = ("path", path)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def revalidate():
+            try:
+                self._fetch_by_path(path, decrypt)
+            except Exception as e:
+                logger.warning(f"Background refresh of {path} failed, keeping stale values: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=revalidate, name="parameter-store-revalidate", daemon=True).start()
+
+    def _start_refresher(self):
+        if self.refresh_interval <= 0:
+            return
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, name="parameter-store-refresher",
+                                               daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        """Pick up config changes without restarts: one GetParametersByPath per cached path each interval"""
+        while not self._stop.wait(self.refresh_interval):
+            with self._lock:
+                paths = {path: entry.value[1] for path, entry in self._paths.items() if entry.stale}
+                prefixes = tuple(path.rstrip('/') + '/' for path in self._paths)
+                names = {}
+                for name, entry in self._cache.items():
+                    if entry.stale and not name.startswith(prefixes):
+                        names.setdefault(entry.decrypt, []).append(name)
+            for path, decrypt in paths.items():
+                try:
+                    self._fetch_by_path(path, decrypt)
+                except Exception as e:
+                    logger.warning(f"Background refresh of {path} failed, keeping stale values: {e}")
+            for decrypt, decrypt_names in names.items():
+                try:
+                    self._fetch_parameters(decrypt_names, decrypt)
+                except Exception as e:
+                    logger.warning(f"Background refresh of parameters failed, keeping stale values: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+
+_config_store = None
+_config_store_lock = threading.Lock()
+
+
+def get_config_store() -> ParameterStoreConfig:
+    """Process-wide ParameterStoreConfig shared by every caller"""
+    global _config_store
+    with _config_store_lock:
+        if _config_store is None:
+            _config_store = ParameterStoreConfig()
+        return _config_store
+
 
 def get_app_config() -> Dict[str, str]:
     """Get application configuration from Parameter Store"""
-    config = ParameterStoreConfig()
     app_path = "/bedrock-ai-app"
-    
+
     # Try to get parameters from Parameter Store first
     try:
-        params = config.get_parameters_by_path(app_path)
+        params = get_config_store().get_parameters_by_path(app_path)
         if params:
             logger.info("Configuration loaded from Parameter Store")
             return {
@@ -76,7 +272,7 @@ def get_app_config() -> Dict[str, str]:
             }
     except Exception as e:
         logger.warning(f"Failed to load from Parameter Store: {e}")
-    
+
     # Fallback to environment variables
     logger.info("Falling back to environment variables")
     return {
@@ -85,4 +281,4 @@ def get_app_config() -> Dict[str, str]:
         'ui_title': os.getenv('BEDROCK_AGENT_TEST_UI_TITLE', 'AI-Powered Assistant'),
         'ui_icon': os.getenv('BEDROCK_AGENT_TEST_UI_ICON', '🤖'),
         'aws_region': os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,342 @@
+"""Route agent calls across several agent, alias and region targets.
+
+Targets come from BEDROCK_AGENT_ROUTES, a JSON list such as
+[{"agent_id": "A1", "agent_alias_id": "L1", "region": "ap-southeast-2", "weight": 3},
+ {"agent_id": "A2", "agent_alias_id": "L2", "region": "us-west-2"}].
+Without it the app's own agent, alias and region are the only target.
+
+Bedrock keeps session memory per agent, so a turn served by another target
+does not see the earlier turns of the conversation.
+"""
+from dataclasses import dataclass
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from services import bedrock_agent_runtime, resilience, telemetry
+from services.concurrency import AgentBusyError
+
+logger = logging.getLogger(__name__)
+
+ROUTING_WEIGHTED = "weighted"
+ROUTING_LATENCY = "latency"
+
+ROUTING_STRATEGY = os.getenv('BEDROCK_AGENT_ROUTING', ROUTING_WEIGHTED).lower()
+# Start a second target when the first has not produced an answer chunk in this many ms; off when unset
+HEDGE_AFTER_MS = os.getenv('BEDROCK_AGENT_HEDGE_AFTER_MS')
+EWMA_ALPHA = float(os.getenv('BEDROCK_AGENT_ROUTING_EWMA_ALPHA', '0.2'))
+# Share of latency-routed calls sent to a random target so slow targets get re-measured
+EXPLORATION_RATE = 0.05
+
+_END = object()
+
+
+@dataclass(frozen=True)
+class AgentTarget:
+    agent_id: str
+    agent_alias_id: str
+    region: str = None
+    weight: float = 1.0
+
+    @property
+    def name(self) -> str:
+        return f"{self.region or 'default'}/{self.agent_id}/{self.agent_alias_id}"
+
+
+class AgentRouter:
+    """Chooses a target per call and fails over to the next one when Bedrock is unavailable.
+
+    Weighted routing picks the first target at random by weight; latency
+    routing prefers the lowest moving average turn time. Targets whose
+    region's circuit breaker is open go last. A call fails over only while no
+    answer text, citation or tool invocation has been streamed, so the caller
+    never sees a spliced answer. Without traces a tool invocation cannot be
+    seen, so an untraced call does not fail over once Bedrock has accepted it.
+    Each completed call ends with a TargetEvent naming the target that served it.
+
+    With hedge_after_ms, a second target is started when the first has not
+    produced an answer chunk or a traced tool invocation in time, and
+    whichever answers first wins. That includes untraced calls, whose tool
+    invocations cannot be seen. The slower call is abandoned but may already
+    have run action groups, so only enable hedging for agents without side
+    effects.
+    """
+
+    def __init__(self, targets, strategy: str = ROUTING_WEIGHTED, hedge_after_ms: float = None,
+                 ewma_alpha: float = EWMA_ALPHA):
+        if not targets:
+            raise ValueError("At least one agent target is required")
+        if strategy not in (ROUTING_WEIGHTED, ROUTING_LATENCY):
+            raise ValueError(f"Unknown routing strategy {strategy!r}")
+        self.targets = list(targets)
+        self.strategy = strategy
+        self.hedge_after_ms = hedge_after_ms
+        self.ewma_alpha = ewma_alpha
+        self._lock = threading.Lock()
+        self._latency_ms = {}
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record_latency(self, target: AgentTarget, latency_ms: float):
+        with self._lock:
+            previous = self._latency_ms.get(target)
+            self._latency_ms[target] = latency_ms if previous is None else (
+                self.ewma_alpha * latency_ms + (1 - self.ewma_alpha) * previous
+            )
+
+    def _increment(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def ordered_targets(self):
+        """Targets in the order they should be tried for the next call"""
+        if len(self.targets) == 1:
+            return list(self.targets)
+        if self.strategy == ROUTING_LATENCY and random.random() >= EXPLORATION_RATE:
+            with self._lock:
+                latencies = dict(self._latency_ms)
+            # Unmeasured targets sort first so each gets measured
+            ordered = sorted(self.targets, key=lambda target: latencies.get(target, 0.0))
+        else:
+            remaining = list(self.targets)
+            ordered = []
+            while remaining:
+                target = random.choices(remaining, weights=[target.weight for target in remaining])[0]
+                remaining.remove(target)
+                ordered.append(target)
+        # Stable sort: targets whose circuit is not closed keep their relative order at the end
+        return sorted(
+            ordered, key=lambda target: resilience.get_breaker(target.region or _default_region()).state
+            != resilience.CIRCUIT_CLOSED
+        )
+
+    def _open(self, target, session_id, prompt, stream_final_response, trace_policy, cache, session_state,
+              previous_answer):
+        return bedrock_agent_runtime.stream_agent(
+            target.agent_id, target.agent_alias_id, session_id, prompt, region=target.region,
+            stream_final_response=stream_final_response, trace_policy=trace_policy, cache=cache,
+            session_state=session_state, previous_answer=previous_answer
+        )
+
+    def stream(self, session_id, prompt, stream_final_response=False, trace_policy=None, cache=None,
+               session_state=None, previous_answer=None):
+        """Yield the same events as stream_agent from the chosen target, then a TargetEvent for it"""
+        targets = self.ordered_targets()
+        if self.hedge_after_ms is not None and len(targets) > 1:
+            yield from self._hedged_stream(targets, session_id, prompt, stream_final_response, trace_policy, cache,
+                                           session_state, previous_answer)
+            return
+
+        for index, target in enumerate(targets):
+            start = time.perf_counter()
+            committed = False
+            try:
+                for event in self._open(target, session_id, prompt, stream_final_response, trace_policy, cache,
+                                        session_state, previous_answer):
+                    committed = committed or bedrock_agent_runtime.is_committed(event)
+                    yield event
+            except AgentBusyError:
+                # The invocation limit is per process, another target would be refused too
+                raise
+            except Exception as e:
+                if committed or index == len(targets) - 1 or not _should_fail_over(e):
+                    raise
+                logger.warning(f"Agent target {target.name} failed ({resilience.error_code(e)}), "
+                               f"failing over to {targets[index + 1].name}")
+                self._increment("failovers")
+                continue
+            self.record_latency(target, (time.perf_counter() - start) * 1000)
+            yield _target_event(target)
+            return
+
+    def _hedged_stream(self, targets, session_id, prompt, stream_final_response, trace_policy, cache, session_state,
+                       previous_answer):
+        events = queue.Queue()
+        cancel_events = []
+        started = []
+
+        def pump(attempt, target, cancelled):
+            stream = self._open(target, session_id, prompt, stream_final_response, trace_policy, cache, session_state,
+                                previous_answer)
+            try:
+                for event in stream:
+                    if cancelled.is_set():
+                        return
+                    events.put((attempt, event))
+                events.put((attempt, _END))
+            except Exception as e:
+                events.put((attempt, e))
+            finally:
+                stream.close()
+
+        def start_attempt():
+            attempt = len(started)
+            cancelled = threading.Event()
+            cancel_events.append(cancelled)
+            started.append((targets[attempt], time.perf_counter()))
+            # The copied context carries the turn's log correlation fields into the thread
+            threading.Thread(target=contextvars.copy_context().run, args=(pump, attempt, targets[attempt], cancelled),
+                             name=f"hedge-{attempt}", daemon=True).start()
+
+        start_attempt()
+        hedge_at = time.monotonic() + self.hedge_after_ms / 1000
+        buffers = {0: []}
+        failed = set()
+        hedged = False
+        winner = None
+        try:
+            while True:
+                timeout = None
+                if winner is None and len(started) < 2 and hedge_at is not None:
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                try:
+                    attempt, item = events.get(timeout=timeout)
+                except queue.Empty:
+                    # Re-running a call that already invoked a tool would repeat its side effect
+                    if not any(_blocks_hedge(event) for event in buffers[0]):
+                        logger.info(f"No answer from {targets[0].name} after {self.hedge_after_ms} ms, "
+                                    f"hedging with {targets[1].name}")
+                        self._increment("hedges")
+                        buffers[1] = []
+                        hedged = True
+                        start_attempt()
+                    else:
+                        hedge_at = None
+                    continue
+
+                if winner is not None and attempt != winner:
+                    continue
+                if isinstance(item, Exception):
+                    failed.add(attempt)
+                    # A refused hedge leaves the primary running; only a refused primary ends the turn early
+                    if attempt == winner or (isinstance(item, AgentBusyError) and attempt == 0):
+                        raise item
+                    if len(failed) < len(started):
+                        continue
+                    if isinstance(item, AgentBusyError):
+                        # The invocation limit is per process, another target would be refused too
+                        raise item
+                    if len(started) < len(targets) and _should_fail_over(item) and not any(
+                        bedrock_agent_runtime.is_committed(event) for event in buffers[attempt]
+                    ):
+                        self._increment("failovers")
+                        buffers[len(started)] = []
+                        start_attempt()
+                        continue
+                    raise item
+                if item is _END:
+                    if winner is None:
+                        winner = attempt
+                        yield from buffers[attempt]
+                    # A target that lost the race took at least this long, which keeps latency routing honest
+                    for other, (target, start) in enumerate(started):
+                        if other == attempt or other not in failed:
+                            self.record_latency(target, (time.perf_counter() - start) * 1000)
+                    yield _target_event(targets[attempt])
+                    return
+                if winner is None:
+                    buffers[attempt].append(item)
+                    if isinstance(item, bedrock_agent_runtime.ChunkEvent):
+                        winner = attempt
+                        if attempt and hedged:
+                            self._increment("hedge_wins")
+                        for other, cancelled in enumerate(cancel_events):
+                            if other != attempt:
+                                cancelled.set()
+                        yield from buffers[attempt]
+                    continue
+                yield item
+        finally:
+            for cancelled in cancel_events:
+                cancelled.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "failovers": self.failovers,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "latency_ms": {target.name: round(latency, 1) for target, latency in self._latency_ms.items()}
+            }
+
+
+def _blocks_hedge(event) -> bool:
+    """Committed events stop a hedge, except the untraced stream marker: hedging already accepts repeated tools"""
+    return bedrock_agent_runtime.is_committed(event) and not isinstance(
+        event, bedrock_agent_runtime.StreamOpenedEvent
+    )
+
+
+def _target_event(target: AgentTarget):
+    return bedrock_agent_runtime.TargetEvent(target.agent_id, target.agent_alias_id, target.region)
+
+
+def _default_region():
+    return os.getenv('AWS_DEFAULT_REGION', 'ap-southeast-2')
+
+
+def _should_fail_over(error) -> bool:
+    """Another target can help when this one is degraded, not when the request itself is bad"""
+    return isinstance(error, resilience.CircuitOpenError) or resilience.is_retryable(error)
+
+
+def router_from_env(agent_id, agent_alias_id, region=None):
+    """Build a router from BEDROCK_AGENT_ROUTES, or one routing only to the given agent"""
+    routes = os.getenv('BEDROCK_AGENT_ROUTES')
+    if routes:
+        targets = [
+            AgentTarget(route["agent_id"], route["agent_alias_id"], route.get("region", region),
+                        float(route.get("weight", 1.0)))
+            for route in json.loads(routes)
+        ]
+    else:
+        targets = [AgentTarget(agent_id, agent_alias_id, region)]
+    return AgentRouter(
+        targets,
+        strategy=ROUTING_STRATEGY,
+        hedge_after_ms=float(HEDGE_AFTER_MS) if HEDGE_AFTER_MS else None
+    )
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_agent_router(agent_id, agent_alias_id, region=None) -> AgentRouter:
+    """Process-wide router for the app's agent, so latency averages are shared by every session"""
+    key = (agent_id, agent_alias_id, region)
+    with _routers_lock:
+        router = _routers.get(key)
+        if router is None:
+            router = _routers[key] = router_from_env(agent_id, agent_alias_id, region)
+        return router
+
+
+def _router_collector():
+    with _routers_lock:
+        routers = list(_routers.values())
+    failovers = hedges = hedge_wins = 0
+    latency_samples = []
+    for router in routers:
+        stats = router.stats()
+        failovers += stats["failovers"]
+        hedges += stats["hedges"]
+        hedge_wins += stats["hedge_wins"]
+        latency_samples += [({"target": name}, latency) for name, latency in stats["latency_ms"].items()]
+    return [
+        ("bedrock_agent_router_failovers_total", "counter", "Agent calls moved to another target",
+         [({}, failovers)]),
+        ("bedrock_agent_router_hedges_total", "counter", "Hedged second calls started", [({}, hedges)]),
+        ("bedrock_agent_router_hedge_wins_total", "counter", "Hedged second calls that answered first",
+         [({}, hedge_wins)]),
+        ("bedrock_agent_router_latency_ewma_ms", "gauge", "Moving average turn time per target",
+         latency_samples),
+    ]
+
+
+telemetry.telemetry.register_collector(_router_collector)
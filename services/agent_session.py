@@ -0,0 +1,187 @@
+"""Rotate the Bedrock agent session of a long chat to keep orchestration prompts short.
+
+The agent keeps every turn of a session in its memory, so each turn's
+orchestration prompt grows with the conversation and gets slower. Once a
+session has run BEDROCK_SESSION_MAX_TURNS turns or used
+BEDROCK_SESSION_MAX_INPUT_TOKENS input tokens, the next turn starts a fresh
+Bedrock session. A short summary of the latest exchanges, built locally
+without a model call, is sent with every turn of the new session as a
+prompt session attribute. The agent's prompt templates must include
+$prompt_session_attributes$ for the agent to see it (the default templates
+do).
+
+The chat keeps its own session ID for history and exports. Session-scoped
+response cache entries follow the Bedrock session, since answers depend on
+the agent's memory. With a history store, the apps save the session's
+generation and summary at each rotation, so a restored chat carries on in
+its latest Bedrock session rather than the oversized original one.
+
+Input tokens are only known for turns that request traces, so with
+BEDROCK_AGENT_TRACE_MODE off (the apps' default) only the turn limit
+rotates sessions.
+"""
+import logging
+import os
+import re
+import threading
+from services import telemetry
+
+logger = logging.getLogger(__name__)
+
+# 0 turns a limit off. Input tokens are only known for turns that request traces, so the
+# token limit never fires with BEDROCK_AGENT_TRACE_MODE off, the apps' default
+MAX_TURNS = int(os.getenv('BEDROCK_SESSION_MAX_TURNS', '20'))
+MAX_INPUT_TOKENS = int(os.getenv('BEDROCK_SESSION_MAX_INPUT_TOKENS', '200000'))
+SUMMARY_TURNS = int(os.getenv('BEDROCK_SESSION_SUMMARY_TURNS', '3'))
+SUMMARY_MAX_CHARS = int(os.getenv('BEDROCK_SESSION_SUMMARY_MAX_CHARS', '1500'))
+SUMMARY_ATTRIBUTE = os.getenv('BEDROCK_SESSION_SUMMARY_ATTRIBUTE', 'conversation_summary')
+
+_TAGS = re.compile(r"<[^>]+>")
+_WHITESPACE = re.compile(r"\s+")
+
+_rotations = 0
+_rotations_lock = threading.Lock()
+
+
+def _clip(text: str, max_chars: int) -> str:
+    text = _WHITESPACE.sub(" ", _TAGS.sub(" ", text)).strip()
+    return text if len(text) <= max_chars else text[:max(0, max_chars - 1)].rstrip() + "…"
+
+
+def recent_exchanges(conversation, count: int, start: int = 0, end: int = None):
+    """Up to count (user message, assistant reply) pairs from conversation[start:end], oldest first.
+
+    Pairs are matched by role, so an unanswered prompt, e.g. after a failed
+    turn, is skipped rather than pairing every later message off by one.
+    """
+    end = len(conversation) if end is None else end
+    window = conversation[start:end]
+    exchanges = []
+    index = len(window) - 1
+    while index > 0 and len(exchanges) < count:
+        if window[index]["role"] == "assistant" and window[index - 1]["role"] == "user":
+            exchanges.append((window[index - 1], window[index]))
+            index -= 2
+        else:
+            index -= 1
+    exchanges.reverse()
+    return exchanges
+
+
+def summarize(messages, previous_summary: str = "", max_chars: int = SUMMARY_MAX_CHARS) -> str:
+    """A bounded plain-text digest: the earlier summary followed by the given recent messages"""
+    lines = []
+    budget = max_chars
+    if previous_summary:
+        lines.append(_clip(f"Earlier: {previous_summary}", max_chars // 3))
+        budget -= len(lines[0]) + 1
+    if messages:
+        per_message = max(40, budget // len(messages) - 1)
+        for message in messages:
+            speaker = "User" if message["role"] == "user" else "Assistant"
+            lines.append(_clip(f"{speaker}: {message['content']}", per_message))
+    return "\n".join(lines)[:max_chars]
+
+
+class AgentSession:
+    """The Bedrock session serving a chat, with the usage that decides when to rotate it"""
+
+    __slots__ = ("conversation_id", "session_id", "generation", "turns", "input_tokens", "summary",
+                 "max_turns", "max_input_tokens", "started_at")
+
+    def __init__(self, conversation_id: str, max_turns: int = MAX_TURNS, max_input_tokens: int = MAX_INPUT_TOKENS):
+        self.conversation_id = conversation_id
+        # The first Bedrock session reuses the chat's ID, so a restored chat continues the agent's memory
+        self.session_id = conversation_id
+        self.generation = 0
+        self.turns = 0
+        self.input_tokens = 0
+        self.summary = ""
+        self.max_turns = max_turns
+        self.max_input_tokens = max_input_tokens
+        # Position in the chat of the first message sent to the current Bedrock session
+        self.started_at = 0
+
+    def to_dict(self):
+        """The state saved with the chat history when the session rotates"""
+        return {"generation": self.generation, "summary": self.summary, "started_at": self.started_at}
+
+    @classmethod
+    def restore(cls, conversation_id: str, state: dict, conversation):
+        """Rebuild the session saved by to_dict for a chat restored from history"""
+        agent_session = cls(conversation_id)
+        agent_session.generation = state["generation"]
+        agent_session.summary = state["summary"]
+        agent_session.started_at = state["started_at"]
+        if agent_session.generation:
+            agent_session.session_id = f"{conversation_id}-{agent_session.generation}"
+        # Token counts are not saved, but replies since the rotation bound the turns
+        agent_session.turns = sum(
+            1 for message in conversation[agent_session.started_at:] if message["role"] == "assistant"
+        )
+        return agent_session
+
+    def should_rotate(self) -> bool:
+        return bool(
+            (self.max_turns and self.turns >= self.max_turns)
+            or (self.max_input_tokens and self.input_tokens >= self.max_input_tokens)
+        )
+
+    def prepare_turn(self, conversation) -> bool:
+        """Call with the chat, ending in the new prompt, before invoking the agent; True when it rotated"""
+        global _rotations
+        if not self.should_rotate():
+            return False
+        # Only exchanges from the ending session; older ones are already in the previous summary
+        exchanges = recent_exchanges(conversation, SUMMARY_TURNS, self.started_at, len(conversation) - 1)
+        self.summary = summarize([message for exchange in exchanges for message in exchange], self.summary)
+        self.generation += 1
+        self.started_at = len(conversation) - 1
+        self.session_id = f"{self.conversation_id}-{self.generation}"
+        logger.info(f"Rotated agent session after {self.turns} turns and {self.input_tokens} input tokens", extra={
+            "conversation_id": self.conversation_id, "summary_chars": len(self.summary)
+        })
+        self.turns = 0
+        self.input_tokens = 0
+        with _rotations_lock:
+            _rotations += 1
+        return True
+
+    def record_turn(self, response):
+        """Count a finished turn; answers from the response cache never reached the agent's memory"""
+        if response.cached:
+            return
+        self.turns += 1
+        self.input_tokens += response.usage.input_tokens
+
+    def session_state(self):
+        """The sessionState for invoke_agent, or None before the first rotation"""
+        if not self.summary:
+            return None
+        return {"promptSessionAttributes": {SUMMARY_ATTRIBUTE: self.summary}}
+
+
+def restore_session(state, agent_session_state):
+    """Install the agent session saved with a chat just restored into a Streamlit session_state"""
+    if agent_session_state:
+        state["agent_session"] = AgentSession.restore(state["session_id"], agent_session_state, state["messages"])
+
+
+def for_conversation(state) -> AgentSession:
+    """The AgentSession kept in a Streamlit session_state, replaced when the chat's session_id changes"""
+    agent_session = state.get("agent_session")
+    if agent_session is None or agent_session.conversation_id != state["session_id"]:
+        agent_session = state["agent_session"] = AgentSession(state["session_id"])
+    return agent_session
+
+
+def _session_collector():
+    with _rotations_lock:
+        rotations = _rotations
+    return [
+        ("bedrock_agent_session_rotations_total", "counter", "Chats moved to a fresh agent session with a summary",
+         [({}, rotations)]),
+    ]
+
+
+telemetry.telemetry.register_collector(_session_collector)
@@ -0,0 +1,96 @@
+"""asyncio counterparts of invoke_agent and stream_agent.
+
+botocore is blocking, so calls run on a dedicated thread pool sized to the
+process-wide invocation limit plus its wait queue. Admission control is shared
+with the synchronous API through services.concurrency.agent_limiter.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import functools
+import logging
+import threading
+from services import bedrock_agent_runtime
+from services.concurrency import agent_limiter
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=agent_limiter.max_in_flight + agent_limiter.max_queued,
+    thread_name_prefix="bedrock-agent"
+)
+
+_STREAM_END = object()
+
+
+async def ainvoke_agent(agent_id, agent_alias_id, session_id, prompt, region=None, trace_policy=None,
+                        timeout: float = None):
+    """Await invoke_agent without blocking the event loop.
+
+    Raises AgentBusyError straight away when the wait queue is full, and
+    asyncio.TimeoutError when the call takes longer than timeout seconds. A
+    timed out call keeps running on its worker thread until Bedrock responds.
+    """
+    agent_limiter.check_capacity()
+    loop = asyncio.get_running_loop()
+    call = functools.partial(
+        bedrock_agent_runtime.invoke_agent,
+        agent_id,
+        agent_alias_id,
+        session_id,
+        prompt,
+        region=region,
+        trace_policy=trace_policy
+    )
+    # Like asyncio.to_thread, so log_context fields set by the caller reach the worker's log lines
+    return await asyncio.wait_for(loop.run_in_executor(_executor, contextvars.copy_context().run, call), timeout)
+
+
+async def astream_agent(agent_id, agent_alias_id, session_id, prompt, region=None, stream_final_response=False,
+                        trace_policy=None):
+    """Async generator over the same events as stream_agent, delivered as they arrive"""
+    agent_limiter.check_capacity()
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # The event loop was closed while the stream was still being read
+            cancelled.set()
+
+    def produce():
+        events = bedrock_agent_runtime.stream_agent(
+            agent_id,
+            agent_alias_id,
+            session_id,
+            prompt,
+            region=region,
+            stream_final_response=stream_final_response,
+            trace_policy=trace_policy
+        )
+        try:
+            for event in events:
+                if cancelled.is_set():
+                    break
+                put(event)
+        except Exception as e:
+            put(e)
+        finally:
+            events.close()
+            put(_STREAM_END)
+
+    loop.run_in_executor(_executor, contextvars.copy_context().run, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # The worker stops at the next event and releases its invocation slot
+        cancelled.set()
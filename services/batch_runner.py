@@ -0,0 +1,246 @@
+"""Run a JSONL file of prompts against a Bedrock agent without the UI.
+
+Each input line is a JSON object with the prompt in `prompt` (see
+--prompt-field), or a bare JSON string. Rows run in parallel on a bounded
+thread pool. Every row gets its own agent session by default. With
+`--session shared`, rows with the same `session` value (or all rows, when
+there is none) share one session and run in order. Results are appended to
+the output JSONL as each row finishes, so the output doubles as the
+checkpoint. `--resume` skips rows that already have a successful result.
+
+Agent calls normally share the process-wide invocation limiter
+(BEDROCK_AGENT_MAX_IN_FLIGHT). The runner resizes it to `--concurrency`, so
+every worker thread always gets a slot and rows do not fail with
+AgentBusyError while Bedrock is healthy.
+
+Usage:
+
+    python -m services.batch_runner prompts.jsonl --output results.jsonl \\
+        --agent-id AGENT --agent-alias-id ALIAS --concurrency 16 --resume --parquet results.parquet
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from services import bedrock_agent_runtime
+from services.concurrency import agent_limiter
+from services.structured_logging import FORMAT_TEXT, configure_logging, log_context
+from services.trace_policy import TRACE_MODES, TRACE_SUMMARY, TracePolicy
+
+logger = logging.getLogger(__name__)
+
+SESSION_PER_ROW = "per-row"
+SESSION_SHARED = "shared"
+
+
+def read_rows(path, prompt_field="prompt", id_field="id"):
+    """Yield (row id, prompt, row) for each non-empty input line; ids default to the line number"""
+    with open(path, encoding="utf-8") as input_file:
+        for line_number, line in enumerate(input_file, start=1):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if isinstance(row, str):
+                row = {prompt_field: row}
+            yield str(row.get(id_field, line_number)), row[prompt_field], row
+
+
+def read_checkpoint(path):
+    """Return ({row id: session id} of completed rows, {session key: session id}) from a previous output"""
+    completed, sessions = {}, {}
+    if not os.path.exists(path):
+        return completed, sessions
+    with open(path, encoding="utf-8") as output_file:
+        for line in output_file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short when the previous run was killed
+                continue
+            sessions[result["session_key"]] = result["session_id"]
+            if result.get("error") is None:
+                completed[result["id"]] = result["session_id"]
+    return completed, sessions
+
+
+class ResultWriter:
+    """Appends one JSON line per result and flushes it, so a killed run loses at most the rows in flight"""
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, result):
+        line = json.dumps(result, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def run_prompt(agent_id, agent_alias_id, session_id, prompt, region, trace_policy):
+    start = time.perf_counter()
+    first_chunk_ms = None
+    response = bedrock_agent_runtime.AgentResponse(trace_policy)
+    for event in bedrock_agent_runtime.stream_agent(agent_id, agent_alias_id, session_id, prompt, region=region,
+                                                    stream_final_response=True, trace_policy=trace_policy):
+        response.add(event)
+        if first_chunk_ms is None and isinstance(event, bedrock_agent_runtime.ChunkEvent):
+            first_chunk_ms = (time.perf_counter() - start) * 1000
+    return response, first_chunk_ms, (time.perf_counter() - start) * 1000
+
+
+def run_group(rows, session_key, session_id, args, trace_policy, writer):
+    """Run rows that share a session one after another; returns the results written"""
+    results = []
+    for row_id, prompt, _ in rows:
+        result = {
+            "id": row_id,
+            "prompt": prompt,
+            "agent_id": args.agent_id,
+            "agent_alias_id": args.agent_alias_id,
+            "session_key": session_key,
+            "session_id": session_id,
+            "error": None
+        }
+        try:
+            with log_context(row_id=row_id):
+                response, first_chunk_ms, latency_ms = run_prompt(
+                    args.agent_id, args.agent_alias_id, session_id, prompt, args.region, trace_policy
+                )
+            result.update({
+                "output_text": response.output_text,
+                "citations": response.citations,
+                "trace_summary": response.trace_summary.to_dict(),
+                "usage": response.usage.to_dict(),
+                "first_chunk_ms": first_chunk_ms,
+                "latency_ms": latency_ms
+            })
+            if trace_policy.keep_full_trace:
+                result["trace"] = response.trace
+        except Exception as e:
+            logger.warning(f"Row {row_id} failed: {e}")
+            result["error"] = f"{type(e).__name__}: {e}"
+        writer.write(result)
+        results.append(result)
+    return results
+
+
+def group_rows(rows, session_mode, session_field):
+    """Map session key to its rows, in input order"""
+    groups = {}
+    for row_id, prompt, row in rows:
+        if session_mode == SESSION_SHARED:
+            key = str(row.get(session_field, SESSION_SHARED))
+        else:
+            key = row_id
+        groups.setdefault(key, []).append((row_id, prompt, row))
+    return groups
+
+
+def write_parquet(jsonl_path, parquet_path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Writing Parquet needs pyarrow: pip install pyarrow")
+
+    # Keyed by row id, so a row retried by --resume only appears with its latest result
+    records = {}
+    with open(jsonl_path, encoding="utf-8") as output_file:
+        for line in output_file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # Nested fields are kept as JSON text so every row has the same flat schema
+            for field in ("citations", "trace_summary", "usage", "trace"):
+                if field in record:
+                    record[field] = json.dumps(record[field], default=str)
+            records[record["id"]] = record
+    pq.write_table(pa.Table.from_pylist(list(records.values())), parquet_path)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="JSONL file of prompts")
+    parser.add_argument("--output", required=True, help="JSONL file results are appended to")
+    parser.add_argument("--parquet", help="Also write all results in the output to this Parquet file (needs pyarrow)")
+    parser.add_argument("--agent-id", default=os.getenv('BEDROCK_AGENT_ID'))
+    parser.add_argument("--agent-alias-id", default=os.getenv('BEDROCK_AGENT_ALIAS_ID'))
+    parser.add_argument("--region", default=os.getenv('AWS_REGION') or os.getenv('AWS_DEFAULT_REGION'))
+    parser.add_argument("--concurrency", type=int, default=8, help="Sessions run in parallel")
+    parser.add_argument("--session", choices=[SESSION_PER_ROW, SESSION_SHARED], default=SESSION_PER_ROW)
+    parser.add_argument("--session-field", default="session", help="Row field grouping rows with --session shared")
+    parser.add_argument("--prompt-field", default="prompt")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--trace", choices=TRACE_MODES, default=TRACE_SUMMARY)
+    parser.add_argument("--resume", action="store_true", help="Skip rows that already succeeded in the output")
+    args = parser.parse_args(argv)
+
+    configure_logging(default_format=FORMAT_TEXT)
+    if not args.agent_id or not args.agent_alias_id:
+        parser.error("--agent-id and --agent-alias-id (or BEDROCK_AGENT_ID and BEDROCK_AGENT_ALIAS_ID) are required")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    completed, sessions = read_checkpoint(args.output) if args.resume else ({}, {})
+    rows = [row for row in read_rows(args.input, args.prompt_field, args.id_field) if row[0] not in completed]
+    groups = group_rows(rows, args.session, args.session_field)
+    trace_policy = TracePolicy(args.trace)
+    logger.info(f"Running {len(rows)} prompts in {len(groups)} sessions, {len(completed)} already done")
+
+    # One slot per worker thread; each row holds at most one at a time
+    agent_limiter.resize(args.concurrency)
+    writer = ResultWriter(args.output)
+    start = time.perf_counter()
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="batch") as pool:
+            futures = [
+                # A resumed shared session continues the agent session it started with
+                pool.submit(run_group, group, key, sessions.get(key) or str(uuid.uuid4()), args, trace_policy,
+                            writer)
+                for key, group in groups.items()
+            ]
+            try:
+                for future in as_completed(futures):
+                    done_before = len(results)
+                    results.extend(future.result())
+                    if len(results) // 100 > done_before // 100:
+                        logger.info(f"{len(results)}/{len(rows)} prompts done")
+            except KeyboardInterrupt:
+                logger.warning("Interrupted, waiting for rows in flight; rerun with --resume to continue")
+                pool.shutdown(wait=True, cancel_futures=True)
+                return 130
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    latencies = [result["latency_ms"] for result in results if result["error"] is None]
+    failed = len(results) - len(latencies)
+    logger.info(
+        f"{len(latencies)} succeeded, {failed} failed in {elapsed:.1f}s "
+        f"({len(results) / elapsed if elapsed else 0:.1f} prompts/s), "
+        f"latency p50 {percentile(latencies, 0.5):.0f} ms, p95 {percentile(latencies, 0.95):.0f} ms"
+    )
+    if args.parquet:
+        write_parquet(args.output, args.parquet)
+        logger.info(f"Wrote {args.parquet}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
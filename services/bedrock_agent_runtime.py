@@ -1,57 +1,325 @@
-import boto3
 from botocore.exceptions import ClientError
+from dataclasses import dataclass
 import logging
 import os
+import time
+from services import client_pool, resilience, telemetry
+from services.concurrency import agent_limiter
+from services.response_assembler import ResponseAssembler
+from services.response_cache import ResponseCache
+from services.structured_logging import bind_log_context, log_context
+from services.trace_policy import TRACE_SUMMARY, TracePolicy, TraceSummary
+from services.usage import TurnUsage
 
 logger = logging.getLogger(__name__)
+# Per trace step diagnostics, sampled per turn by LOG_TRACE_SAMPLE_RATE
+trace_logger = logging.getLogger(f"{__name__}.trace")
 
+TRACE_TYPES = ["guardrailTrace", "preProcessingTrace", "orchestrationTrace", "postProcessingTrace"]
 
-def invoke_agent(agent_id, agent_alias_id, session_id, prompt):
-    try:
-        region = os.getenv('AWS_DEFAULT_REGION', 'ap-southeast-2')
-        client = boto3.session.Session().client(service_name="bedrock-agent-runtime", region_name=region)
-        # See https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/bedrock-agent-runtime/client/invoke_agent.html
-        response = client.invoke_agent(
-            agentId=agent_id,
-            agentAliasId=agent_alias_id,
-            enableTrace=True,
-            sessionId=session_id,
-            inputText=prompt
-        )
-
-        output_text = ""
-        citations = []
-        trace = {}
-
-        has_guardrail_trace = False
-        for event in response.get("completion"):
-            # Combine the chunks to get the output text
-            if "chunk" in event:
-                chunk = event["chunk"]
-                output_text += chunk["bytes"].decode()
-                if "attribution" in chunk:
-                    citations += chunk["attribution"]["citations"]
-
-            # Extract trace information from all events
-            if "trace" in event:
-                for trace_type in ["guardrailTrace", "preProcessingTrace", "orchestrationTrace", "postProcessingTrace"]:
-                    if trace_type in event["trace"]["trace"]:
-                        mapped_trace_type = trace_type
-                        if trace_type == "guardrailTrace":
-                            if not has_guardrail_trace:
-                                has_guardrail_trace = True
-                                mapped_trace_type = "preGuardrailTrace"
-                            else:
-                                mapped_trace_type = "postGuardrailTrace"
-                        if trace_type not in trace:
-                            trace[mapped_trace_type] = []
-                        trace[mapped_trace_type].append(event["trace"]["trace"][trace_type])
 
+@dataclass(frozen=True)
+class ChunkEvent:
+    """A piece of the agent's answer text"""
+    text: str
+
+
+@dataclass(frozen=True)
+class CitationEvent:
+    """Knowledge base citations attached to a chunk"""
+    citations: list
+
+
+@dataclass(frozen=True)
+class StreamOpenedEvent:
+    """Sent when an untraced call's response starts streaming.
+
+    Without traces a tool invocation cannot be seen, so the turn counts as
+    committed from here and is not retried once Bedrock has accepted it.
+    """
+
+
+@dataclass(frozen=True)
+class CacheHitEvent:
+    """Sent first when the answer comes from the response cache instead of the agent"""
+    trace_summary: dict
+    saved_ms: float
+
+
+@dataclass(frozen=True)
+class TargetEvent:
+    """Sent by the agent router after a turn completes, naming the target that served it"""
+    agent_id: str
+    agent_alias_id: str
+    region: str = None
+
+
+@dataclass(frozen=True)
+class TraceEvent:
+    """A single trace step; guardrail traces are mapped to pre/post guardrail types"""
+    trace_type: str
+    trace: dict
+    elapsed_ms: float = 0.0
+
+
+class AgentResponse:
+    """Accumulates streamed events into the dict shape returned by invoke_agent.
+
+    Trace steps are always counted in trace_summary and their token usage in
+    usage; the raw steps are only kept in trace when the trace policy asks for
+    full traces, unless keep_trace says otherwise. Each step is also passed to
+    trace_sink.add(trace_type, step) when given, e.g. to archive it without
+    keeping it.
+    """
+
+    def __init__(self, trace_policy: TracePolicy = None, trace_sink=None, keep_trace: bool = None):
+        self._text_parts = []
+        if keep_trace is None:
+            keep_trace = trace_policy is None or trace_policy.keep_full_trace
+        self._keep_full_trace = keep_trace
+        self._trace_sink = trace_sink
+        self.citations = []
+        self.trace = {}
+        self.trace_summary = TraceSummary()
+        self.usage = TurnUsage()
+        self.cached = False
+        # Set when a router chose the target; callers fall back to the alias they asked for
+        self.agent_alias_id = None
+
+    def add(self, event):
+        if isinstance(event, ChunkEvent):
+            self._text_parts.append(event.text)
+        elif isinstance(event, CitationEvent):
+            self.citations += event.citations
+        elif isinstance(event, TraceEvent):
+            self.trace_summary.add(event.trace_type, event.elapsed_ms)
+            self.usage.add_trace(event.trace)
+            if self._keep_full_trace:
+                self.trace.setdefault(event.trace_type, []).append(event.trace)
+            if self._trace_sink is not None:
+                self._trace_sink.add(event.trace_type, event.trace)
+        elif isinstance(event, CacheHitEvent):
+            self.cached = True
+            self.trace_summary = TraceSummary.from_dict(event.trace_summary)
+        elif isinstance(event, TargetEvent):
+            self.agent_alias_id = event.agent_alias_id
+
+    @property
+    def output_text(self):
+        # Collapse the parts so later reads only join the chunks added since
+        if len(self._text_parts) > 1:
+            self._text_parts = ["".join(self._text_parts)]
+        return self._text_parts[0] if self._text_parts else ""
+
+    def to_dict(self):
+        return {
+            "output_text": self.output_text,
+            "citations": self.citations,
+            "trace": self.trace,
+            "trace_summary": self.trace_summary.to_dict(),
+            "usage": self.usage.to_dict()
+        }
+
+
+def _get_client(region):
+    return client_pool.get_client("bedrock-agent-runtime", region_name=region, **resilience.BOTOCORE_RETRY_CONFIG)
+
+
+def _evict_client(region):
+    client_pool.evict_client("bedrock-agent-runtime", region_name=region, **resilience.BOTOCORE_RETRY_CONFIG)
+
+
+def prewarm_client(region=None):
+    """Create the pooled agent client in the background, e.g. while the login page renders"""
+    region = region or os.getenv('AWS_DEFAULT_REGION', 'ap-southeast-2')
+    client_pool.prewarm_client("bedrock-agent-runtime", region_name=region, **resilience.BOTOCORE_RETRY_CONFIG)
+
+
+def use_client(client, region=None):
+    """Serve agent calls for the region from a prebuilt client, e.g. a local stand-in in benchmarks"""
+    region = region or os.getenv('AWS_DEFAULT_REGION', 'ap-southeast-2')
+    client_pool.register_client(client, "bedrock-agent-runtime", region_name=region,
+                                **resilience.BOTOCORE_RETRY_CONFIG)
+
+
+def _invoke(client, agent_id, agent_alias_id, session_id, prompt, stream_final_response, enable_trace,
+            session_state=None):
+    # See https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/bedrock-agent-runtime/client/invoke_agent.html
+    kwargs = {}
+    if stream_final_response:
+        kwargs["streamingConfigurations"] = {"streamFinalResponse": True}
+    if session_state:
+        kwargs["sessionState"] = session_state
+    return client.invoke_agent(
+        agentId=agent_id,
+        agentAliasId=agent_alias_id,
+        enableTrace=enable_trace,
+        sessionId=session_id,
+        inputText=prompt,
+        **kwargs
+    )
+
+
+def is_committed(event):
+    """Answer text, citations and tool invocations must never be replayed by a retry"""
+    if isinstance(event, (ChunkEvent, CitationEvent, StreamOpenedEvent)):
+        return True
+    return isinstance(event, TraceEvent) and "invocationInput" in event.trace
+
+
+def _stream_once(agent_id, agent_alias_id, session_id, prompt, region, stream_final_response, enable_trace,
+                 session_state=None):
+    start = time.perf_counter()
+    client = _get_client(region)
+    try:
+        with telemetry.span("invoke_agent_call"):
+            response = _invoke(client, agent_id, agent_alias_id, session_id, prompt, stream_final_response,
+                               enable_trace, session_state)
     except ClientError as e:
-        raise
+        if not client_pool.is_expired_credentials_error(e):
+            raise
+        # The pooled client holds stale credentials, rebuild it and retry once
+        _evict_client(region)
+        client = _get_client(region)
+        with telemetry.span("invoke_agent_call"):
+            response = _invoke(client, agent_id, agent_alias_id, session_id, prompt, stream_final_response,
+                               enable_trace, session_state)
+
+    request_id = response.get("ResponseMetadata", {}).get("RequestId")
+    if request_id:
+        bind_log_context(request_id=request_id)
+    if not enable_trace:
+        yield StreamOpenedEvent()
+    assembler = ResponseAssembler()
+    has_guardrail_trace = False
+    for event in response.get("completion"):
+        if "chunk" in event:
+            chunk = event["chunk"]
+            if "bytes" in chunk:
+                # Characters split across chunk boundaries are held back until complete
+                text = assembler.feed(chunk["bytes"])
+                if text:
+                    yield ChunkEvent(text)
+            if "attribution" in chunk:
+                yield CitationEvent(chunk["attribution"]["citations"])
+
+        if "trace" in event:
+            for trace_type in TRACE_TYPES:
+                if trace_type in event["trace"]["trace"]:
+                    mapped_trace_type = trace_type
+                    if trace_type == "guardrailTrace":
+                        if not has_guardrail_trace:
+                            has_guardrail_trace = True
+                            mapped_trace_type = "preGuardrailTrace"
+                        else:
+                            mapped_trace_type = "postGuardrailTrace"
+                    elapsed_ms = (time.perf_counter() - start) * 1000
+                    if trace_logger.isEnabledFor(logging.DEBUG):
+                        trace_logger.debug(f"Agent trace step {mapped_trace_type}", extra={
+                            "trace_type": mapped_trace_type,
+                            "elapsed_ms": round(elapsed_ms, 1),
+                            "trace": event["trace"]["trace"][trace_type]
+                        })
+                    yield TraceEvent(mapped_trace_type, event["trace"]["trace"][trace_type], elapsed_ms)
+
+    tail = assembler.finish()
+    if tail:
+        yield ChunkEvent(tail)
+
+
+def _timed_stream(events, start):
+    """Record time to the first answer chunk and the time to drain the rest of the stream"""
+    first_chunk_at = None
+    chunks = trace_steps = 0
+    for event in events:
+        if isinstance(event, ChunkEvent):
+            chunks += 1
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+                telemetry.observe("first_chunk", first_chunk_at - start)
+        elif isinstance(event, TraceEvent):
+            trace_steps += 1
+        yield event
+    end = time.perf_counter()
+    if first_chunk_at is not None:
+        telemetry.observe("stream_drain", end - first_chunk_at)
+    logger.info("Agent turn completed", extra={
+        "first_chunk_ms": round((first_chunk_at - start) * 1000, 1) if first_chunk_at is not None else None,
+        "total_ms": round((end - start) * 1000, 1),
+        "chunks": chunks,
+        "trace_steps": trace_steps
+    })
+
+
+def _stream_from_cache(entry):
+    yield CacheHitEvent(entry["trace_summary"], entry["latency_ms"])
+    yield ChunkEvent(entry["output_text"])
+    if entry["citations"]:
+        yield CitationEvent(entry["citations"])
+
+
+def _stream_into_cache(events, cache, prompt, agent_id, agent_alias_id, session_id, session_state, previous_answer):
+    start = time.perf_counter()
+    response = AgentResponse(TracePolicy(TRACE_SUMMARY))
+    for event in events:
+        response.add(event)
+        yield event
+    # Only reached when the stream completed, so partial answers are never cached
+    cache.put(prompt, agent_id, agent_alias_id, session_id, response.output_text, response.citations,
+              response.trace_summary.to_dict(), (time.perf_counter() - start) * 1000, session_state, previous_answer)
+
+
+def stream_agent(agent_id, agent_alias_id, session_id, prompt, region=None, stream_final_response=False,
+                 trace_policy: TracePolicy = None, cache: ResponseCache = None, session_state: dict = None,
+                 previous_answer: str = None):
+    """Invoke the agent and yield ChunkEvent, CitationEvent and TraceEvent objects as they arrive.
+
+    Traces are only requested when trace_policy samples this call; without a
+    policy the BEDROCK_AGENT_TRACE_MODE environment setting applies. Throttling
+    and transient errors are retried with backoff until the first answer chunk
+    or tool invocation arrives; untraced calls, whose tool invocations cannot
+    be seen, are only retried until the agent accepts them, and a
+    StreamOpenedEvent marks that point. Raises AgentBusyError when the process
+    is at its invocation limit and CircuitOpenError while Bedrock calls for the
+    region are failing.
+
+    With a cache, a hit is replayed as a CacheHitEvent followed by the cached
+    answer and citations without calling the agent, and completed answers are
+    stored for later calls. previous_answer, the last answer of the
+    conversation, keeps session-scoped entries to the turn they were made in.
+    session_state is passed to invoke_agent as its sessionState, e.g. to carry
+    prompt session attributes.
+    """
+    if cache is not None:
+        entry = cache.get(prompt, agent_id, agent_alias_id, session_id, session_state, previous_answer)
+        if entry is not None:
+            yield from _stream_from_cache(entry)
+            return
+
+    start = time.perf_counter()
+    region = region or os.getenv('AWS_DEFAULT_REGION', 'ap-southeast-2')
+    trace_policy = trace_policy or TracePolicy.from_env()
+    enable_trace = trace_policy.should_trace()
+
+    def open_stream():
+        return _stream_once(agent_id, agent_alias_id, session_id, prompt, region, stream_final_response,
+                            enable_trace, session_state)
+
+    # Each attempt holds a process-wide invocation slot until the stream is drained or closed
+    with log_context(session_id=session_id, agent_id=agent_id, agent_alias_id=agent_alias_id, region=region):
+        events = resilience.resilient_stream(open_stream, resilience.get_breaker(region), is_committed,
+                                             hold=agent_limiter.slot)
+        events = _timed_stream(events, start)
+        if cache is not None:
+            events = _stream_into_cache(events, cache, prompt, agent_id, agent_alias_id, session_id,
+                                        session_state, previous_answer)
+        yield from events
+
 
-    return {
-        "output_text": output_text,
-        "citations": citations,
-        "trace": trace
-    }
+def invoke_agent(agent_id, agent_alias_id, session_id, prompt, region=None, trace_policy: TracePolicy = None):
+    trace_policy = trace_policy or TracePolicy.from_env()
+    response = AgentResponse(trace_policy)
+    for event in stream_agent(agent_id, agent_alias_id, session_id, prompt, region=region,
+                              trace_policy=trace_policy):
+        response.add(event)
+    return response.to_dict()
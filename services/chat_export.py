@@ -0,0 +1,88 @@
+from collections import namedtuple
+import io
+import json
+import textwrap
+import zlib
+
+ExportFormat = namedtuple("ExportFormat", ["label", "mime", "extension"])
+
+EXPORT_FORMATS = {
+    "json": ExportFormat("JSON", "application/json", "json"),
+    "ndjson": ExportFormat("NDJSON", "application/x-ndjson", "ndjson"),
+    "json.gz": ExportFormat("Compressed JSON", "application/gzip", "json.gz"),
+    "markdown": ExportFormat("Markdown transcript", "text/markdown", "md"),
+}
+
+
+def iter_ndjson(metadata, messages):
+    """One metadata line followed by one line per message"""
+    yield json.dumps({"type": "metadata", **metadata}) + "\n"
+    for message in messages:
+        yield json.dumps(message.to_dict()) + "\n"
+
+
+def iter_json(metadata, messages):
+    """The same document as the previous json.dumps(chat_data) export, produced piece by piece"""
+    yield json.dumps(metadata)[:-1] + (', "messages": [' if metadata else '"messages": [')
+    for index, message in enumerate(messages):
+        yield ("," if index else "") + json.dumps(message.to_dict())
+    yield "]}"
+
+
+def iter_pretty_json(metadata, messages):
+    """The original indent=2 JSON download, with messages after the metadata"""
+    yield "{\n"
+    for key, value in metadata.items():
+        value = json.dumps(value, indent=2).replace("\n", "\n  ")
+        yield f"  {json.dumps(key)}: {value},\n"
+    yield '  "messages": ['
+    empty = True
+    for message in messages:
+        yield ("\n" if empty else ",\n") + textwrap.indent(json.dumps(message.to_dict(), indent=2), "    ")
+        empty = False
+    yield "]\n}" if empty else "\n  ]\n}"
+
+
+def iter_markdown(metadata, messages, assistant_name="AI Cost Calculator"):
+    yield "# Chat history\n\n"
+    for key, value in metadata.items():
+        yield f"- **{key}**: {value}\n"
+    for message in messages:
+        speaker = "You" if message["role"] == "user" else assistant_name
+        yield f"\n## {speaker}\n\n{message['content']}\n"
+
+
+def iter_export(export_format, metadata, messages):
+    """Yield the export as byte chunks without building the whole document first"""
+    if export_format == "json":
+        for chunk in iter_pretty_json(metadata, messages):
+            yield chunk.encode()
+    elif export_format == "ndjson":
+        for chunk in iter_ndjson(metadata, messages):
+            yield chunk.encode()
+    elif export_format == "markdown":
+        for chunk in iter_markdown(metadata, messages):
+            yield chunk.encode()
+    elif export_format == "json.gz":
+        # wbits=31 writes a gzip header and trailer
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in iter_json(metadata, messages):
+            compressed = compressor.compress(chunk.encode())
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+    else:
+        raise ValueError(f"Unknown export format {export_format!r}")
+
+
+def write_export(export_format, metadata, messages, file):
+    """Stream the export into a binary file object, e.g. for large histories written to disk"""
+    for chunk in iter_export(export_format, metadata, messages):
+        file.write(chunk)
+
+
+def build_export(export_format, metadata, messages) -> bytes:
+    """The whole export in memory, for st.download_button which needs its payload up front"""
+    buffer = io.BytesIO()
+    write_export(export_format, metadata, messages, buffer)
+    return buffer.getvalue()
@@ -0,0 +1,112 @@
+"""Render knowledge base citations into an agent answer.
+
+Bedrock marks cited passages with %[n]%, where n is the 1-based index of the
+citation in the response. Markers become superscript footnote numbers, and
+the retrieved references are listed under the answer. A document cited more
+than once gets a single footnote.
+"""
+from functools import lru_cache
+import html
+import os
+import re
+
+CITATION_HTML_CACHE_SIZE = int(os.getenv('CHAT_CITATION_HTML_CACHE_SIZE', '1024'))
+
+MARKER_PATTERN = re.compile(r"%\[(\d+)\]%")
+
+# Location keys per retrievedReferences location type, see
+# https://docs.aws.amazon.com/bedrock/latest/APIReference/API_agent-runtime_RetrievalResultLocation.html
+_LOCATION_KEYS = {
+    "S3": ("s3Location", "uri"),
+    "WEB": ("webLocation", "url"),
+    "CONFLUENCE": ("confluenceLocation", "url"),
+    "SALESFORCE": ("salesforceLocation", "url"),
+    "SHAREPOINT": ("sharePointLocation", "url"),
+    "CUSTOM": ("customDocumentLocation", "id"),
+    "KENDRA": ("kendraDocumentLocation", "uri"),
+}
+
+
+def reference_uri(reference) -> str:
+    """The document URI of a retrieved reference, whatever its location type"""
+    location = reference.get("location", {})
+    keys = _LOCATION_KEYS.get(location.get("type"))
+    if keys is not None and keys[0] in location:
+        return location[keys[0]].get(keys[1], "")
+    # Unknown location types still carry a single nested location
+    for value in location.values():
+        if isinstance(value, dict):
+            return value.get("uri") or value.get("url") or ""
+    return ""
+
+
+class CitationIndex:
+    """Footnote numbers for the distinct documents cited by one response.
+
+    add() can be called with each CitationEvent as it streams in; every
+    reference is looked at once.
+    """
+
+    __slots__ = ("uris", "_numbers", "_citation_footnotes", "_references")
+
+    def __init__(self, citations=()):
+        self.uris = []
+        self._numbers = {}
+        self._citation_footnotes = []
+        # Per footnote, the (generatedResponsePart, retrievedReference) pairs citing that document
+        self._references = []
+        self.add(citations)
+
+    def add(self, citations):
+        for citation in citations:
+            footnotes = []
+            for reference in citation.get("retrievedReferences", ()):
+                uri = reference_uri(reference)
+                number = self._numbers.get(uri)
+                if number is None:
+                    self.uris.append(uri)
+                    self._references.append([])
+                    number = self._numbers[uri] = len(self.uris)
+                self._references[number - 1].append((citation.get("generatedResponsePart"), reference))
+                if number not in footnotes:
+                    footnotes.append(number)
+            self._citation_footnotes.append(footnotes)
+
+    def __len__(self):
+        return len(self.uris)
+
+    def footnotes(self):
+        """(number, uri, [(generatedResponsePart, retrievedReference)]) per footnote, in footnote order"""
+        return [
+            (number, uri, references)
+            for number, (uri, references) in enumerate(zip(self.uris, self._references), start=1)
+        ]
+
+    def _marker(self, match):
+        index = int(match.group(1))
+        footnotes = self._citation_footnotes[index - 1] if 0 < index <= len(self._citation_footnotes) else None
+        label = ",".join(map(str, footnotes)) if footnotes else match.group(1)
+        return f"<sup>[{label}]</sup>"
+
+    def rewrite(self, text: str) -> str:
+        """Replace every %[n]% marker with the footnote numbers of citation n"""
+        return MARKER_PATTERN.sub(self._marker, text)
+
+    def footnote_html(self) -> str:
+        return footnote_html(tuple(self.uris))
+
+
+@lru_cache(maxsize=CITATION_HTML_CACHE_SIZE)
+def footnote_html(uris: tuple) -> str:
+    """The reference list under an answer; the same documents are often cited turn after turn"""
+    return "".join(f"\n<br>[{number}] {html.escape(uri)}" for number, uri in enumerate(uris, start=1))
+
+
+def apply_citations(text: str, citations) -> str:
+    """The answer with markers rewritten and the reference list appended, or unchanged without citations"""
+    if not citations:
+        return text
+    index = CitationIndex(citations)
+    if not index:
+        return text
+    return f"{index.rewrite(text)}\n{index.footnote_html()}"
@@ -0,0 +1,164 @@
+from botocore.exceptions import ClientError
+import logging
+import os
+import threading
+import time
+from services import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Tunables for the shared urllib3 connection pool behind each client
+MAX_POOL_CONNECTIONS = int(os.getenv('AWS_CLIENT_MAX_POOL_CONNECTIONS', '50'))
+TCP_KEEPALIVE = os.getenv('AWS_CLIENT_TCP_KEEPALIVE', 'true').lower() == 'true'
+# Clients are rebuilt after this many seconds so rotated credentials are picked up
+CLIENT_MAX_AGE_SECONDS = float(os.getenv('AWS_CLIENT_MAX_AGE_SECONDS', '3600'))
+
+# Error codes returned when the credentials a client was built with are no longer valid
+EXPIRED_CREDENTIAL_ERROR_CODES = {
+    "ExpiredToken",
+    "ExpiredTokenException",
+    "RequestExpired",
+    "InvalidClientTokenId",
+    "UnrecognizedClientException",
+}
+
+
+def _freeze(value):
+    """Turn nested config values into something hashable for use in a cache key"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def is_expired_credentials_error(error):
+    """Check whether a ClientError was caused by expired or revoked credentials"""
+    if not isinstance(error, ClientError):
+        return False
+    return error.response.get("Error", {}).get("Code") in EXPIRED_CREDENTIAL_ERROR_CODES
+
+
+class _PooledClient:
+    __slots__ = ("client", "created_at", "expires")
+
+    def __init__(self, client, expires: bool = True):
+        self.client = client
+        self.created_at = time.monotonic()
+        # Registered clients hold no credentials of their own, so they are never rebuilt
+        self.expires = expires
+
+
+class ClientPool:
+    """Thread-safe registry of boto3 clients keyed by service, region, profile and config.
+
+    boto3 clients are thread safe, so a single client (and its connection pool)
+    is shared by every Streamlit session in the process instead of resolving
+    credentials and opening a new TLS connection on every request.
+    """
+
+    def __init__(self, max_pool_connections: int = MAX_POOL_CONNECTIONS,
+                 tcp_keepalive: bool = TCP_KEEPALIVE,
+                 max_age_seconds: float = CLIENT_MAX_AGE_SECONDS):
+        self.max_pool_connections = max_pool_connections
+        self.tcp_keepalive = tcp_keepalive
+        self.max_age_seconds = max_age_seconds
+        self._clients = {}
+        self._prewarming = set()
+        self._lock = threading.Lock()
+
+    def _key(self, service_name, region_name, profile_name, config_overrides):
+        return (service_name, region_name, profile_name, _freeze(config_overrides))
+
+    def _build_client(self, service_name, region_name, profile_name, config_overrides):
+        # boto3 is imported on first use to keep it off the app's cold start path
+        import boto3
+        from botocore.config import Config
+
+        config_kwargs = {
+            "max_pool_connections": self.max_pool_connections,
+            "tcp_keepalive": self.tcp_keepalive,
+        }
+        config_kwargs.update(config_overrides)
+        with telemetry.span("client_create"):
+            session = boto3.session.Session(profile_name=profile_name)
+            return session.client(
+                service_name=service_name,
+                region_name=region_name,
+                config=Config(**config_kwargs)
+            )
+
+    def get_client(self, service_name, region_name=None, profile_name=None, **config_overrides):
+        """Return the shared client for the given settings, creating it on first use"""
+        key = self._key(service_name, region_name, profile_name, config_overrides)
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None and (
+                not entry.expires or time.monotonic() - entry.created_at < self.max_age_seconds
+            ):
+                return entry.client
+
+            # boto3 session creation is not thread safe, so build under the lock
+            logger.debug(f"Creating {service_name} client for region {region_name}")
+            entry = _PooledClient(self._build_client(service_name, region_name, profile_name, config_overrides))
+            self._clients[key] = entry
+            return entry.client
+
+    def register(self, client, service_name, region_name=None, profile_name=None, **config_overrides):
+        """Install a prebuilt client, e.g. a local stand-in used by the load-test harness; it never expires"""
+        key = self._key(service_name, region_name, profile_name, config_overrides)
+        with self._lock:
+            self._clients[key] = _PooledClient(client, expires=False)
+
+    def evict(self, service_name, region_name=None, profile_name=None, **config_overrides):
+        """Drop a client so the next call rebuilds it with freshly resolved credentials"""
+        key = self._key(service_name, region_name, profile_name, config_overrides)
+        with self._lock:
+            if self._clients.pop(key, None) is not None:
+                logger.info(f"Evicted {service_name} client for region {region_name}")
+
+    def prewarm(self, service_name, region_name=None, profile_name=None, **config_overrides):
+        """Build a client on a background thread so the first request does not pay for it"""
+        key = self._key(service_name, region_name, profile_name, config_overrides)
+        with self._lock:
+            if key in self._clients or key in self._prewarming:
+                return
+            self._prewarming.add(key)
+
+        def build():
+            try:
+                self.get_client(service_name, region_name, profile_name, **config_overrides)
+            except Exception as e:
+                logger.warning(f"Failed to prewarm {service_name} client: {e}")
+            finally:
+                with self._lock:
+                    self._prewarming.discard(key)
+
+        threading.Thread(target=build, name=f"prewarm-{service_name}", daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
+
+
+_default_pool = ClientPool()
+
+
+def get_client(service_name, region_name=None, profile_name=None, **config_overrides):
+    return _default_pool.get_client(service_name, region_name, profile_name, **config_overrides)
+
+
+def prewarm_client(service_name, region_name=None, profile_name=None, **config_overrides):
+    _default_pool.prewarm(service_name, region_name, profile_name, **config_overrides)
+
+
+def register_client(client, service_name, region_name=None, profile_name=None, **config_overrides):
+    _default_pool.register(client, service_name, region_name, profile_name, **config_overrides)
+
+
+def evict_client(service_name, region_name=None, profile_name=None, **config_overrides):
+    _default_pool.evict(service_name, region_name, profile_name, **config_overrides)
@@ -0,0 +1,96 @@
+from contextlib import contextmanager
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+MAX_IN_FLIGHT = int(os.getenv('BEDROCK_AGENT_MAX_IN_FLIGHT', '32'))
+MAX_QUEUED = int(os.getenv('BEDROCK_AGENT_MAX_QUEUED', '64'))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv('BEDROCK_AGENT_QUEUE_TIMEOUT_SECONDS', '30'))
+
+
+class AgentBusyError(Exception):
+    """Raised when an agent invocation cannot get a slot, so the caller can ask the user to retry"""
+
+
+class InvocationLimiter:
+    """Process-wide cap on in-flight agent invocations with a bounded, timed wait queue.
+
+    A threading semaphore is used rather than an asyncio one so the same limit
+    applies to Streamlit script threads and to the executor threads behind the
+    async API.
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, max_queued: int = MAX_QUEUED,
+                 queue_timeout: float = QUEUE_TIMEOUT_SECONDS):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._semaphore = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def resize(self, max_in_flight: int):
+        """Change the in-flight cap; only while no invocation holds or waits for a slot"""
+        with self._lock:
+            if self.in_flight or self.queued:
+                raise RuntimeError("Cannot resize the invocation limiter while invocations are running")
+            self.max_in_flight = max_in_flight
+            self._semaphore = threading.BoundedSemaphore(max_in_flight)
+
+    def _reject_if_full(self):
+        # Called with self._lock held
+        if self.in_flight >= self.max_in_flight and self.queued >= self.max_queued:
+            self.rejected += 1
+            raise AgentBusyError(f"{self.in_flight} agent requests in flight and {self.queued} waiting")
+
+    def check_capacity(self):
+        """Fail fast when the wait queue is already full"""
+        with self._lock:
+            self._reject_if_full()
+
+    @contextmanager
+    def slot(self, timeout: float = None):
+        """Hold an invocation slot, waiting up to timeout seconds for one to free up"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        with self._lock:
+            self._reject_if_full()
+            self.queued += 1
+        try:
+            acquired = self._semaphore.acquire(timeout=timeout)
+        finally:
+            with self._lock:
+                self.queued -= 1
+        if not acquired:
+            with self._lock:
+                self.rejected += 1
+            logger.warning(f"Timed out after {timeout}s waiting for an agent invocation slot")
+            raise AgentBusyError(f"No agent invocation slot became free within {timeout:g}s")
+
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._semaphore.release()
+
+    @property
+    def saturated(self) -> bool:
+        return self.in_flight >= self.max_in_flight
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "max_in_flight": self.max_in_flight
+            }
+
+
+agent_limiter = InvocationLimiter()
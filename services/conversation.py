@@ -0,0 +1,231 @@
+import atexit
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+import zlib
+
+logger = logging.getLogger(__name__)
+
+SESSION_MAX_BYTES = int(os.getenv('CHAT_SESSION_MAX_BYTES', str(256 * 1024)))
+# The most recent messages stay uncompressed because they are the ones rendered on every rerun
+COMPRESS_AFTER_MESSAGES = int(os.getenv('CHAT_COMPRESS_AFTER_MESSAGES', '20'))
+COMPRESS_MIN_BYTES = 256
+SPILL_READ_PAGE_SIZE = 200
+SPILL_DIR = os.getenv('CHAT_SPILL_DIR', tempfile.gettempdir())
+
+# Rough per-message overhead of the Message object and its attributes
+_MESSAGE_OVERHEAD = sys.getsizeof(object()) + 4 * 8
+
+
+class Message:
+    """A chat message stored as bytes, zlib-compressed once it is old enough.
+
+    Supports message["role"] and message["content"] so it can be used wherever
+    the previous {"role": ..., "content": ...} dicts were.
+    """
+
+    __slots__ = ("role", "created_at", "_data", "_compressed")
+
+    def __init__(self, role: str, content: str, created_at: float = None):
+        self.role = sys.intern(role)
+        self.created_at = created_at or time.time()
+        self._data = content.encode()
+        self._compressed = False
+
+    @property
+    def content(self) -> str:
+        data = zlib.decompress(self._data) if self._compressed else self._data
+        return data.decode()
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._data) + _MESSAGE_OVERHEAD
+
+    def compress(self) -> int:
+        """Compress in place when it saves space, returning the number of bytes saved"""
+        if self._compressed or len(self._data) < COMPRESS_MIN_BYTES:
+            return 0
+        compressed = zlib.compress(self._data)
+        saved = len(self._data) - len(compressed)
+        if saved <= 0:
+            return 0
+        self._data = compressed
+        self._compressed = True
+        return saved
+
+    def __getitem__(self, key):
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        raise KeyError(key)
+
+    def to_dict(self):
+        return {"role": self.role, "content": self.content}
+
+
+class SpillStore:
+    """Local SQLite file holding messages evicted from session memory"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spilled_messages ("
+            "conversation_id TEXT NOT NULL, position INTEGER NOT NULL, role TEXT NOT NULL, "
+            "created_at REAL NOT NULL, data BLOB NOT NULL, PRIMARY KEY (conversation_id, position))"
+        )
+
+    def write(self, conversation_id: str, first_position: int, messages):
+        rows = [
+            (conversation_id, first_position + offset, message.role, message.created_at,
+             zlib.compress(message.content.encode()))
+            for offset, message in enumerate(messages)
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO spilled_messages VALUES (?, ?, ?, ?, ?)", rows)
+
+    def read(self, conversation_id: str, start: int, stop: int):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, created_at, data FROM spilled_messages "
+                "WHERE conversation_id = ? AND position >= ? AND position < ? ORDER BY position",
+                (conversation_id, start, stop)
+            ).fetchall()
+        return [Message(role, zlib.decompress(data).decode(), created_at) for role, created_at, data in rows]
+
+    def delete(self, conversation_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM spilled_messages WHERE conversation_id = ?", (conversation_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.path + suffix)
+            except OSError:
+                pass
+
+
+_spill_store = None
+_spill_store_lock = threading.Lock()
+
+
+def get_spill_store() -> SpillStore:
+    """Per-process spill file, removed when the process exits"""
+    global _spill_store
+    with _spill_store_lock:
+        if _spill_store is None:
+            _spill_store = SpillStore(os.path.join(SPILL_DIR, f"chat_spill_{os.getpid()}.sqlite3"))
+            atexit.register(_spill_store.close)
+        return _spill_store
+
+
+class Conversation:
+    """Bounded message list for one Streamlit session.
+
+    Messages older than the most recent compress_after are zlib-compressed, and
+    once the session uses more than max_bytes the oldest messages are moved to
+    the local spill store. Indexing, slicing and iteration read spilled
+    messages back transparently.
+    """
+
+    def __init__(self, max_bytes: int = SESSION_MAX_BYTES, compress_after: int = COMPRESS_AFTER_MESSAGES):
+        self.conversation_id = uuid.uuid4().hex
+        self.max_bytes = max_bytes
+        self.compress_after = compress_after
+        self.version = 0
+        self._messages = []
+        self._spilled = 0
+        self._nbytes = 0
+        self._finalizer = None
+
+    def add(self, role: str, content: str) -> Message:
+        message = Message(role, content)
+        self._messages.append(message)
+        self._nbytes += message.nbytes
+        self.version += 1
+        self._enforce_budget()
+        return message
+
+    def append(self, message: dict):
+        """List-style append of a {"role": ..., "content": ...} dict"""
+        self.add(message["role"], message["content"])
+
+    def _enforce_budget(self):
+        if len(self._messages) > self.compress_after:
+            self._nbytes -= self._messages[-self.compress_after - 1].compress()
+        if self._nbytes <= self.max_bytes:
+            return
+
+        # Spill the oldest half of the in-memory messages, keeping the uncompressed tail
+        spill_count = max(0, min(len(self._messages) - self.compress_after, len(self._messages) // 2))
+        if spill_count == 0:
+            return
+        store = get_spill_store()
+        store.write(self.conversation_id, self._spilled, self._messages[:spill_count])
+        if self._finalizer is None:
+            self._finalizer = weakref.finalize(self, store.delete, self.conversation_id)
+        self._nbytes -= sum(message.nbytes for message in self._messages[:spill_count])
+        del self._messages[:spill_count]
+        self._spilled += spill_count
+        logger.debug(f"Spilled {spill_count} messages of conversation {self.conversation_id} to disk")
+
+    def __len__(self):
+        return self._spilled + len(self._messages)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            messages = []
+            if start < self._spilled:
+                messages = get_spill_store().read(self.conversation_id, start, min(stop, self._spilled))
+            messages += self._messages[max(start, self._spilled) - self._spilled:max(stop, self._spilled) - self._spilled]
+            return messages[::step] if step != 1 else messages
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("conversation index out of range")
+        if index < self._spilled:
+            return get_spill_store().read(self.conversation_id, index, index + 1)[0]
+        return self._messages[index - self._spilled]
+
+    def __iter__(self):
+        # Spilled messages are read back a page at a time rather than all at once
+        for start in range(0, self._spilled, SPILL_READ_PAGE_SIZE):
+            yield from get_spill_store().read(
+                self.conversation_id, start, min(start + SPILL_READ_PAGE_SIZE, self._spilled)
+            )
+        yield from list(self._messages)
+
+    def last_answer(self):
+        """Content of the most recent assistant message, or None before the first answer"""
+        for index in range(len(self) - 1, -1, -1):
+            message = self[index]
+            if message["role"] == "assistant":
+                return message["content"]
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate bytes held in memory by this conversation"""
+        return self._nbytes
+
+    @property
+    def spilled(self) -> int:
+        return self._spilled
+
+    def to_dicts(self):
+        return [message.to_dict() for message in self]
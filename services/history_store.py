@@ -0,0 +1,271 @@
+import atexit
+from collections import deque
+import hashlib
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+HISTORY_BATCH_SIZE = int(os.getenv('CHAT_HISTORY_BATCH_SIZE', '50'))
+HISTORY_FLUSH_SECONDS = float(os.getenv('CHAT_HISTORY_FLUSH_SECONDS', '1'))
+# Records with this role hold the state of a rotated agent session rather than a chat message
+AGENT_SESSION_ROLE = "agent_session"
+
+
+class SQLiteHistoryBackend:
+    """Conversation history in a SQLite file, e.g. on a volume shared by every replica"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # No WAL here: it relies on shared memory, which network file systems such as EFS do not provide
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_history ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, session_id TEXT NOT NULL, "
+            "role TEXT NOT NULL, content TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chat_history_user ON chat_history (username, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chat_history_session ON chat_history (session_id, id)")
+
+    def append_batch(self, records):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO chat_history (username, session_id, role, content, created_at) "
+                    "VALUES (:username, :session_id, :role, :content, :created_at)",
+                    records
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def latest_session(self, username):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT session_id FROM chat_history WHERE username = ? ORDER BY id DESC LIMIT 1", (username,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def load(self, username, session_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content, created_at FROM chat_history "
+                "WHERE session_id = ? AND username = ? ORDER BY id",
+                (session_id, username)
+            ).fetchall()
+        return [{"role": role, "content": content, "created_at": created_at} for role, content, created_at in rows]
+
+
+class JSONLHistoryBackend:
+    """Append-only JSON lines, one file per user, so records are never rewritten"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, username):
+        # Usernames are hashed so they are always safe file names
+        return os.path.join(self.directory, hashlib.sha256(username.encode()).hexdigest()[:32] + ".jsonl")
+
+    def append_batch(self, records):
+        by_user = {}
+        for record in records:
+            by_user.setdefault(record["username"], []).append(record)
+        with self._lock:
+            for username, user_records in by_user.items():
+                with open(self._path(username), "a", encoding="utf-8") as history_file:
+                    history_file.write("".join(json.dumps(record) + "\n" for record in user_records))
+
+    def latest_session(self, username):
+        path = self._path(username)
+        if not os.path.exists(path):
+            return None
+        # Only the last line is needed, so read backwards from the end of the file
+        with open(path, "rb") as history_file:
+            history_file.seek(0, os.SEEK_END)
+            position = history_file.tell()
+            tail = b""
+            while position > 0 and tail.count(b"\n") < 2:
+                step = min(4096, position)
+                position -= step
+                history_file.seek(position)
+                tail = history_file.read(step) + tail
+        lines = tail.rstrip(b"\n").split(b"\n")
+        return json.loads(lines[-1])["session_id"] if lines[-1] else None
+
+    def load(self, username, session_id):
+        path = self._path(username)
+        if not os.path.exists(path):
+            return []
+        messages = []
+        with open(path, encoding="utf-8") as history_file:
+            for line in history_file:
+                if session_id not in line:
+                    continue
+                record = json.loads(line)
+                if record["session_id"] == session_id:
+                    messages.append({
+                        "role": record["role"], "content": record["content"], "created_at": record["created_at"]
+                    })
+        return messages
+
+
+class HistoryStore:
+    """Persists chat messages keyed by Cognito username and Bedrock session ID.
+
+    record() only enqueues the message; a background thread writes queued
+    messages in batches, so persistence never blocks a chat turn. Reads merge
+    in the user's own messages that are still waiting to be written, so a user
+    sees their latest messages without waiting for anyone else's writes.
+    """
+
+    def __init__(self, backend, batch_size: int = HISTORY_BATCH_SIZE, flush_seconds: float = HISTORY_FLUSH_SECONDS):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        # Queued records per username, oldest first, removed once their batch has been written
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        # Held while a batch is written and while reading, so a record is never seen both written and pending
+        self._persist_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+                self._worker.start()
+                atexit.register(self.flush)
+
+    def record(self, username, session_id, role, content):
+        if not username:
+            return
+        self._ensure_worker()
+        record = {
+            "username": username,
+            "session_id": session_id,
+            "role": role,
+            "content": content,
+            "created_at": time.time()
+        }
+        with self._pending_lock:
+            self._pending.setdefault(username, deque()).append(record)
+            self._queue.put(record)
+
+    def record_agent_session(self, username, session_id, agent_session: dict):
+        """Save the state of the chat's agent session, so a restored chat keeps using its latest one"""
+        self.record(username, session_id, AGENT_SESSION_ROLE, json.dumps(agent_session))
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            with self._persist_lock:
+                try:
+                    self.backend.append_batch(batch)
+                except Exception as e:
+                    logger.error(f"Failed to persist {len(batch)} chat messages: {e}")
+                finally:
+                    self._forget_pending(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _forget_pending(self, batch):
+        # The queue is FIFO, so a batch holds the oldest pending records of each of its users
+        with self._pending_lock:
+            for record in batch:
+                user_pending = self._pending[record["username"]]
+                user_pending.popleft()
+                if not user_pending:
+                    del self._pending[record["username"]]
+
+    def _pending_messages(self, username, session_id=None):
+        """The user's queued records, optionally only those of one session"""
+        with self._pending_lock:
+            return [
+                record for record in self._pending.get(username, ())
+                if session_id is None or record["session_id"] == session_id
+            ]
+
+    @staticmethod
+    def _message(record):
+        return {"role": record["role"], "content": record["content"], "created_at": record["created_at"]}
+
+    def flush(self):
+        """Block until every recorded message has been written"""
+        if self._worker is not None:
+            self._queue.join()
+
+    @staticmethod
+    def _split_agent_session(records):
+        """The chat messages and the latest saved agent session state, or None"""
+        messages = []
+        agent_session = None
+        for record in records:
+            if record["role"] == AGENT_SESSION_ROLE:
+                agent_session = json.loads(record["content"])
+            else:
+                messages.append(record)
+        return messages, agent_session
+
+    def load(self, username, session_id):
+        with self._persist_lock:
+            records = self.backend.load(username, session_id)
+            pending = self._pending_messages(username, session_id)
+        return self._split_agent_session(records + [self._message(record) for record in pending])[0]
+
+    def rehydrate(self, username):
+        """Return (session_id, messages, agent session state or None) for the user's latest conversation, or None"""
+        with self._persist_lock:
+            pending = self._pending_messages(username)
+            session_id = pending[-1]["session_id"] if pending else self.backend.latest_session(username)
+            if session_id is None:
+                return None
+            records = self.backend.load(username, session_id)
+        records += [self._message(record) for record in pending if record["session_id"] == session_id]
+        return (session_id, *self._split_agent_session(records))
+
+
+def history_from_env():
+    """Build the store described by the CHAT_HISTORY_* settings, or None when it is off"""
+    backend_name = os.getenv('CHAT_HISTORY_BACKEND', 'off').lower()
+    if backend_name == "sqlite":
+        backend = SQLiteHistoryBackend(os.getenv('CHAT_HISTORY_PATH', 'chat_history.sqlite3'))
+    elif backend_name == "jsonl":
+        backend = JSONLHistoryBackend(os.getenv('CHAT_HISTORY_PATH', 'chat_history'))
+    else:
+        return None
+    return HistoryStore(backend)
+
+
+_UNSET = object()
+_history_store = _UNSET
+_history_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """Process-wide history store built from the environment on first use, None when it is off"""
+    global _history_store
+    with _history_store_lock:
+        if _history_store is _UNSET:
+            _history_store = history_from_env()
+        return _history_store
@@ -0,0 +1,226 @@
+from botocore.exceptions import BotoCoreError, ClientError, ConnectionClosedError, EndpointConnectionError, ReadTimeoutError
+from contextlib import nullcontext
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Adaptive mode adds client-side rate limiting on throttling. botocore makes a single attempt because
+# resilient_stream retries the whole call, so the two retry budgets never multiply
+BOTOCORE_RETRY_CONFIG = {
+    "retries": {
+        "mode": os.getenv('AWS_RETRY_MODE', 'adaptive'),
+        "max_attempts": 1
+    }
+}
+
+# Attempts per agent turn, covering both the initial request and errors raised while streaming
+STREAM_MAX_ATTEMPTS = int(os.getenv('BEDROCK_AGENT_STREAM_MAX_ATTEMPTS', '3'))
+BACKOFF_BASE_SECONDS = float(os.getenv('BEDROCK_AGENT_BACKOFF_BASE_SECONDS', '0.5'))
+BACKOFF_MAX_SECONDS = float(os.getenv('BEDROCK_AGENT_BACKOFF_MAX_SECONDS', '8'))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('BEDROCK_AGENT_CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_SECONDS = float(os.getenv('BEDROCK_AGENT_CIRCUIT_RESET_SECONDS', '30'))
+
+# Compared case-insensitively: EventStream errors use lower camel case codes such as throttlingException
+RETRYABLE_ERROR_CODES = {
+    "throttlingexception",
+    "throttling",
+    "toomanyrequestsexception",
+    "servicequotaexceededexception",
+    "serviceunavailableexception",
+    "internalserverexception",
+    "modelnotreadyexception",
+}
+
+CONNECTION_ERRORS = (EndpointConnectionError, ConnectionClosedError, ReadTimeoutError)
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling Bedrock while the circuit breaker is open"""
+
+
+def error_code(error) -> str:
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code", "")
+    return type(error).__name__
+
+
+def is_retryable(error) -> bool:
+    """Throttling, quota, 5xx and connection errors are worth retrying; validation and auth errors are not"""
+    if isinstance(error, CONNECTION_ERRORS):
+        return True
+    if isinstance(error, ClientError):
+        if error_code(error).lower() in RETRYABLE_ERROR_CODES:
+            return True
+        return error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) >= 500
+    return False
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE_SECONDS, cap: float = BACKOFF_MAX_SECONDS) -> float:
+    """Exponential backoff with full jitter for the given retry attempt (1-based)"""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+class ResilienceMetrics:
+    """Counters for retries and circuit breaker activity, shared by every breaker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.retries_exhausted = 0
+        self.rejected_by_circuit = 0
+        self.circuit_opens = 0
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {
+                "retries": self.retries,
+                "retries_exhausted": self.retries_exhausted,
+                "rejected_by_circuit": self.rejected_by_circuit,
+                "circuit_opens": self.circuit_opens,
+            }
+        snapshot["circuits"] = {name: breaker.stats() for name, breaker in list(_breakers.items())}
+        return snapshot
+
+
+metrics = ResilienceMetrics()
+
+
+class CircuitBreaker:
+    """Fails fast after repeated retryable failures, then lets a single probe call through.
+
+    Only errors that indicate Bedrock is degraded (see is_retryable) count as
+    failures; a bad request does not open the circuit.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._last_opened_at = 0.0
+        self._probe_in_flight = False
+        self._open_seconds = 0.0
+
+    def before_call(self):
+        """Raise CircuitOpenError unless the call may go ahead"""
+        with self._lock:
+            if self._state == CIRCUIT_OPEN:
+                if time.monotonic() - self._last_opened_at < self.reset_timeout:
+                    metrics.increment("rejected_by_circuit")
+                    raise CircuitOpenError(f"Bedrock calls for {self.name} are paused after repeated failures")
+                self._state = CIRCUIT_HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == CIRCUIT_HALF_OPEN:
+                if self._probe_in_flight:
+                    metrics.increment("rejected_by_circuit")
+                    raise CircuitOpenError(f"Bedrock calls for {self.name} are being probed after repeated failures")
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CIRCUIT_CLOSED:
+                self._open_seconds += time.monotonic() - self._opened_at
+                logger.info(f"Circuit {self.name} closed")
+            self._state = CIRCUIT_CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == CIRCUIT_HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state == CIRCUIT_CLOSED:
+                    self._opened_at = time.monotonic()
+                    metrics.increment("circuit_opens")
+                    logger.warning(f"Circuit {self.name} opened after {self._failures} failures")
+                # A failed probe restarts the wait, open time keeps accumulating from the first open
+                self._state = CIRCUIT_OPEN
+                self._last_opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def record_abandoned(self):
+        """Release a half-open probe that ended without a result, e.g. a closed stream"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def stats(self):
+        with self._lock:
+            open_seconds = self._open_seconds
+            if self._state != CIRCUIT_CLOSED:
+                open_seconds += time.monotonic() - self._opened_at
+            return {"state": self._state, "failures": self._failures, "open_seconds": round(open_seconds, 1)}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def resilient_stream(open_stream, breaker: CircuitBreaker, is_committed, max_attempts: int = STREAM_MAX_ATTEMPTS,
+                     hold=nullcontext):
+    """Yield events from open_stream(), reopening it after retryable failures.
+
+    Covers both the initial request and EventStream errors that arrive after
+    the HTTP call succeeded. The stream is only reopened while no event for
+    which is_committed(event) is true has been yielded, so the caller never
+    sees duplicated or spliced answer text. hold() is entered around each
+    attempt, e.g. to hold an invocation slot, and is released while backing off.
+    """
+    attempt = 1
+    while True:
+        with hold():
+            breaker.before_call()
+            committed = False
+            try:
+                for event in open_stream():
+                    if not committed and is_committed(event):
+                        committed = True
+                    yield event
+            except (ClientError, BotoCoreError) as e:
+                if not is_retryable(e):
+                    breaker.record_abandoned()
+                    raise
+                breaker.record_failure()
+                if committed or attempt >= max_attempts:
+                    if attempt >= max_attempts:
+                        metrics.increment("retries_exhausted")
+                    raise
+                error = e
+            except (GeneratorExit, Exception):
+                breaker.record_abandoned()
+                raise
+            else:
+                breaker.record_success()
+                return
+        delay = backoff_delay(attempt)
+        logger.warning(f"Retrying agent call after {error_code(error)} (attempt {attempt}) in {delay:.2f}s")
+        metrics.increment("retries")
+        attempt += 1
+        time.sleep(delay)
@@ -0,0 +1,22 @@
+import codecs
+
+
+class ResponseAssembler:
+    """Decodes streamed agent output bytes into text one chunk at a time.
+
+    Chunks pass through an incremental decoder, so a multi-byte UTF-8
+    character split across two chunks is held back until it is complete
+    instead of raising or being mangled. No copy of the response is kept;
+    callers collect the returned text.
+    """
+
+    def __init__(self, encoding: str = "utf-8", errors: str = "replace"):
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+
+    def feed(self, data) -> str:
+        """Return the text that can be fully decoded after this chunk"""
+        return self._decoder.decode(data)
+
+    def finish(self) -> str:
+        """Flush any trailing partial character at the end of the stream"""
+        return self._decoder.decode(b"", final=True)
@@ -0,0 +1,213 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CACHE_SCOPE_GLOBAL = "global"
+CACHE_SCOPE_SESSION = "session"
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s.?!]+$")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case, whitespace and trailing punctuation do not change the answer"""
+    return _TRAILING_PUNCTUATION.sub("", _WHITESPACE.sub(" ", prompt.strip().lower()))
+
+
+class MemoryBackend:
+    """In-process LRU store with per-entry expiry"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """On-disk LRU store so cached answers survive restarts and can be shared by processes on one host"""
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS response_cache_lru ON response_cache (last_access)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE response_cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, default=str), now + ttl, now)
+            )
+            self._conn.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "SELECT key FROM response_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class ResponseCache:
+    """Caches agent answers keyed on the normalized prompt, agent, alias and session state.
+
+    With session scope the agent session ID and the previous answer are part of
+    the key, so answers are only reused within one conversation and a repeated
+    follow-up such as "yes" is not answered with what it meant earlier. With
+    global scope they are shared by every user of the process (or host, with the
+    SQLite backend), which is only safe for self-contained prompts.
+
+    Session scope rarely hits: it needs the same prompt right after the same
+    answer in the same Bedrock session. The savings from many users asking the
+    same question only come with global scope.
+    """
+
+    def __init__(self, backend, ttl_seconds: float = 3600, scope: str = CACHE_SCOPE_SESSION):
+        if scope not in (CACHE_SCOPE_GLOBAL, CACHE_SCOPE_SESSION):
+            raise ValueError(f"Unknown cache scope {scope!r}")
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.scope = scope
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    def _key(self, prompt, agent_id, agent_alias_id, session_id, session_state=None, previous_answer=None):
+        # Session attributes, e.g. a carried-forward conversation summary, change the answer too
+        parts = [normalize_prompt(prompt), agent_id, agent_alias_id,
+                 json.dumps(session_state, sort_keys=True, default=str) if session_state else None]
+        if self.scope == CACHE_SCOPE_SESSION:
+            # The same prompt at another point of the conversation can mean something else
+            parts += [session_id, previous_answer]
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def get(self, prompt, agent_id, agent_alias_id, session_id=None, session_state=None, previous_answer=None):
+        """Return the cached entry (output_text, citations, trace_summary, latency_ms) or None"""
+        entry = self.backend.get(
+            self._key(prompt, agent_id, agent_alias_id, session_id, session_state, previous_answer)
+        )
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.saved_ms += entry.get("latency_ms", 0.0)
+        return entry
+
+    def put(self, prompt, agent_id, agent_alias_id, session_id, output_text, citations, trace_summary,
+            latency_ms, session_state=None, previous_answer=None):
+        if not output_text:
+            return
+        self.backend.set(
+            self._key(prompt, agent_id, agent_alias_id, session_id, session_state, previous_answer),
+            {
+                "output_text": output_text,
+                "citations": citations,
+                "trace_summary": trace_summary,
+                "latency_ms": latency_ms
+            },
+            self.ttl_seconds
+        )
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "saved_seconds": self.saved_ms / 1000,
+                "entries": len(self.backend)
+            }
+
+
+def cache_from_env():
+    """Build the cache described by the BEDROCK_AGENT_CACHE_* settings, or None when it is off"""
+    backend_name = os.getenv('BEDROCK_AGENT_CACHE_BACKEND', 'off').lower()
+    max_entries = int(os.getenv('BEDROCK_AGENT_CACHE_MAX_ENTRIES', '1000'))
+    if backend_name == "off":
+        return None
+    if backend_name == "sqlite":
+        backend = SQLiteBackend(os.getenv('BEDROCK_AGENT_CACHE_PATH', 'response_cache.sqlite3'), max_entries)
+    else:
+        backend = MemoryBackend(max_entries)
+    return ResponseCache(
+        backend,
+        ttl_seconds=float(os.getenv('BEDROCK_AGENT_CACHE_TTL_SECONDS', '3600')),
+        scope=os.getenv('BEDROCK_AGENT_CACHE_SCOPE', CACHE_SCOPE_SESSION).lower()
+    )
+
+
+_UNSET = object()
+_response_cache = _UNSET
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide cache built from the environment on first use, None when caching is off"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is _UNSET:
+            _response_cache = cache_from_env()
+        return _response_cache
@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+import threading
+import time
+from services import client_pool, telemetry
+
+logger = logging.getLogger(__name__)
+
+SECRET_TTL_SECONDS = float(os.getenv('SECRETS_CACHE_TTL_SECONDS', '900'))
+# Entries are refreshed in the background once this fraction of the TTL has passed
+SECRET_REFRESH_AHEAD = float(os.getenv('SECRETS_CACHE_REFRESH_AHEAD', '0.8'))
+FAILED_REFRESH_RETRY_SECONDS = 30
+
+
+class _SecretEntry:
+    __slots__ = ("value", "fetched_at")
+
+    def __init__(self, value):
+        self.value = value
+        self.fetched_at = time.monotonic()
+
+
+class SecretCache:
+    """Process-wide cache of JSON secrets from Secrets Manager.
+
+    Secrets are fetched once and then refreshed by a background thread before
+    their TTL runs out, so Streamlit reruns never wait on Secrets Manager. When
+    a refresh fails the last good value keeps being served.
+    """
+
+    def __init__(self, ttl_seconds: float = SECRET_TTL_SECONDS, refresh_ahead: float = SECRET_REFRESH_AHEAD):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_ahead = refresh_ahead
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stop = threading.Event()
+
+    def _fetch(self, secret_id, region):
+        client = client_pool.get_client("secretsmanager", region_name=region)
+        with telemetry.span("secrets_manager"):
+            response = client.get_secret_value(SecretId=secret_id)
+        return json.loads(response['SecretString'])
+
+    def _refresh(self, key):
+        try:
+            value = self._fetch(*key)
+        except Exception as e:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    # Keep serving the stale value and only retry in the foreground after a short pause
+                    entry.fetched_at = time.monotonic() - self.ttl_seconds + min(FAILED_REFRESH_RETRY_SECONDS,
+                                                                                  self.ttl_seconds)
+            if entry is None:
+                raise
+            logger.warning(f"Failed to refresh secret {key[0]}, serving the last good value: {e}")
+            return entry.value
+        with self._lock:
+            self._entries[key] = _SecretEntry(value)
+        return value
+
+    def get_secret(self, secret_id, region):
+        """Return the parsed secret, fetching it only when it is missing or past its TTL"""
+        key = (secret_id, region)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.fetched_at < self.ttl_seconds:
+            return entry.value
+        value = self._refresh(key)
+        self._start_refresher()
+        return value
+
+    def invalidate(self, secret_id, region):
+        with self._lock:
+            self._entries.pop((secret_id, region), None)
+
+    def _start_refresher(self):
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, name="secret-cache-refresher", daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        interval = max(self.ttl_seconds * (1 - self.refresh_ahead) / 2, 1.0)
+        while not self._stop.wait(interval):
+            refresh_after = self.ttl_seconds * self.refresh_ahead
+            with self._lock:
+                due = [key for key, entry in self._entries.items()
+                       if time.monotonic() - entry.fetched_at >= refresh_after]
+            for key in due:
+                try:
+                    self._refresh(key)
+                except Exception as e:
+                    logger.warning(f"Background refresh of secret {key[0]} failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+
+secret_cache = SecretCache()
@@ -0,0 +1,231 @@
+"""JSON logging behind a queue, so log I/O never runs on the Streamlit script thread.
+
+Records are put on a bounded queue by a QueueHandler on the root logger and
+written by a QueueListener thread. When the queue is full, records are
+dropped and counted instead of blocking the caller. Every record carries the
+correlation fields bound with log_context(), such as the Bedrock session ID
+and request ID of the turn that logged it.
+
+When logging.yaml (or LOG_CONFIG) exists it is applied with dictConfig and
+its root handlers are moved behind the queue; otherwise the LOG_* settings
+below configure stderr and an optional size-rotated file.
+"""
+from contextlib import contextmanager
+import atexit
+import contextvars
+from datetime import datetime, timezone
+import json
+import logging
+import logging.config
+import logging.handlers
+import math
+import os
+import queue
+import random
+import threading
+import zlib
+from services import telemetry
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_CONFIG = os.getenv('LOG_CONFIG', 'logging.yaml')
+# json or text
+LOG_FORMAT = os.getenv('LOG_FORMAT')
+LOG_FILE = os.getenv('LOG_FILE')
+LOG_FILE_MAX_BYTES = int(os.getenv('LOG_FILE_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_FILE_BACKUP_COUNT = int(os.getenv('LOG_FILE_BACKUP_COUNT', '5'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Share of agent turns whose trace steps are logged at DEBUG; 0 turns trace logging off
+_trace_sample_rate_setting = os.getenv('LOG_TRACE_SAMPLE_RATE', '0')
+try:
+    LOG_TRACE_SAMPLE_RATE = float(_trace_sample_rate_setting)
+    if not math.isfinite(LOG_TRACE_SAMPLE_RATE):
+        raise ValueError(_trace_sample_rate_setting)
+except ValueError:
+    logging.getLogger(__name__).warning(
+        f"Invalid LOG_TRACE_SAMPLE_RATE {_trace_sample_rate_setting!r}; falling back to 0")
+    LOG_TRACE_SAMPLE_RATE = 0.0
+
+FORMAT_JSON = "json"
+FORMAT_TEXT = "text"
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s %(message)s"
+
+# Loggers for per-event diagnostics, logged only for a sample of turns
+SAMPLED_LOGGERS = ["services.bedrock_agent_runtime.trace"]
+
+_context = contextvars.ContextVar("log_context", default={})
+
+# Attributes every LogRecord has; anything else on a record came from extra= and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+@contextmanager
+def log_context(**fields):
+    """Add correlation fields to every record logged in this context, e.g. session_id"""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        try:
+            _context.reset(token)
+        except ValueError:
+            # A generator closed from another context; that context never saw the fields
+            pass
+
+
+def bind_log_context(**fields):
+    """Add fields to the current context until the enclosing log_context() exits"""
+    _context.set({**_context.get(), **fields})
+
+
+def current_log_context() -> dict:
+    return _context.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, correlation and extra fields"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of records, deciding once per request so a sampled turn is logged whole"""
+
+    def __init__(self, rate: float, key_fields=("request_id", "session_id")):
+        super().__init__()
+        self.rate = rate
+        self.key_fields = key_fields
+
+    def filter(self, record):
+        if self.rate >= 1:
+            return True
+        context = _context.get()
+        for field in self.key_fields:
+            key = getattr(record, field, None) or context.get(field)
+            if key is not None:
+                return zlib.crc32(str(key).encode()) % 10000 < self.rate * 10000
+        return random.random() < self.rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener without formatting them or blocking on a full queue"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only the cheap parts run on the caller's thread; formatting happens on the listener
+        record = logging.makeLogRecord(record.__dict__)
+        for key, value in _context.get().items():
+            record.__dict__.setdefault(key, value)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+
+def _formatter(log_format):
+    if log_format == FORMAT_TEXT:
+        return logging.Formatter(TEXT_FORMAT)
+    return JsonFormatter()
+
+
+def _handlers_from_env(log_format):
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUP_COUNT, encoding="utf-8"
+        ))
+    formatter = _formatter(log_format)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _handlers_from_file(path):
+    import yaml
+
+    with open(path) as config_file:
+        logging.config.dictConfig(yaml.safe_load(config_file))
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    for handler in handlers:
+        root.removeHandler(handler)
+    return handlers
+
+
+_listener = None
+_queue_handler = None
+_configure_lock = threading.Lock()
+
+
+def configure_logging(default_format: str = FORMAT_JSON):
+    """Set up the queue, handlers and trace sampling once per process.
+
+    Safe to call on every Streamlit rerun. default_format applies when
+    LOG_FORMAT is unset, e.g. text for command line tools.
+    """
+    global _listener, _queue_handler
+    with _configure_lock:
+        if _listener is not None:
+            return
+        if os.path.exists(LOG_CONFIG):
+            handlers = _handlers_from_file(LOG_CONFIG)
+        else:
+            handlers = _handlers_from_env(LOG_FORMAT or default_format)
+            logging.getLogger().setLevel(LOG_LEVEL)
+
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        _queue_handler = _QueueHandler(log_queue)
+        logging.getLogger().addHandler(_queue_handler)
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        # Flushes records still queued when the process exits
+        atexit.register(_listener.stop)
+
+        if LOG_TRACE_SAMPLE_RATE > 0:
+            for name in SAMPLED_LOGGERS:
+                sampled_logger = logging.getLogger(name)
+                sampled_logger.setLevel(logging.DEBUG)
+                sampled_logger.addFilter(SamplingFilter(LOG_TRACE_SAMPLE_RATE))
+
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def _logging_collector():
+    return [
+        ("app_log_records_dropped_total", "counter", "Log records dropped because the log queue was full",
+         [({}, dropped_records())]),
+    ]
+
+
+telemetry.telemetry.register_collector(_logging_collector)
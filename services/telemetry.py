@@ -0,0 +1,272 @@
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import bisect
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Port for the /metrics endpoint and path for the sidecar file; each exporter is off when unset
+METRICS_PORT = os.getenv('METRICS_PORT')
+METRICS_FILE = os.getenv('METRICS_FILE')
+METRICS_FILE_INTERVAL_SECONDS = float(os.getenv('METRICS_FILE_INTERVAL_SECONDS', '15'))
+# Observations per span kept for the sidebar latency breakdown
+RECENT_WINDOW = int(os.getenv('METRICS_RECENT_WINDOW', '100'))
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Spans of a chat turn, in pipeline order, for display
+SPANS = [
+    "secrets_manager",
+    "client_create",
+    "invoke_agent_call",
+    "first_chunk",
+    "stream_drain",
+    "answer_unwrap",
+    "citations",
+    "render",
+    "turn",
+]
+
+
+def _escape_label(value) -> str:
+    """Label value escaped per the Prometheus text format, e.g. for agent names with quotes"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count", "recent")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=RECENT_WINDOW)
+
+
+class Telemetry:
+    """Latency histograms per span plus collectors for the other service counters.
+
+    Recording an observation is a lock, a bisect and a few additions, so spans
+    can wrap every chat turn.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._collectors = []
+
+    def observe(self, span_name: str, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get(span_name)
+            if histogram is None:
+                histogram = self._histograms[span_name] = _Histogram()
+            histogram.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+            histogram.total += seconds
+            histogram.count += 1
+            histogram.recent.append(seconds)
+
+    @contextmanager
+    def span(self, span_name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(span_name, time.perf_counter() - start)
+
+    def register_collector(self, collector):
+        """collector() returns [(metric name, type, help, [(labels dict, value), ...]), ...]"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def latency_breakdown(self):
+        """{span: (mean ms, p95 ms, observations)} over the most recent observations of each span"""
+        with self._lock:
+            recent = {name: sorted(histogram.recent) for name, histogram in self._histograms.items()}
+        breakdown = {}
+        for name in sorted(recent, key=lambda name: SPANS.index(name) if name in SPANS else len(SPANS)):
+            values = recent[name]
+            if values:
+                p95 = values[min(len(values) - 1, int(0.95 * len(values)))]
+                breakdown[name] = (sum(values) / len(values) * 1000, p95 * 1000, len(values))
+        return breakdown
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = [
+            "# HELP bedrock_chat_span_seconds Time spent in each stage of a chat turn",
+            "# TYPE bedrock_chat_span_seconds histogram",
+        ]
+        with self._lock:
+            histograms = [
+                (name, list(histogram.counts), histogram.total, histogram.count)
+                for name, histogram in sorted(self._histograms.items())
+            ]
+            collectors = list(self._collectors)
+        for name, counts, total, count in histograms:
+            name = _escape_label(name)
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f'bedrock_chat_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'bedrock_chat_span_seconds_sum{{span="{name}"}} {total}')
+            lines.append(f'bedrock_chat_span_seconds_count{{span="{name}"}} {count}')
+
+        for collector in collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector {collector.__name__} failed: {e}")
+                continue
+            for metric_name, metric_type, help_text, samples in families:
+                lines.append(f"# HELP {metric_name} {help_text}")
+                lines.append(f"# TYPE {metric_name} {metric_type}")
+                for labels, value in samples:
+                    label_text = ",".join(f'{key}="{_escape_label(label)}"' for key, label in labels.items())
+                    lines.append(f"{metric_name}{{{label_text}}} {value}" if label_text else f"{metric_name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+telemetry = Telemetry()
+
+
+def observe(span_name: str, seconds: float):
+    telemetry.observe(span_name, seconds)
+
+
+def span(span_name: str):
+    return telemetry.span(span_name)
+
+
+def latency_breakdown():
+    return telemetry.latency_breakdown()
+
+
+class Stopwatch:
+    """Accumulates time over several `with` blocks, e.g. every re-render of a streamed answer"""
+
+    __slots__ = ("seconds", "_start")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds += time.perf_counter() - self._start
+
+    def observe(self, span_name: str):
+        telemetry.observe(span_name, self.seconds)
+
+
+def _pipeline_collector():
+    # Imported here so this module stays importable from the services it instruments
+    from services import resilience
+    from services.concurrency import agent_limiter
+    from services.response_cache import get_response_cache
+
+    resilience_stats = resilience.metrics.snapshot()
+    limiter_stats = agent_limiter.stats()
+    families = [
+        ("bedrock_agent_retries_total", "counter", "Agent streams reopened after a retryable error",
+         [({}, resilience_stats["retries"])]),
+        ("bedrock_agent_retries_exhausted_total", "counter", "Agent calls that failed after the last retry",
+         [({}, resilience_stats["retries_exhausted"])]),
+        ("bedrock_agent_circuit_rejections_total", "counter", "Agent calls rejected by an open circuit",
+         [({}, resilience_stats["rejected_by_circuit"])]),
+        ("bedrock_agent_circuit_opens_total", "counter", "Times a circuit breaker opened",
+         [({}, resilience_stats["circuit_opens"])]),
+        ("bedrock_agent_circuit_open", "gauge", "1 while the circuit for a region is not closed",
+         [({"circuit": name}, int(stats["state"] != resilience.CIRCUIT_CLOSED))
+          for name, stats in resilience_stats["circuits"].items()]),
+        ("bedrock_agent_in_flight", "gauge", "Agent invocations currently running",
+         [({}, limiter_stats["in_flight"])]),
+        ("bedrock_agent_queued", "gauge", "Agent invocations waiting for a slot",
+         [({}, limiter_stats["queued"])]),
+        ("bedrock_agent_busy_rejections_total", "counter", "Agent invocations rejected because the queue was full",
+         [({}, limiter_stats["rejected"])]),
+    ]
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        cache_stats = response_cache.stats()
+        families += [
+            ("bedrock_agent_cache_hits_total", "counter", "Prompts answered from the response cache",
+             [({}, cache_stats["hits"])]),
+            ("bedrock_agent_cache_misses_total", "counter", "Prompts sent to the agent after a cache miss",
+             [({}, cache_stats["misses"])]),
+            ("bedrock_agent_cache_saved_seconds_total", "counter", "Agent latency avoided by cache hits",
+             [({}, cache_stats["saved_seconds"])]),
+            ("bedrock_agent_cache_entries", "gauge", "Entries in the response cache",
+             [({}, cache_stats["entries"])]),
+        ]
+    return families
+
+
+telemetry.register_collector(_pipeline_collector)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = telemetry.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _write_metrics_file(path):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as metrics_file:
+        metrics_file.write(telemetry.render_prometheus())
+    # Atomic replace, so a scraper such as the node_exporter textfile collector never reads a partial file
+    os.replace(temp_path, path)
+
+
+def _file_export_loop(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            _write_metrics_file(path)
+        except OSError as e:
+            logger.warning(f"Failed to write metrics file {path}: {e}")
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def start_exporters():
+    """Start the /metrics endpoint and sidecar file writer configured by METRICS_PORT and METRICS_FILE.
+
+    Safe to call on every Streamlit rerun; exporters start once per process.
+    """
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+
+    if METRICS_PORT:
+        try:
+            server = ThreadingHTTPServer(("0.0.0.0", int(METRICS_PORT)), _MetricsHandler)
+        except OSError as e:
+            logger.warning(f"Metrics endpoint not started on port {METRICS_PORT}: {e}")
+        else:
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"Serving metrics on port {METRICS_PORT} at /metrics")
+    if METRICS_FILE:
+        threading.Thread(target=_file_export_loop, args=(METRICS_FILE, METRICS_FILE_INTERVAL_SECONDS),
+                         name="metrics-file", daemon=True).start()
@@ -0,0 +1,403 @@
+"""On-disk archive of full agent traces, for debugging slow turns after the fact.
+
+Each trace step is stored as a compressed msgpack blob (JSON when msgpack is
+not installed; zstd when zstandard is installed, zlib otherwise) in a SQLite
+file indexed by session ID, turn number and traceId. Turns are written by a
+background thread, so archiving never adds to a chat turn. The oldest turns
+are removed once the archive exceeds its size budget or a session exceeds
+its turn limit.
+
+Inspect an archive with:
+
+    python -m services.trace_archive slowest
+    python -m services.trace_archive turns SESSION_ID
+    python -m services.trace_archive show SESSION_ID TURN
+    python -m services.trace_archive find TRACE_ID
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from typing import Optional
+import zlib
+from services import telemetry
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+TRACE_ARCHIVE_MAX_BYTES = int(os.getenv('TRACE_ARCHIVE_MAX_BYTES', str(256 * 1024 * 1024)))
+TRACE_ARCHIVE_MAX_TURNS_PER_SESSION = int(os.getenv('TRACE_ARCHIVE_MAX_TURNS_PER_SESSION', '100'))
+TRACE_ARCHIVE_COMPRESSION_LEVEL = int(os.getenv('TRACE_ARCHIVE_COMPRESSION_LEVEL', '6'))
+# Turns waiting to be written; more are dropped rather than held in memory
+TRACE_ARCHIVE_QUEUE_SIZE = int(os.getenv('TRACE_ARCHIVE_QUEUE_SIZE', '256'))
+
+
+def _encoder(level):
+    """Return (codec name, encode) for the best serializer and compressor installed"""
+    if msgpack is not None:
+        serializer, serialize = "msgpack", lambda value: msgpack.packb(value, default=str)
+    else:
+        serializer, serialize = "json", lambda value: json.dumps(value, default=str, separators=(",", ":")).encode()
+    if zstandard is not None:
+        compressor = zstandard.ZstdCompressor(level=level)
+        return f"{serializer}+zstd", lambda value: compressor.compress(serialize(value))
+    return f"{serializer}+zlib", lambda value: zlib.compress(serialize(value), level)
+
+
+def decode(codec: str, payload: bytes):
+    serializer, compression = codec.split("+")
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This trace was archived with zstd: pip install zstandard")
+        data = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        data = zlib.decompress(payload)
+    if serializer == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("This trace was archived with msgpack: pip install msgpack")
+        return msgpack.unpackb(data)
+    return json.loads(data)
+
+
+def trace_id(step) -> Optional[str]:
+    """The traceId of a step, which sits either on the step or on its single trace part"""
+    if "traceId" in step:
+        return step["traceId"]
+    for value in step.values():
+        if isinstance(value, dict) and "traceId" in value:
+            return value["traceId"]
+    return None
+
+
+class TraceArchive:
+    """Write-behind archive of full traces in a SQLite file"""
+
+    def __init__(self, path: str, max_bytes: int = TRACE_ARCHIVE_MAX_BYTES,
+                 max_turns_per_session: int = TRACE_ARCHIVE_MAX_TURNS_PER_SESSION,
+                 compression_level: int = TRACE_ARCHIVE_COMPRESSION_LEVEL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_turns_per_session = max_turns_per_session
+        self.codec, self._encode = _encoder(compression_level)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # Must precede table creation; lets retention hand freed pages back to the file system
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trace_turns ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, turn INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, turn_ms REAL, trace_summary TEXT, steps INTEGER NOT NULL, "
+            "nbytes INTEGER NOT NULL, error TEXT)"
+        )
+        # Archives written before failed turns were archived have no error column
+        if "error" not in [column[1] for column in self._conn.execute("PRAGMA table_info(trace_turns)")]:
+            self._conn.execute("ALTER TABLE trace_turns ADD COLUMN error TEXT")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trace_steps ("
+            "turn_id INTEGER NOT NULL REFERENCES trace_turns (id) ON DELETE CASCADE, "
+            "position INTEGER NOT NULL, trace_type TEXT NOT NULL, trace_id TEXT, codec TEXT NOT NULL, "
+            "payload BLOB NOT NULL, PRIMARY KEY (turn_id, position))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS trace_turns_session ON trace_turns (session_id, turn)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS trace_turns_slowest ON trace_turns (turn_ms)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS trace_steps_trace_id ON trace_steps (trace_id)")
+        self.nbytes = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM trace_turns").fetchone()[0]
+        self.dropped = 0
+        self._queue = queue.Queue(TRACE_ARCHIVE_QUEUE_SIZE)
+        self._worker = None
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._write_loop, name="trace-archive", daemon=True)
+                self._worker.start()
+                atexit.register(self.flush)
+
+    def archive(self, session_id, turn, trace, trace_summary=None, turn_ms=None, error=None):
+        """Queue a turn's full trace ({trace type: [steps]}) for writing.
+
+        Successful turns without trace steps are skipped; failed turns are
+        always kept, with the error that ended them.
+        """
+        if not trace and error is None:
+            return
+        if isinstance(error, BaseException):
+            error = f"{type(error).__name__}: {error}"
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((session_id, turn, trace, trace_summary, turn_ms, time.time(), error))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._write(*item)
+            except Exception as e:
+                logger.error(f"Failed to archive trace for session {item[0]} turn {item[1]}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, session_id, turn, trace, trace_summary, turn_ms, created_at, error):
+        steps = [
+            (position, trace_type, trace_id(step), self._encode(step))
+            for position, (trace_type, step) in enumerate(
+                (trace_type, step) for trace_type, type_steps in trace.items() for step in type_steps
+            )
+        ]
+        nbytes = sum(len(payload) for *_, payload in steps)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                turn_id = self._conn.execute(
+                    "INSERT INTO trace_turns (session_id, turn, created_at, turn_ms, trace_summary, steps, nbytes, "
+                    "error) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (session_id, turn, created_at, turn_ms, json.dumps(trace_summary) if trace_summary else None,
+                     len(steps), nbytes, error)
+                ).lastrowid
+                self._conn.executemany(
+                    "INSERT INTO trace_steps (turn_id, position, trace_type, trace_id, codec, payload) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(turn_id, position, trace_type, step_trace_id, self.codec, payload)
+                     for position, trace_type, step_trace_id, payload in steps]
+                )
+                self.nbytes += nbytes
+                deleted = self._apply_retention(session_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            # Only retention frees pages, so there is nothing to vacuum after a plain insert
+            if deleted:
+                self._conn.execute("PRAGMA incremental_vacuum").fetchall()
+
+    def _delete_turns(self, rows) -> int:
+        if rows:
+            self._conn.executemany("DELETE FROM trace_turns WHERE id = ?", [(turn_id,) for turn_id, _ in rows])
+            self.nbytes -= sum(nbytes for _, nbytes in rows)
+        return len(rows)
+
+    def _apply_retention(self, session_id) -> int:
+        """Delete turns beyond the session's turn limit and the size budget, returning how many went"""
+        deleted = self._delete_turns(self._conn.execute(
+            "SELECT id, nbytes FROM trace_turns WHERE session_id = ? ORDER BY id DESC LIMIT -1 OFFSET ?",
+            (session_id, self.max_turns_per_session)
+        ).fetchall())
+        while self.nbytes > self.max_bytes:
+            oldest = self._conn.execute("SELECT id, nbytes FROM trace_turns ORDER BY id LIMIT 64").fetchall()
+            if not oldest:
+                break
+            over = self.nbytes - self.max_bytes
+            expired = []
+            for turn_id, nbytes in oldest:
+                expired.append((turn_id, nbytes))
+                over -= nbytes
+                if over <= 0:
+                    break
+            deleted += self._delete_turns(expired)
+        return deleted
+
+    def flush(self):
+        """Block until every queued turn has been written"""
+        if self._worker is not None:
+            self._queue.join()
+
+    def _turn_rows(self, where, parameters, order="ORDER BY turn", limit=-1):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id, turn, created_at, turn_ms, trace_summary, steps, nbytes, error FROM trace_turns "
+                f"{where} {order} LIMIT ?",
+                (*parameters, limit)
+            ).fetchall()
+        return [
+            {
+                "session_id": session_id,
+                "turn": turn,
+                "created_at": created_at,
+                "turn_ms": turn_ms,
+                "trace_summary": json.loads(trace_summary) if trace_summary else None,
+                "steps": steps,
+                "nbytes": nbytes,
+                "error": error
+            }
+            for session_id, turn, created_at, turn_ms, trace_summary, steps, nbytes, error in rows
+        ]
+
+    def turns(self, session_id):
+        """Archived turns of a session without their trace steps"""
+        self.flush()
+        return self._turn_rows("WHERE session_id = ?", (session_id,))
+
+    def slowest_turns(self, limit: int = 10):
+        self.flush()
+        return self._turn_rows("WHERE turn_ms IS NOT NULL", (), order="ORDER BY turn_ms DESC", limit=limit)
+
+    def load_turn(self, session_id, turn):
+        """The trace of the latest archived turn with this number, as {trace type: [steps]}"""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT trace_type, codec, payload FROM trace_steps WHERE turn_id = ("
+                "SELECT id FROM trace_turns WHERE session_id = ? AND turn = ? ORDER BY id DESC LIMIT 1"
+                ") ORDER BY position",
+                (session_id, turn)
+            ).fetchall()
+        trace = {}
+        for trace_type, codec, payload in rows:
+            trace.setdefault(trace_type, []).append(decode(codec, payload))
+        return trace
+
+    def find(self, step_trace_id):
+        """Every archived step with this traceId as (session_id, turn, trace type, step)"""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT t.session_id, t.turn, s.trace_type, s.codec, s.payload FROM trace_steps s "
+                "JOIN trace_turns t ON t.id = s.turn_id WHERE s.trace_id = ? ORDER BY s.turn_id, s.position",
+                (step_trace_id,)
+            ).fetchall()
+        return [
+            (session_id, turn, trace_type, decode(codec, payload))
+            for session_id, turn, trace_type, codec, payload in rows
+        ]
+
+    def stats(self):
+        with self._lock:
+            return {"bytes": self.nbytes, "dropped": self.dropped, "codec": self.codec}
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+
+def archive_from_env():
+    """Build the archive at TRACE_ARCHIVE_PATH, or None when it is unset"""
+    path = os.getenv('TRACE_ARCHIVE_PATH')
+    if not path:
+        return None
+    return TraceArchive(path)
+
+
+_UNSET = object()
+_trace_archive = _UNSET
+_trace_archive_lock = threading.Lock()
+
+
+def get_trace_archive():
+    """Process-wide trace archive built from the environment on first use, None when it is off"""
+    global _trace_archive
+    with _trace_archive_lock:
+        if _trace_archive is _UNSET:
+            _trace_archive = archive_from_env()
+        return _trace_archive
+
+
+class TurnArchiver:
+    """Collects one turn's trace steps as they stream in and queues them for the archive when the turn ends"""
+
+    __slots__ = ("trace_archive", "session_id", "turn", "trace")
+
+    def __init__(self, trace_archive: TraceArchive, session_id, turn):
+        self.trace_archive = trace_archive
+        self.session_id = session_id
+        self.turn = turn
+        self.trace = {}
+
+    def add(self, trace_type, step):
+        self.trace.setdefault(trace_type, []).append(step)
+
+    def finish(self, trace_summary=None, turn_ms=None, error=None):
+        """Queue the turn once; pass the exception that ended a failed turn as error"""
+        if self.trace is None:
+            return
+        self.trace_archive.archive(self.session_id, self.turn, self.trace, trace_summary, turn_ms, error)
+        self.trace = None
+
+
+def turn_archiver(session_id, turn):
+    """A trace sink for AgentResponse when TRACE_ARCHIVE_PATH is set, None otherwise"""
+    trace_archive = get_trace_archive()
+    if trace_archive is None:
+        return None
+    return TurnArchiver(trace_archive, session_id, turn)
+
+
+def archive_turn(session_id, turn, trace, trace_summary=None, turn_ms=None, error=None):
+    """Archive a turn's trace when TRACE_ARCHIVE_PATH is set; a no-op otherwise"""
+    trace_archive = get_trace_archive()
+    if trace_archive is not None:
+        trace_archive.archive(session_id, turn, trace, trace_summary, turn_ms, error)
+
+
+def _archive_collector():
+    trace_archive = get_trace_archive()
+    if trace_archive is None:
+        return []
+    stats = trace_archive.stats()
+    return [
+        ("bedrock_trace_archive_bytes", "gauge", "Compressed trace bytes in the archive", [({}, stats["bytes"])]),
+        ("bedrock_trace_archive_dropped_total", "counter", "Turns not archived because the write queue was full",
+         [({}, stats["dropped"])]),
+    ]
+
+
+telemetry.telemetry.register_collector(_archive_collector)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default=os.getenv('TRACE_ARCHIVE_PATH'), help="Archive file, TRACE_ARCHIVE_PATH by default")
+    commands = parser.add_subparsers(dest="command", required=True)
+    slowest = commands.add_parser("slowest", help="List the slowest archived turns")
+    slowest.add_argument("--limit", type=int, default=10)
+    turns = commands.add_parser("turns", help="List the archived turns of a session")
+    turns.add_argument("session_id")
+    show = commands.add_parser("show", help="Print the full trace of a turn as JSON")
+    show.add_argument("session_id")
+    show.add_argument("turn", type=int)
+    find = commands.add_parser("find", help="Print every step with a traceId as JSON")
+    find.add_argument("trace_id")
+    args = parser.parse_args(argv)
+
+    if not args.path or not os.path.exists(args.path):
+        parser.error("--path (or TRACE_ARCHIVE_PATH) must name an existing archive")
+    trace_archive = TraceArchive(args.path)
+    if args.command == "slowest":
+        result = trace_archive.slowest_turns(args.limit)
+    elif args.command == "turns":
+        result = trace_archive.turns(args.session_id)
+    elif args.command == "show":
+        result = trace_archive.load_turn(args.session_id, args.turn)
+    else:
+        result = [
+            {"session_id": session_id, "turn": turn, "trace_type": trace_type, "step": step}
+            for session_id, turn, trace_type, step in trace_archive.find(args.trace_id)
+        ]
+    json.dump(result, sys.stdout, indent=2, default=str)
+    sys.stdout.write("\n")
+    trace_archive.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
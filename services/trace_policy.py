@@ -0,0 +1,96 @@
+import logging
+import math
+import os
+import random
+
+logger = logging.getLogger(__name__)
+
+TRACE_OFF = "off"
+TRACE_SUMMARY = "summary"
+TRACE_FULL = "full"
+TRACE_MODES = (TRACE_OFF, TRACE_SUMMARY, TRACE_FULL)
+
+
+class TracePolicy:
+    """Per-call decision on whether agent traces are requested and how much is kept.
+
+    - off: enableTrace is not set, nothing is sent or parsed
+    - summary: traces are requested but only step counts and timings are kept
+    - full: every trace step is kept, as shown in the trace sidebar
+
+    sample_rate applies to summary and full mode; calls that are not sampled run
+    with tracing off.
+    """
+
+    def __init__(self, mode: str = TRACE_FULL, sample_rate: float = 1.0):
+        if mode not in TRACE_MODES:
+            raise ValueError(f"Unknown trace mode {mode!r}, expected one of {', '.join(TRACE_MODES)}")
+        self.mode = mode
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+
+    @classmethod
+    def from_env(cls, default_mode: str = TRACE_FULL):
+        """Build a policy from BEDROCK_AGENT_TRACE_MODE and BEDROCK_AGENT_TRACE_SAMPLE_RATE"""
+        mode = os.getenv('BEDROCK_AGENT_TRACE_MODE', default_mode).lower()
+        sample_rate_setting = os.getenv('BEDROCK_AGENT_TRACE_SAMPLE_RATE', '1.0')
+        try:
+            sample_rate = float(sample_rate_setting)
+            # float() accepts nan, which would never sample and silently turn tracing off
+            if not math.isfinite(sample_rate):
+                raise ValueError(sample_rate_setting)
+        except ValueError:
+            logger.warning(f"Invalid BEDROCK_AGENT_TRACE_SAMPLE_RATE {sample_rate_setting!r}; falling back to 1.0")
+            sample_rate = 1.0
+        try:
+            return cls(mode, sample_rate)
+        except ValueError as e:
+            logger.warning(f"{e}; falling back to {default_mode}")
+            return cls(default_mode, sample_rate)
+
+    @property
+    def keep_full_trace(self) -> bool:
+        return self.mode == TRACE_FULL
+
+    def should_trace(self) -> bool:
+        """Decide whether this call requests traces from the agent"""
+        if self.mode == TRACE_OFF:
+            return False
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+
+class TraceSummary:
+    """Step counts and arrival timings per trace type, kept instead of the raw trace"""
+
+    __slots__ = ("steps", "first_ms", "last_ms")
+
+    def __init__(self):
+        self.steps = {}
+        self.first_ms = {}
+        self.last_ms = {}
+
+    def add(self, trace_type: str, elapsed_ms: float):
+        self.steps[trace_type] = self.steps.get(trace_type, 0) + 1
+        self.first_ms.setdefault(trace_type, elapsed_ms)
+        self.last_ms[trace_type] = elapsed_ms
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        summary = cls()
+        for trace_type, values in data.items():
+            summary.steps[trace_type] = values["steps"]
+            summary.first_ms[trace_type] = values["first_ms"]
+            summary.last_ms[trace_type] = values["last_ms"]
+        return summary
+
+    def __bool__(self):
+        return bool(self.steps)
+
+    def to_dict(self):
+        return {
+            trace_type: {
+                "steps": count,
+                "first_ms": round(self.first_ms[trace_type], 1),
+                "last_ms": round(self.last_ms[trace_type], 1)
+            }
+            for trace_type, count in self.steps.items()
+        }
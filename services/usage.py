@@ -0,0 +1,165 @@
+"""Token usage and estimated spend per turn, session, user and agent alias.
+
+Usage comes from the metadata of the modelInvocationOutput trace parts, so
+it is only counted for turns that request traces (BEDROCK_AGENT_TRACE_MODE
+summary or full). Answers served from the response cache use no tokens.
+Spend is an estimate from the configured per-token prices.
+"""
+from collections import OrderedDict
+import logging
+import os
+import threading
+from services import telemetry
+
+logger = logging.getLogger(__name__)
+
+# USD per 1,000 tokens; the defaults are Claude 3.5 Sonnet on-demand prices
+INPUT_PRICE_PER_1K = float(os.getenv('BEDROCK_INPUT_TOKEN_PRICE_PER_1K', '0.003'))
+OUTPUT_PRICE_PER_1K = float(os.getenv('BEDROCK_OUTPUT_TOKEN_PRICE_PER_1K', '0.015'))
+# Turns whose prompts add up to more input tokens than this are logged as warnings
+WARN_INPUT_TOKENS = int(os.getenv('BEDROCK_USAGE_WARN_INPUT_TOKENS', '20000'))
+# Sessions and users with running totals; the least recently active are dropped first
+MAX_TRACKED = int(os.getenv('BEDROCK_USAGE_MAX_TRACKED', '10000'))
+
+
+def estimate_cost(input_tokens: int, output_tokens: int) -> float:
+    return input_tokens / 1000 * INPUT_PRICE_PER_1K + output_tokens / 1000 * OUTPUT_PRICE_PER_1K
+
+
+class TurnUsage:
+    """Token counts of one turn, added up from its trace steps as they stream in"""
+
+    __slots__ = ("input_tokens", "output_tokens", "model_calls")
+
+    def __init__(self):
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.model_calls = 0
+
+    def add_trace(self, trace: dict):
+        output = trace.get("modelInvocationOutput")
+        if not output:
+            return
+        usage = output.get("metadata", {}).get("usage")
+        if usage:
+            self.input_tokens += usage.get("inputTokens", 0)
+            self.output_tokens += usage.get("outputTokens", 0)
+            self.model_calls += 1
+
+    def __bool__(self):
+        return self.model_calls > 0
+
+    @property
+    def cost(self) -> float:
+        return estimate_cost(self.input_tokens, self.output_tokens)
+
+    def to_dict(self):
+        return {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "model_calls": self.model_calls,
+            "cost": round(self.cost, 6)
+        }
+
+
+class UsageTotals:
+    __slots__ = ("turns", "input_tokens", "output_tokens", "seconds")
+
+    def __init__(self):
+        self.turns = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.seconds = 0.0
+
+    def add(self, usage: TurnUsage, seconds: float):
+        self.turns += 1
+        self.input_tokens += usage.input_tokens
+        self.output_tokens += usage.output_tokens
+        self.seconds += seconds
+
+    @property
+    def cost(self) -> float:
+        return estimate_cost(self.input_tokens, self.output_tokens)
+
+    @property
+    def output_tokens_per_second(self) -> float:
+        return self.output_tokens / self.seconds if self.seconds else 0.0
+
+    def to_dict(self):
+        return {
+            "turns": self.turns,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "output_tokens_per_second": round(self.output_tokens_per_second, 1),
+            "cost": round(self.cost, 6)
+        }
+
+
+class UsageLedger:
+    """Running totals per session, user and agent alias, shared by every session in the process"""
+
+    def __init__(self, max_tracked: int = MAX_TRACKED):
+        self.max_tracked = max_tracked
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._users = OrderedDict()
+        self._aliases = {}
+
+    def _totals(self, table, key, bounded=True):
+        totals = table.get(key)
+        if totals is None:
+            totals = table[key] = UsageTotals()
+            if bounded and len(table) > self.max_tracked:
+                table.popitem(last=False)
+        elif bounded:
+            table.move_to_end(key)
+        return totals
+
+    def record(self, usage: TurnUsage, seconds: float, session_id=None, username=None, agent_alias_id=None):
+        """Add a turn's usage; turns without usage, e.g. untraced or cached ones, are ignored"""
+        if not usage:
+            return
+        if usage.input_tokens > WARN_INPUT_TOKENS:
+            logger.warning("Agent turn used many input tokens", extra={
+                **usage.to_dict(), "session_id": session_id, "agent_alias_id": agent_alias_id
+            })
+        with self._lock:
+            if session_id is not None:
+                self._totals(self._sessions, session_id).add(usage, seconds)
+            if username:
+                self._totals(self._users, username).add(usage, seconds)
+            self._totals(self._aliases, agent_alias_id or "", bounded=False).add(usage, seconds)
+
+    def _get(self, table, key):
+        with self._lock:
+            totals = table.get(key)
+            return totals.to_dict() if totals is not None else UsageTotals().to_dict()
+
+    def session(self, session_id):
+        return self._get(self._sessions, session_id)
+
+    def user(self, username):
+        return self._get(self._users, username)
+
+    def aliases(self):
+        with self._lock:
+            return {alias: totals.to_dict() for alias, totals in self._aliases.items()}
+
+
+usage_ledger = UsageLedger()
+
+
+def _usage_collector():
+    aliases = usage_ledger.aliases()
+    return [
+        ("bedrock_agent_turns_with_usage_total", "counter", "Agent turns with token usage recorded",
+         [({"alias": alias}, totals["turns"]) for alias, totals in aliases.items()]),
+        ("bedrock_agent_tokens_total", "counter", "Model tokens used by agent turns",
+         [({"alias": alias, "direction": direction}, totals[f"{direction}_tokens"])
+          for alias, totals in aliases.items() for direction in ("input", "output")]),
+        ("bedrock_agent_estimated_cost_usd_total", "counter", "Estimated model spend from configured token prices",
+         [({"alias": alias}, totals["cost"]) for alias, totals in aliases.items()]),
+    ]
+
+
+telemetry.telemetry.register_collector(_usage_collector)
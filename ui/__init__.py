@@ -0,0 +1 @@
+# UI components package
\ No newline at end of file
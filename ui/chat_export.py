@@ -0,0 +1,37 @@
+import streamlit as st
+
+from services.chat_export import EXPORT_FORMATS, build_export
+
+
+def render_export_controls(conversation, metadata, file_stem, key="chat_export"):
+    """Sidebar chat export that serializes the conversation only after the user asks for it.
+
+    The prepared export is kept in this session's state with the conversation
+    version it was built from, so later reruns reuse it until a new message
+    arrives and the user has to prepare it again. Only the latest export is
+    kept, and it goes away with the session.
+    """
+    export_format = st.selectbox(
+        "Format",
+        list(EXPORT_FORMATS),
+        format_func=lambda name: EXPORT_FORMATS[name].label,
+        key=f"{key}_format"
+    )
+    prepared_key = f"{key}_prepared"
+    wanted = (conversation.conversation_id, conversation.version, export_format)
+    prepared = st.session_state.get(prepared_key)
+    if prepared is None or prepared[0] != wanted:
+        # Drop a stale export before deciding whether to build a new one
+        st.session_state.pop(prepared_key, None)
+        if not st.button("📦 Prepare Chat History", key=f"{key}_prepare", use_container_width=True):
+            return
+        prepared = st.session_state[prepared_key] = (wanted, build_export(export_format, metadata, conversation))
+
+    details = EXPORT_FORMATS[export_format]
+    st.download_button(
+        label="📄 Download Chat History",
+        data=prepared[1],
+        file_name=f"{file_stem}.{details.extension}",
+        mime=details.mime,
+        use_container_width=True
+    )
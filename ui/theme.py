@@ -0,0 +1,68 @@
+from functools import lru_cache
+import hashlib
+import logging
+import os
+import re
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# "component" serves the stylesheet as a cacheable file; "inline" sends it in a <style> block on every rerun
+THEME_MODE = os.getenv('CHAT_THEME_MODE', 'component').lower()
+
+_UI_DIR = os.path.dirname(os.path.abspath(__file__))
+THEME_SOURCE = os.path.join(_UI_DIR, "theme.css")
+# Streamlit serves component files as text/css with Cache-Control: public, which its static
+# folder does not do for stylesheets, so the hashed file is written next to the component
+COMPONENT_DIR = os.path.join(_UI_DIR, "theme_component")
+
+_COMMENTS = re.compile(r"/\*.*?\*/", re.S)
+_WHITESPACE = re.compile(r"\s+")
+_SPACE_AROUND_PUNCTUATION = re.compile(r"\s*([{};,>])\s*")
+
+
+def minify_css(css: str) -> str:
+    css = _COMMENTS.sub("", css)
+    css = _WHITESPACE.sub(" ", css)
+    css = _SPACE_AROUND_PUNCTUATION.sub(r"\1", css)
+    # Only the space after a colon is dropped; one before it can be a descendant selector
+    css = css.replace(": ", ":").replace(";}", "}")
+    return css.strip()
+
+
+@lru_cache(maxsize=1)
+def compiled_theme():
+    """Return (minified css, content hash), computed once per process"""
+    with open(THEME_SOURCE, encoding="utf-8") as source:
+        css = minify_css(source.read())
+    return css, hashlib.sha256(css.encode()).hexdigest()[:12]
+
+
+@lru_cache(maxsize=1)
+def _theme_component():
+    css, digest = compiled_theme()
+    file_name = f"theme.{digest}.min.css"
+    path = os.path.join(COMPONENT_DIR, file_name)
+    if not os.path.exists(path):
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as stylesheet:
+                stylesheet.write(css)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Falling back to inline CSS, could not write the theme stylesheet: {e}")
+            return None
+
+    import streamlit.components.v1 as components
+    return components.declare_component("theme", path=COMPONENT_DIR), file_name
+
+
+def apply_theme():
+    """Apply the app stylesheet; replaces the per-app load_css()"""
+    theme_component = _theme_component() if THEME_MODE == "component" else None
+    if theme_component is not None:
+        component, file_name = theme_component
+        component(stylesheet=file_name, key="app_theme", default=None)
+        return
+    css, _ = compiled_theme()
+    st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
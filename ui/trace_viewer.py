@@ -0,0 +1,132 @@
+from functools import cached_property
+import json
+import os
+import streamlit as st
+
+# Strings longer than this are cut in the step view; the full step is available page by page
+TRACE_FIELD_MAX_CHARS = int(os.getenv('CHAT_TRACE_FIELD_MAX_CHARS', '2000'))
+TRACE_PAGE_CHARS = int(os.getenv('CHAT_TRACE_PAGE_CHARS', '20000'))
+
+TRACE_TYPES_MAP = {
+    "Pre-Processing": ["preGuardrailTrace", "preProcessingTrace"],
+    "Orchestration": ["orchestrationTrace"],
+    "Post-Processing": ["postProcessingTrace", "postGuardrailTrace"]
+}
+
+TRACE_INFO_TYPES_MAP = {
+    "preProcessingTrace": ["modelInvocationInput", "modelInvocationOutput"],
+    "orchestrationTrace": ["invocationInput", "modelInvocationInput", "modelInvocationOutput", "observation", "rationale"],
+    "postProcessingTrace": ["modelInvocationInput", "modelInvocationOutput", "observation"]
+}
+
+
+def _truncate(value, max_chars, cuts):
+    """Copy of value with long strings cut, appending the number of dropped characters to cuts"""
+    if isinstance(value, str):
+        if len(value) > max_chars:
+            cuts.append(len(value) - max_chars)
+            return f"{value[:max_chars]}… [{len(value) - max_chars} more characters]"
+        return value
+    if isinstance(value, dict):
+        return {key: _truncate(item, max_chars, cuts) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_truncate(item, max_chars, cuts) for item in value]
+    return value
+
+
+class TraceStep:
+    """One step of the trace as shown in the Bedrock console, serialized on first view"""
+
+    def __init__(self, number, traces):
+        self.number = number
+        self.traces = traces
+
+    @cached_property
+    def _summary(self):
+        cuts = []
+        summary = "\n".join(
+            json.dumps(_truncate(trace, TRACE_FIELD_MAX_CHARS, cuts), indent=2) for trace in self.traces
+        )
+        return summary, bool(cuts)
+
+    @property
+    def summary_json(self) -> str:
+        return self._summary[0]
+
+    @cached_property
+    def full_json(self) -> str:
+        return "\n".join(json.dumps(trace, indent=2) for trace in self.traces)
+
+    @property
+    def truncated(self) -> bool:
+        """Whether the summary cut a field, known without serializing the full step"""
+        return self._summary[1]
+
+    def page(self, index: int) -> str:
+        return self.full_json[index * TRACE_PAGE_CHARS:(index + 1) * TRACE_PAGE_CHARS]
+
+    @property
+    def pages(self) -> int:
+        return max(1, -(-len(self.full_json) // TRACE_PAGE_CHARS))
+
+
+class TraceIndex:
+    """Trace steps grouped by traceId under each console section, built in one pass over the trace"""
+
+    def __init__(self, trace):
+        self.sections = {header: [] for header in TRACE_TYPES_MAP}
+        step_number = 1
+        for header, trace_types in TRACE_TYPES_MAP.items():
+            for trace_type in trace_types:
+                steps = {}
+                info_types = TRACE_INFO_TYPES_MAP.get(trace_type)
+                for item in trace.get(trace_type, ()):
+                    if info_types is None:
+                        # Guardrail traces are a step each
+                        steps[item.get("traceId", len(steps))] = [{trace_type: item}]
+                        continue
+                    # Each trace type and step may have different information for the end-to-end flow
+                    info_type = next((info_type for info_type in info_types if info_type in item), None)
+                    if info_type is not None:
+                        steps.setdefault(item[info_type]["traceId"], []).append(item)
+                for traces in steps.values():
+                    self.sections[header].append(TraceStep(step_number, traces))
+                    step_number += 1
+
+
+def trace_index(trace, key="trace") -> TraceIndex:
+    """The index for this trace, rebuilt only when the session holds a different trace object"""
+    index_key = f"{key}_index"
+    cached = st.session_state.get(index_key)
+    if cached is None or cached[0] is not trace:
+        cached = st.session_state[index_key] = (trace, TraceIndex(trace))
+    return cached[1]
+
+
+def _render_step(step, key):
+    if not st.toggle("Show JSON", key=f"{key}_{step.number}_open"):
+        return
+    if step.truncated and st.toggle("Full payload", key=f"{key}_{step.number}_full"):
+        page = 0
+        if step.pages > 1:
+            page = st.number_input("Page", min_value=1, max_value=step.pages, key=f"{key}_{step.number}_page") - 1
+        st.code(step.page(page), language="json", line_numbers=True, wrap_lines=True)
+    else:
+        st.code(step.summary_json, language="json", line_numbers=True, wrap_lines=True)
+
+
+@st.fragment
+def render_trace_viewer(trace, key="trace"):
+    """Sidebar trace grouped by step like the Bedrock console.
+
+    A step's JSON is only serialized and sent when its "Show JSON" toggle is
+    on, and toggling reruns only this viewer, not the whole app.
+    """
+    index = trace_index(trace, key)
+    for header, steps in index.sections.items():
+        st.subheader(header)
+        if not steps:
+            st.text("None")
+        for step in steps:
+            with st.expander(f"Trace Step {step.number}", expanded=False):
+                _render_step(step, key)
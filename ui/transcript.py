@@ -0,0 +1,71 @@
+import os
+import streamlit as st
+
+# Number of most recent messages rendered; older ones are behind a "load earlier" button
+TRANSCRIPT_WINDOW = int(os.getenv('CHAT_TRANSCRIPT_WINDOW', '20'))
+
+
+def build_message_html(message, is_user=False, assistant_name="AI Cost Calculator"):
+    message_class = "user-message" if is_user else "assistant-message"
+    icon = "👤" if is_user else "🤖"
+    return f"""
+    <div class="{message_class}">
+        <strong>{icon} {'You' if is_user else assistant_name}</strong>
+        <div style="margin-top: 0.5rem;">
+            {message}
+        </div>
+    </div>
+    """
+
+
+def transcript_html(messages, start=0, assistant_name="AI Cost Calculator", cache=None):
+    """HTML for messages[start:]; cache maps a message's index to its HTML within one conversation"""
+    if cache is None:
+        cache = {}
+    parts = []
+    for index, message in enumerate(messages[start:], start):
+        html = cache.get(index)
+        if html is None:
+            html = cache[index] = build_message_html(message["content"], message["role"] == "user", assistant_name)
+        parts.append(html)
+    return "".join(parts)
+
+
+def _html_cache(messages, key, start):
+    """This session's rendered messages, kept only for the current conversation and visible window"""
+    cache_key = f"{key}_html"
+    # A new chat is a new Conversation, so its ID versions the cached indexes
+    version = getattr(messages, "conversation_id", id(messages))
+    cached = st.session_state.get(cache_key)
+    if cached is None or cached[0] != version:
+        cached = st.session_state[cache_key] = (version, {})
+    cache = cached[1]
+    for index in [index for index in cache if index < start]:
+        del cache[index]
+    return cache
+
+
+def render_transcript(messages, window=TRANSCRIPT_WINDOW, key="transcript", assistant_name="AI Cost Calculator"):
+    """Render the last `window` messages as a single element, with a pager for earlier ones.
+
+    Only the visible window is sent to the browser on each rerun, so the
+    payload stays flat as the conversation grows.
+    """
+    visible_key = f"{key}_visible"
+    visible = st.session_state.get(visible_key, window)
+    start = max(0, len(messages) - visible)
+
+    if start > 0:
+        if st.button(f"⬆️ Load earlier messages ({start} hidden)", key=f"{key}_load_earlier"):
+            st.session_state[visible_key] = visible + window
+            st.rerun()
+
+    if len(messages) > start:
+        st.markdown(transcript_html(messages, start, assistant_name, _html_cache(messages, key, start)),
+                    unsafe_allow_html=True)
+
+
+def reset_transcript(key="transcript"):
+    """Collapse the pager back to the default window, e.g. when a new chat starts"""
+    st.session_state.pop(f"{key}_visible", None)
+    st.session_state.pop(f"{key}_html", None)
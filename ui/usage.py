@@ -0,0 +1,18 @@
+import streamlit as st
+
+from services.usage import usage_ledger
+
+
+def render_usage_summary(session_id, username=None):
+    """Sidebar token usage and estimated spend for this conversation and, when known, the user"""
+    session_usage = usage_ledger.session(session_id)
+    if not session_usage["turns"]:
+        st.caption("Token usage: no traced turns yet")
+        return
+    st.caption(
+        f"Tokens this chat: {session_usage['input_tokens']:,} in / {session_usage['output_tokens']:,} out, "
+        f"{session_usage['output_tokens_per_second']:.0f} tokens/s, ~${session_usage['cost']:.4f}"
+    )
+    if username:
+        user_usage = usage_ledger.user(username)
+        st.caption(f"Your estimated spend: ~${user_usage['cost']:.4f} over {user_usage['turns']} turns")